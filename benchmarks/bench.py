@@ -0,0 +1,193 @@
+# Offline benchmark of the dashboards' hot paths against the local stand-in (benchmarks/standin.py).
+# For each app it times the catalog load, the data pull into a cold store, the rollup behind its
+# charts, the chart build and a CSV export, and writes the timings as JSON. With --compare it
+# exits non-zero when a step got slower than a previous run by more than --tolerance.
+#
+#     python benchmarks/bench.py --output before.json
+#     python benchmarks/bench.py --compare before.json
+import argparse
+import importlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import standin
+
+# Steps timed for every app, in order
+STEPS = ['catalog', 'pull', 'rollup', 'chart', 'export']
+# Slowdowns smaller than this many seconds are noise, whatever their ratio
+NOISE_SECONDS = 0.01
+
+
+def serve(args, now, urls):
+    # Child process running the stand-in, so generating data points doesn't compete with the
+    # benchmarked code for the GIL
+    server = standin.StandIn(('127.0.0.1', 0), standin.dataset_from(args, now), args.latency, args.jitter, args.page_size)
+    urls.put(server.url)
+    server.serve_forever()
+
+
+def load_package(host, page_size):
+    # Import qos_oracle pointed at the stand-in; its endpoints and page size are read at import
+    os.environ['QOS_ORACLE_GRAPH_HOST'] = host
+    os.environ['QOS_ORACLE_PAGE_SIZE'] = str(page_size)
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    return importlib.import_module('qos_oracle')
+
+
+def chart(qo, df, y, series):
+    # What the apps hand to plotly: the downsampled frame, and the figure when plotly is installed
+    points = qo.downsample(df, 'date', y, series)
+    if importlib.util.find_spec('plotly') is not None:
+        import plotly.express as px
+        return px.line(points, x='date', y=y, color=series)
+    return points
+
+
+def app_steps(qo, dataset, rows, directory):
+    # {app: {step: function}} mirroring what each app does on a page view
+    wallet = dataset.busiest_indexer()
+    deployment = dataset.busiest_deployment()
+    state = {}
+
+    def store():
+        # a new store per run, so every pull starts cold
+        state['runs'] = state.get('runs', 0) + 1
+        return qo.Store(str(Path(directory) / ('store-%d.sqlite' % state['runs'])))
+
+    def all_networks():
+        return qo.merge_catalogs(qo.fetch_ordered(qo.fetch_catalog, list(qo.NETWORK_URLS)))
+
+    def export(name):
+        return lambda: qo.write_export(state[name].frame, 'CSV', str(Path(directory) / (name + '.csv')))
+
+    def pull(name, fetch):
+        def run():
+            state[name] = fetch()
+            return len(state[name].frame)
+        return run
+
+    return {
+        'by_indexer': {
+            'catalog': lambda: qo.fetch_catalog('mainnet'),
+            'pull': pull('by_indexer', lambda: qo.fetch_datapoints(indexer=wallet, resolution='5 minutes', rows=rows,
+                                                                    store=store())),
+            # hourly rollup per subgraph, read from the store's rollup tables like the app does
+            'rollup': lambda: qo.fetch_buckets(state['by_indexer'], '1 hour', 'subgraph'),
+            'chart': lambda: chart(qo, state['by_indexer'].frame, 'avg_indexer_latency_ms', 'subgraph'),
+            'export': export('by_indexer'),
+        },
+        'by_subgraph': {
+            'catalog': lambda: qo.fetch_catalog('mainnet'),
+            'pull': pull('by_subgraph', lambda: qo.fetch_datapoints(deployment=deployment, resolution='5 minutes',
+                                                                     rows=rows, store=store())),
+            'rollup': lambda: qo.fetch_buckets(state['by_subgraph'], '1 hour', 'indexer_url'),
+            'chart': lambda: chart(qo, state['by_subgraph'].frame, 'avg_indexer_latency_ms', 'indexer_url'),
+            'export': export('by_subgraph'),
+        },
+        'mips': {
+            # mips keeps every network's catalog loaded and merges them for its all networks mode
+            'catalog': all_networks,
+            'pull': pull('mips', lambda: qo.fetch_daily_datapoints(deployment=deployment, rows=rows, store=store())),
+            # its points are already daily, so its chart rollup is the per gateway one
+            'rollup': lambda: qo.rollup(state['mips'].frame, 'D', ['gateway_id'], complete_only=False),
+            'chart': lambda: chart(qo, state['mips'].frame, 'avg_indexer_latency_ms', 'indexer_url'),
+            'export': export('mips'),
+        },
+    }
+
+
+def run(qo, dataset, rows, repeat, directory):
+    # Time every step of every app `repeat` times, clearing the in-memory caches before each run
+    results = {}
+    for app, steps in app_steps(qo, dataset, rows, directory).items():
+        runs = {step: [] for step in STEPS}
+        pulled = 0
+        for _ in range(repeat):
+            qo.flights.clear()
+            qo.rollups.clear()
+            for step in STEPS:
+                started = time.perf_counter()
+                result = steps[step]()
+                runs[step].append(time.perf_counter() - started)
+                if step == 'pull':
+                    pulled = result
+        results[app] = {
+            'rows': pulled,
+            'seconds': {step: statistics.median(times) for step, times in runs.items()},
+            'runs': runs,
+        }
+        print(app + ': ' + str(pulled) + ' rows, '
+              + ', '.join(f"{step} {results[app]['seconds'][step]:.3f}s" for step in STEPS))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # Steps that got slower than baseline by more than tolerance (a ratio), as printable lines
+    regressions = []
+    for app, result in results.items():
+        before = baseline.get('apps', {}).get(app, {}).get('seconds', {})
+        for step, seconds in result['seconds'].items():
+            if step not in before:
+                continue
+            if seconds > before[step] * tolerance and seconds - before[step] > NOISE_SECONDS:
+                regressions.append(f"{app} {step}: {before[step]:.3f}s -> {seconds:.3f}s "
+                                   f"({seconds / max(before[step], 1e-9):.2f}x)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python benchmarks/bench.py',
+                                     description='Time the dashboards\' hot paths against a local stand-in oracle.')
+    standin.add_dataset_arguments(parser)
+    parser.add_argument('--rows', type=int, default=50000, help='rows each app pulls')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per step, the median is reported')
+    parser.add_argument('--output', default='benchmark.json', help='where the JSON results are written')
+    parser.add_argument('--compare', help='results of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='slowdown ratio counted as a regression')
+    args = parser.parse_args(argv)
+
+    # fixed clock, so the same seed serves the same data points on every run
+    now = 1700000000
+    urls = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(args, now, urls), daemon=True)
+    server.start()
+    try:
+        qo = load_package(urls.get(timeout=60), args.page_size)
+        with tempfile.TemporaryDirectory() as directory:
+            results = run(qo, standin.dataset_from(args, now), args.rows, args.repeat, directory)
+    finally:
+        server.terminate()
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'plotly': importlib.util.find_spec('plotly') is not None,
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'tolerance')},
+        'apps': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Results written to ' + args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print('Regression: ' + line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,419 @@
+# Local stand-in for the subgraphs the dashboards read (QoS oracles and network subgraphs), serving
+# seeded synthetic data with the same query shape as indexerDataPoints, indexerHourlyDataPoints,
+# indexerDailyDataPoints, indexers and subgraphs. Every path answers every entity, so pointing
+# QOS_ORACLE_GRAPH_HOST at it covers all of the apps' endpoints.
+#
+#     python benchmarks/standin.py --port 8030 --latency 0.05
+#     QOS_ORACLE_GRAPH_HOST=http://127.0.0.1:8030 streamlit run by_indexer/indexers_oracle.py
+import argparse
+import bisect
+import json
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Bucket length in seconds of each data point entity and the fields holding its bucket start and end
+ENTITIES = {
+    'indexerDataPoints': (300, None, None),
+    'indexerHourlyDataPoints': (3600, 'hourStart', 'hourEnd'),
+    'indexerDailyDataPoints': (86400, 'dayStart', 'dayEnd'),
+}
+# Fields every data point entity has
+COMMON_FIELDS = ['id', 'end_epoch', 'start_epoch', 'gateway_id', 'chain_id', 'indexer_url', 'indexer_wallet',
+                 'subgraph_deployment_ipfs_hash', 'avg_indexer_blocks_behind', 'avg_indexer_latency_ms',
+                 'avg_query_fee', 'max_indexer_blocks_behind', 'max_indexer_latency_ms', 'max_query_fee',
+                 'num_indexer_200_responses', 'proportion_indexer_200_responses', 'query_count', 'total_query_fees']
+# Filters data point queries may use
+POINT_FILTERS = {'indexer', 'indexer_wallet', 'subgraph_deployment_ipfs_hash', 'id_gt',
+                 'end_epoch', 'end_epoch_gt', 'end_epoch_gte', 'end_epoch_lt', 'end_epoch_lte'}
+SUBGRAPH_FILTERS = {'active', 'id_gt', 'id_gte', 'id_lt'}
+CHAINS = ['mainnet', 'gnosis', 'arbitrum-one', 'celo', 'avalanche']
+GATEWAYS = ['mainnet-gateway-1', 'mainnet-gateway-2', 'arbitrum-gateway-1']
+# Responses kept in memory; the data never changes once generated, so repeated pages (from
+# benchmark repeats) cost the server nothing and the client's time is what gets measured
+RESPONSE_CACHE_SIZE = 512
+BASE58 = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+_NAME = re.compile(r'[_A-Za-z][_0-9A-Za-z]*')
+_decoder = json.JSONDecoder()
+
+
+class QueryError(Exception):
+    # Answered as a GraphQL `errors` list, like graph-node does for a bad query
+    pass
+
+
+def _skip(text, pos):
+    while pos < len(text) and (text[pos].isspace() or text[pos] == ','):
+        pos += 1
+    return pos
+
+
+def _value(text, pos):
+    # One argument value: an input object, an enum name or a JSON literal
+    pos = _skip(text, pos)
+    if text.startswith('{', pos):
+        return _object(text, pos + 1, '}')
+    match = _NAME.match(text, pos)
+    if match and match.group() not in ('true', 'false', 'null'):
+        return match.group(), match.end()
+    try:
+        return _decoder.raw_decode(text, pos)
+    except ValueError:
+        raise QueryError('cannot parse value at ' + text[pos:pos + 20])
+
+
+def _object(text, pos, close):
+    # `name: value` pairs up to the closing character, returning (dict, position after it)
+    result = {}
+    while True:
+        pos = _skip(text, pos)
+        if text.startswith(close, pos):
+            return result, pos + 1
+        match = _NAME.match(text, pos)
+        if match is None:
+            raise QueryError('expected a name at ' + text[pos:pos + 20])
+        pos = _skip(text, match.end())
+        if not text.startswith(':', pos):
+            raise QueryError('expected ":" after ' + match.group())
+        result[match.group()], pos = _value(text, pos + 1)
+
+
+def _selection(text, pos):
+    # Names selected directly inside the `{ ... }` starting at pos (nested selections are skipped)
+    names = []
+    depth = 0
+    while pos < len(text):
+        char = text[pos]
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return names
+        elif char == '(':
+            _, pos = _object(text, pos + 1, ')')
+            continue
+        elif depth == 1:
+            match = _NAME.match(text, pos)
+            if match:
+                names.append(match.group())
+                pos = match.end()
+                continue
+        pos += 1
+    raise QueryError('unbalanced braces')
+
+
+def parse_query(query):
+    # (root field, arguments, selected field names) of a single-root-field query
+    match = re.match(r'\s*(?:query\s*(?:\w+\s*)?)?\{\s*', query)
+    if match is None:
+        raise QueryError('expected a query')
+    root = _NAME.match(query, match.end())
+    if root is None:
+        raise QueryError('expected a root field')
+    pos = _skip(query, root.end())
+    args = {}
+    if query.startswith('(', pos):
+        args, pos = _object(query, pos + 1, ')')
+        pos = _skip(query, pos)
+    if not query.startswith('{', pos):
+        raise QueryError('expected a selection for ' + root.group())
+    return root.group(), args, _selection(query, pos)
+
+
+def _hex(rng, digits=40):
+    return '0x%0*x' % (digits, rng.getrandbits(digits * 4))
+
+
+class Pair:
+    # One indexer allocated to one deployment, with the seed and levels its data points are drawn from
+
+    def __init__(self, rng, wallet, url, deployment, chain):
+        self.key = wallet + '-' + deployment
+        self.wallet = wallet
+        self.url = url
+        self.deployment = deployment
+        self.chain = chain
+        self.gateway = rng.choice(GATEWAYS)
+        self.seed = rng.getrandbits(48)
+        self.queries = rng.uniform(2, 60)
+        self.latency = rng.uniform(30, 400)
+        self.lag = rng.uniform(0.1, 20)
+        self.fee = rng.uniform(0.00001, 0.0005)
+
+
+class Dataset:
+    # Seeded synthetic oracle and network subgraph data. Indexers allocate to deployments weighted
+    # towards the ones with the most signal, so a few deployments have many indexers like on the
+    # real network. Data points are generated on demand for every 5 minute epoch of `days` days
+    # up to `now`; nothing but the allocations is held in memory.
+
+    def __init__(self, seed=0, indexers=50, deployments=200, subgraphs=3000, allocations=20, days=60, now=None):
+        rng = random.Random(seed)
+        self.newest = int(now or time.time()) // 300 * 300
+        self.oldest = self.newest - int(days * 86400)
+        self.wallets = sorted(_hex(rng) for _ in range(indexers))
+        self.urls = {wallet: 'https://indexer-%d.example.com/' % i for i, wallet in enumerate(self.wallets)}
+        # subgraphs in signal order, the first `deployments` of them receive queries
+        self.subgraphs = []
+        signal = 10 ** 24
+        for i in range(subgraphs):
+            signal = int(signal * rng.uniform(0.99, 1.0))
+            deployment = 'Qm' + ''.join(rng.choice(BASE58) for _ in range(44))
+            self.subgraphs.append({
+                'id': _hex(rng) + '-0',
+                'displayName': None if i % 50 == 49 else 'Synthetic Subgraph %d' % i,
+                'signalledTokens': str(signal),
+                'creatorAddress': _hex(rng),
+                'versions': [{'subgraphDeployment': {'ipfsHash': deployment}}],
+            })
+        deployments = [subgraph['versions'][0]['subgraphDeployment']['ipfsHash'] for subgraph in self.subgraphs[:deployments]]
+        chains = {deployment: rng.choice(CHAINS) for deployment in deployments}
+        self.subgraphs.sort(key=lambda subgraph: subgraph['id'])
+        self.subgraph_ids = [subgraph['id'] for subgraph in self.subgraphs]
+        pairs = []
+        for wallet in self.wallets:
+            # weighted sample without replacement (Efraimidis-Spirakis), weight 1 / signal rank
+            keys = sorted(((rng.random() ** (d + 1), deployment) for d, deployment in enumerate(deployments)), reverse=True)
+            for _, deployment in keys[:allocations]:
+                pairs.append(Pair(rng, wallet, self.urls[wallet], deployment, chains[deployment]))
+        self.pairs = sorted(pairs, key=lambda pair: pair.key)
+        self._ends = {}
+
+    def busiest_indexer(self):
+        counts = {}
+        for pair in self.pairs:
+            counts[pair.wallet] = counts.get(pair.wallet, 0) + 1
+        return max(counts, key=counts.get)
+
+    def busiest_deployment(self):
+        counts = {}
+        for pair in self.pairs:
+            counts[pair.deployment] = counts.get(pair.deployment, 0) + 1
+        return max(counts, key=counts.get)
+
+    def ends(self, bucket):
+        # Ascending end_epoch of every bucket in the history; the newest bucket is still open and
+        # ends at `newest`
+        if bucket not in self._ends:
+            starts = range((self.oldest - 1) // bucket * bucket + bucket, (self.newest - 1) // bucket * bucket + 1, bucket)
+            self._ends[bucket] = [start + bucket if start + bucket < self.newest else self.newest for start in starts]
+        return self._ends[bucket]
+
+    def point(self, pair, entity, end):
+        # Every field of one data point, numbers as strings like graph-node's BigInt/BigDecimal
+        bucket, start_field, end_field = ENTITIES[entity]
+        start = (end - 1) // bucket * bucket
+        rng = random.Random(pair.seed * 1000003 + end)
+        scale = (end - start) / 300
+        queries = max(1, int(rng.expovariate(1 / pair.queries) * scale))
+        latency = pair.latency * rng.lognormvariate(0, 0.3) * (10 if rng.random() < 0.01 else 1)
+        behind = rng.expovariate(1 / pair.lag)
+        success = min(1.0, rng.uniform(0.85, 1.02))
+        fee = pair.fee * rng.uniform(0.8, 1.2)
+        point = {
+            'id': pair.key + '-' + str(end),
+            'end_epoch': str(end),
+            'start_epoch': str(start),
+            'gateway_id': pair.gateway,
+            'chain_id': pair.chain,
+            'indexer': {'id': pair.wallet},
+            'indexer_url': pair.url,
+            'indexer_wallet': pair.wallet,
+            'subgraph_deployment_ipfs_hash': pair.deployment,
+            'avg_indexer_blocks_behind': str(round(behind, 4)),
+            'avg_indexer_latency_ms': str(round(latency, 4)),
+            'avg_query_fee': str(round(fee, 10)),
+            'max_indexer_blocks_behind': str(round(behind * rng.uniform(1, 3), 4)),
+            'max_indexer_latency_ms': str(round(latency * rng.uniform(1, 4), 4)),
+            'max_query_fee': str(round(fee * rng.uniform(1, 1.5), 10)),
+            'num_indexer_200_responses': str(round(queries * success)),
+            'proportion_indexer_200_responses': str(round(success, 6)),
+            'query_count': str(queries),
+            'stdev_indexer_latency_ms': str(round(latency * rng.uniform(0.05, 0.5), 4)),
+            'total_query_fees': str(round(fee * queries, 10)),
+        }
+        if start_field:
+            point[start_field] = str(start)
+            point[end_field] = str(start + bucket)
+        return point
+
+    def points(self, entity, args):
+        # One page of data points, newest end_epoch first, or in id order within one end_epoch
+        where = args.get('where', {})
+        unknown = set(where) - POINT_FILTERS
+        if unknown:
+            raise QueryError('unsupported filter ' + ', '.join(sorted(unknown)))
+        order = (args.get('orderBy', 'id'), args.get('orderDirection', 'asc'))
+        if order != ('end_epoch', 'desc') and not (order == ('id', 'asc') and 'end_epoch' in where):
+            raise QueryError('unsupported order %s %s' % order)
+        wallet = where.get('indexer', where.get('indexer_wallet'))
+        deployment = where.get('subgraph_deployment_ipfs_hash')
+        pairs = [pair for pair in self.pairs
+                 if (wallet is None or pair.wallet == wallet) and (deployment is None or pair.deployment == deployment)]
+        ends = self.ends(ENTITIES[entity][0])
+        lower = max(int(where.get('end_epoch_gte', 0)), int(where.get('end_epoch_gt', -1)) + 1)
+        upper = min(int(where.get('end_epoch_lt', 2 ** 62)), int(where.get('end_epoch_lte', 2 ** 62 - 1)) + 1)
+        if 'end_epoch' in where:
+            lower, upper = max(lower, int(where['end_epoch'])), min(upper, int(where['end_epoch']) + 1)
+        after = where.get('id_gt')
+        page = []
+        position = bisect.bisect_left(ends, upper) - 1
+        while pairs and position >= 0 and ends[position] >= lower and len(page) < args['first']:
+            end = ends[position]
+            for pair in pairs:
+                if after is None or pair.key + '-' + str(end) > after:
+                    page.append(self.point(pair, entity, end))
+                    if len(page) == args['first']:
+                        break
+            position -= 1
+        return page
+
+    def subgraph_page(self, args):
+        # One page of subgraphs in id order
+        where = args.get('where', {})
+        unknown = set(where) - SUBGRAPH_FILTERS
+        if unknown:
+            raise QueryError('unsupported filter ' + ', '.join(sorted(unknown)))
+        position = 0
+        if 'id_gt' in where:
+            position = bisect.bisect_right(self.subgraph_ids, where['id_gt'])
+        elif 'id_gte' in where:
+            position = bisect.bisect_left(self.subgraph_ids, where['id_gte'])
+        end = bisect.bisect_left(self.subgraph_ids, where['id_lt']) if 'id_lt' in where else len(self.subgraphs)
+        return self.subgraphs[position:min(end, position + args['first'])]
+
+    def type_fields(self, name):
+        # Field names for __type introspection
+        if name == 'Query':
+            return list(ENTITIES) + ['indexers', 'subgraphs']
+        for entity, (_, start_field, end_field) in ENTITIES.items():
+            if name == entity[0].upper() + entity[1:-1]:
+                if start_field is None:
+                    return COMMON_FIELDS + ['indexer', 'stdev_indexer_latency_ms']
+                return COMMON_FIELDS + [start_field, end_field]
+        raise QueryError('unknown type ' + name)
+
+    def answer(self, query, page_size):
+        # The `data` dict for a query
+        root, args, fields = parse_query(query)
+        if root == '__type':
+            return {root: {'fields': [{'name': name} for name in self.type_fields(args['name'])]}}
+        first = args.get('first', 100)
+        if not isinstance(first, int) or not 0 <= first <= page_size:
+            raise QueryError('The `first` argument must be between 0 and %d, but is %s' % (page_size, first))
+        args['first'] = first
+        if root in ENTITIES:
+            return {root: [{field: point[field] for field in fields} for point in self.points(root, args)]}
+        if root == 'indexers':
+            return {root: [{'id': wallet} for wallet in self.wallets[:first]]}
+        if root == 'subgraphs':
+            return {root: self.subgraph_page(args)}
+        raise QueryError('unknown field ' + root)
+
+
+class StandIn(ThreadingHTTPServer):
+    # HTTP server answering GraphQL POSTs from a Dataset after `latency` (+ up to `jitter`) seconds
+    daemon_threads = True
+
+    def __init__(self, address, dataset, latency=0.0, jitter=0.0, page_size=1000, verbose=False):
+        super().__init__(address, _Handler)
+        self.dataset = dataset
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+        self.verbose = verbose
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._responses = OrderedDict()
+
+    def respond(self, query):
+        # Encoded response body for a query
+        with self._lock:
+            self.requests += 1
+            if query in self._responses:
+                self._responses.move_to_end(query)
+                return self._responses[query]
+        try:
+            data = json.dumps({'data': self.dataset.answer(query, self.page_size)}).encode()
+        except QueryError as error:
+            return json.dumps({'errors': [{'message': str(error)}]}).encode()
+        with self._lock:
+            self._responses[query] = data
+            while len(self._responses) > RESPONSE_CACHE_SIZE:
+                self._responses.popitem(last=False)
+        return data
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address[:2]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        data = server.respond(body.get('query', ''))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def start(dataset, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, page_size=1000, verbose=False):
+    # Serve dataset on a background thread and return the server (port 0 picks a free port)
+    server = StandIn((host, port), dataset, latency, jitter, page_size, verbose)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_dataset_arguments(parser):
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--indexers', type=int, default=50, help='number of indexers')
+    parser.add_argument('--deployments', type=int, default=200, help='number of deployments receiving queries')
+    parser.add_argument('--subgraphs', type=int, default=3000, help='number of subgraphs in the network subgraph')
+    parser.add_argument('--allocations', type=int, default=20, help='deployments each indexer serves')
+    parser.add_argument('--days', type=float, default=60, help='days of data points')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many more seconds, at random')
+    parser.add_argument('--page-size', type=int, default=1000, help='largest `first` accepted')
+
+
+def dataset_from(args, now=None):
+    return Dataset(args.seed, args.indexers, args.deployments, args.subgraphs, args.allocations, args.days, now)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python benchmarks/standin.py',
+                                     description='Serve synthetic QoS oracle and network subgraph data locally.')
+    add_dataset_arguments(parser)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8030)
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+    dataset = dataset_from(args)
+    server = StandIn((args.host, args.port), dataset, args.latency, args.jitter, args.page_size, args.verbose)
+    print(f"Serving on {server.url} (busiest indexer {dataset.busiest_indexer()}, "
+          f"busiest deployment {dataset.busiest_deployment()})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
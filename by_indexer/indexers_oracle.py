@@ -1,307 +1,132 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import requests
-import json
+import sys
+from pathlib import Path
+
+# Markdown title, drawn before anything slow so the page shows up straight away
+st.title('Gateway QoS Oracle by Indexer')
+
 from streamlit_autorefresh import st_autorefresh
-import plotly.express as px
+# make the shared qos_oracle package importable when run with `streamlit run`
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from qos_oracle import LEADERBOARD_WINDOWS, MIN_BUCKETS, RANKINGS, catalog_ready, choose_bucket, downsample, fetch_buckets, fetch_datapoints, fetch_indexers, fetch_latency_quantiles, fetch_leaderboard, get_catalog, load_catalog, pie_frame
+from qos_oracle.ui import debug_panel, debug_rerun, download_button, show_chart, show_table
+
+# opt-in debug timings of this rerun
+rerun = debug_rerun()
 
 # Automatically refresh app every 5 minutes - stops after 25 times
 count = st_autorefresh(interval=300000, limit=25, key="fizzbuzzcounter")
 
-@st.cache(allow_output_mutation=True)
-def get_subgraph_info(total_rows):
-    # Initialize an empty list to store the results
-    results = []
-    # Set the number of requests to make
-    num_requests = total_rows // 1000
-    # Make the GraphQL requests
-    for i in range(num_requests):
-        # Set the GraphQL query
-        query = '''
-        query {
-          subgraphs(
-            where: {active: true}
-            first: 1000
-            orderBy: signalledTokens
-            orderDirection: desc
-            skip: ''' + str(i*1000) + '''
-          ) {
-            displayName
-            signalledTokens
-            creatorAddress
-            versions(first: 1, orderBy: createdAt, orderDirection: desc) {
-              subgraphDeployment {
-                ipfsHash
-              }
-            }
-          }
-        }
-        '''
-        # Send the GraphQL request
-        r = requests.post("https://api.thegraph.com/subgraphs/name/graphprotocol/graph-network-mainnet", json={'query': query})
-        # Load result into json
-        json_data = json.loads(r.text)
-        # st.write(json_data)
-        # Convert json into a dataframe
-        df = pd.DataFrame(json_data['data']['subgraphs'])
-        # Add the dataframe to the list
-        results.append(df)
-    # Union the dataframes into a single dataframe
-    df = pd.concat(results)
-    # Return the results
-    return df
-# pull subgraphs info
-subgraphs_info = get_subgraph_info(1000).drop_duplicates(subset=['displayName', 'signalledTokens', 'creatorAddress'])
-
-# Iterate through the data and extract the ipfsHash values
-ipfs_hash_values = []
-for i in subgraphs_info.index:
-  ipfs_hash_values.append(subgraphs_info['versions'][i][0]['subgraphDeployment']['ipfsHash'])
-# Set the ipfsHash values as a new column in the data structure
-subgraphs_info['ipfsHash'] = ipfs_hash_values
-# Drop the versions column
-del subgraphs_info['versions']
-
-# Markdown title
-st.title('Gateway QoS Oracle by Indexer')
+# start loading subgraphs info in the background (from the snapshot on disk when there is one,
+# refreshed from the network subgraph when stale), the page is drawn around it
+load_catalog('mainnet')
 
-# Get list of indexers
-query = str('''{
-  indexers(first:1000){
-    id
-  }
-}''')
-# set endpoint url
-url = 'https://api.thegraph.com/subgraphs/name/juanmardefago/gateway-qos-oracle'
-r = requests.post(url, json={'query': query})
-# load result into json
-json_data = json.loads(r.text)
-# convert json into a dataframe
-indexers = pd.DataFrame(json_data['data']['indexers'])
-# show list of indexers
-# st.dataframe(indexers)
+# Get list of indexers (downloaded once an hour for the whole process)
+indexers = fetch_indexers()
 
 # find index of datanexus as default example for selection
-default_indexer = int(indexers["id"].str.find("0x87eba079059b75504c734820d6cf828476754b83")[lambda x : x != -1].index[0])
+default_indexer = indexers.position("0x87eba079059b75504c734820d6cf828476754b83")
 # choose indexer
 with st.sidebar:
-  indexer_sel = st.selectbox('Select Indexer',indexers['id'], index = default_indexer)
+  indexer_sel = st.selectbox('Select Indexer',indexers.wallets, index = default_indexer)
   nrows = st.slider('How many rows of data do you want to pull? One observation per subgraph every 5 minutes', 1000, 50000, 10000, 1000)
 
-# initialize text
-t = st.empty()
-
-@st.cache
-def pull_data(nrows):
-  # Initialize an empty list to store the dataframes
-  df_list = []
-  # Initialize the minimum end_epoch value to a very large number
-  min_epoch = 999999999999999999
-  # Get data for the indexer (30k rows)
-  for i in range(int(nrows/1000)):
-      # Display the updated text using the st.cache function
-      t.markdown(str("#### Now pulled " + str(i*1+1) + ",000 rows from subgraph"))
-      # Get data for the indexer
-      query = str('''{
-        indexerDataPoints(orderBy: end_epoch, orderDirection: desc, where:{indexer: "'''+indexer_sel+'''", end_epoch_lte: '''+str(min_epoch)+'''}, first: 1000){
-          end_epoch
-          indexer_url
-          indexer_wallet
-          subgraph_deployment_ipfs_hash
-          avg_indexer_blocks_behind
-          avg_indexer_latency_ms
-          avg_query_fee
-          max_indexer_blocks_behind
-          max_indexer_latency_ms
-          max_query_fee
-          num_indexer_200_responses
-          proportion_indexer_200_responses
-          query_count
-          start_epoch
-          stdev_indexer_latency_ms
-          total_query_fees
-          }
-      }''')
-      # Set endpoint url
-      url = 'https://api.thegraph.com/subgraphs/name/juanmardefago/gateway-qos-oracle'
-      r = requests.post(url, json={'query': query})
-      # Load result into json
-      json_data = json.loads(r.text)
-      # st.write(json_data)
-      # Convert json into a dataframe
-      df = pd.DataFrame(json_data['data']['indexerDataPoints'])
-      # Convert unix timestamp to date
-      df['date'] = pd.to_datetime(df['end_epoch'],unit='s')
-      # Update the minimum end_epoch value
-      min_epoch = min(min_epoch, df['end_epoch'].astype(int).min())
-      # Add the dataframe to the list
-      df_list.append(df)
-  return df_list
-# pull data
-df_list = pull_data(nrows)
-# Union the dataframes into a single dataframe
-df = pd.concat(df_list)
-
-# Join subgraphs_info into new data
-df = pd.merge(left=df, right=subgraphs_info, left_on='subgraph_deployment_ipfs_hash', right_on='ipfsHash', how='inner')
-# create column which takes subgraph name, but uses ipfs hash when it doesn't exist
-df['subgraph'] = df['displayName'].where(df['displayName'].notnull(), df['subgraph_deployment_ipfs_hash'])
-
-# show data (only if data is less than 15k rows)
-if df.shape[0] < 15000:
-  st.write("5 Minute Interval Data")
-  st.dataframe(df.style.hide_index())
-
-# Download data button
-@st.cache
-def convert_df(df):
-    # Caches the conversion to prevent computation on every rerun
-    return df.to_csv().encode('utf-8')
-# convert
-csv = convert_df(df)
-# show button
-st.download_button(
-    label="Download full data as CSV",
-    data=csv,
-    file_name='indexer_data.csv',
-    mime='text/csv',
-)
-
 # Column to visualize
 with st.sidebar:
   col_viz = st.selectbox('Which column do you want to visualize?', 
                           ('query_count','avg_indexer_blocks_behind','avg_indexer_latency_ms',
                           'avg_query_fee','max_indexer_blocks_behind','max_indexer_latency_ms',
                           'max_query_fee','num_indexer_200_responses','proportion_indexer_200_responses',
-                          #'query_count',#'stdev_indexer_latency_ms',
-                          'total_query_fees'))
+                          'stdev_indexer_latency_ms','total_query_fees'))
   # time interval
-  time_interval = st.selectbox('Choose a time interval for visualization', ('1 hour', '5 minutes'))
+  time_interval = st.selectbox('Choose a time interval for visualization', ('1 hour', '5 minutes', '1 day', '1 week', 'auto'))
   # chart type
   chart_type = st.selectbox('Choose chart type', ('line', 'bar', 'area', 'scatter', 'pie'))
 
-                          
-# Convert column to numeric
-df[col_viz] = pd.to_numeric(df[col_viz])
+# Leaderboard of every indexer across all deployments, ranked from the rollups the ingest daemon keeps
+# in the local store (only buckets written since the last rerun are read, so it renders right away)
+with st.expander('Indexer leaderboard (all deployments)'):
+  leaderboard_cols = st.columns(3)
+  leaderboard_window = leaderboard_cols[0].selectbox('Window', list(LEADERBOARD_WINDOWS), key='leaderboard_window')
+  leaderboard_by = leaderboard_cols[1].selectbox('Rank by', list(RANKINGS), index=1, key='leaderboard_by')
+  leaderboard_min = leaderboard_cols[2].number_input('Minimum queries', 0, None, 0, 1000, key='leaderboard_min_queries')
+  leaderboard = fetch_leaderboard(leaderboard_window, leaderboard_by, leaderboard_min)
+  if leaderboard.empty:
+    st.write('No rollups in the local store yet - run `python -m qos_oracle.ingest` to keep every indexer up to date')
+  else:
+    st.dataframe(leaderboard.set_index('rank'))
+
+# wait for the catalog here if it is still loading, behind a placeholder
+catalog_placeholder = st.empty()
+if not catalog_ready('mainnet'):
+  catalog_placeholder.info('Loading the subgraph list...')
+catalog = get_catalog('mainnet')
+catalog_placeholder.empty()
+
+# initialize text
+t = st.empty()
+# Display how much data is being pulled
+t.markdown(str("#### Loading " + str(nrows) + " rows, only pulling new or missing epochs from subgraph"))
+# Get data for the indexer from the local store, pulling newer (and any missing older) epochs from the
+# oracle, or pre-aggregated points when they answer the chosen interval (see qos_oracle.planner)
+points = fetch_datapoints(indexer=indexer_sel, resolution=time_interval, rows=nrows, required=[col_viz], catalog=catalog)
+df = points.frame
+
+# the pulled rows as a table, filtered, sorted and paged on the server (see qos_oracle.ui)
+st.write(points.plan.label + " Interval Data")
+show_table(df, points.key)
+
+# Download button, encoded only once asked for
+download_button(df, points.key, 'indexer_data', 'Download full data')
+
+# auto picks the finest interval that still fits the chart width
+if time_interval == 'auto':
+  time_interval = choose_bucket(df['end_epoch'].min(), df['end_epoch'].max())
 
 # 5 minute interval data
 if time_interval == '5 minutes' and chart_type != 'pie':
   st.write("5 minute interval data of `" + col_viz + "` for indexer `" + indexer_sel + "`" + " from " + str(df['date'].min()) + " to " + str(df['date'].max()))
-  # Visualize data (5 min interval)
-  fig = getattr(px, chart_type)(
-      df,
-      x="date",
-      y=col_viz,
-      # size="pop",
-      color="subgraph",
-      hover_name="subgraph"
-  )
-  # fig.update_layout(showlegend=False)
-  st.plotly_chart(fig, theme="streamlit", use_container_width=True)
-
-# 1 hour interval data
-if time_interval == '1 hour' and chart_type != 'pie':
-  st.write("Hourly data of `" + col_viz + "` for indexer `" + indexer_sel + "`" + " from " + str(df['date'].min()) + " to " + str(df['date'].max()))
-  
-  def truncate_date(date):
-    date = date.replace(minute=0, second=0)
-    return date
-  
-  # Convert to hourly data - truncate minutes
-  df['hour'] = df['date'].apply(truncate_date)
-  # exclude min and max hours (may be incomplete data)
-  min_hour = df['hour'].min()
-  max_hour = df['hour'].max()
-  data_viz = df[df['hour'] != min_hour]
-  data_viz = data_viz[data_viz['hour'] != max_hour]
-  # apply proper transformation based on variable of choice
-  if col_viz == 'query_count':
-    # visualize
-    fig = getattr(px, chart_type)(
-      data_viz.groupby([data_viz['hour'], 'subgraph']).query_count.sum().reset_index(name=col_viz),
-      x="hour",
-      y=col_viz,
-      # size="pop",
-      color="subgraph",
-      hover_name="subgraph")
-    # fig.update_layout(showlegend=False)
-    st.plotly_chart(fig, theme="streamlit", use_container_width=True)
-    # table
-    st.dataframe(data_viz.groupby([data_viz['hour'], 'indexer_url']).query_count.sum().reset_index(name=col_viz))
-  elif col_viz == 'total_query_fees':
-    # visualize
-    fig = getattr(px, chart_type)(
-      data_viz.groupby([data_viz['hour'], 'subgraph']).total_query_fees.sum().reset_index(name=col_viz),
-      x="hour",
-      y=col_viz,
-      # size="pop",
-      color="subgraph",
-      hover_name="subgraph")
-    # fig.update_layout(showlegend=False)
-    st.plotly_chart(fig, theme="streamlit", use_container_width=True)
-    # table
-    st.dataframe(data_viz.groupby([data_viz['hour'], 'subgraph']).total_query_fees.sum().reset_index(name=col_viz))
-  elif col_viz == 'num_indexer_200_responses':
-    # visualize
-    fig = getattr(px, chart_type)(
-      data_viz.groupby([data_viz['hour'], 'subgraph']).num_indexer_200_responses.sum().reset_index(name=col_viz),
-      x="hour",
-      y=col_viz,
-      # size="pop",
-      color="subgraph",
-      hover_name="subgraph")
-    # fig.update_layout(showlegend=False)
-    st.plotly_chart(fig, theme="streamlit", use_container_width=True)
-    # table
-    st.dataframe(data_viz.groupby([data_viz['hour'], 'subgraph']).num_indexer_200_responses.sum().reset_index(name=col_viz))
-  elif col_viz == 'max_indexer_blocks_behind':
-    # visualize
-    fig = getattr(px, chart_type)(
-      data_viz.groupby([data_viz['hour'], 'subgraph']).max_indexer_blocks_behind.max().reset_index(name=col_viz),
-      x="hour",
-      y=col_viz,
-      # size="pop",
-      color="subgraph",
-      hover_name="subgraph")
-    # fig.update_layout(showlegend=False)
-    st.plotly_chart(fig, theme="streamlit", use_container_width=True)
-    # table
-    st.dataframe(data_viz.groupby([data_viz['hour'], 'subgraph']).max_indexer_blocks_behind.max().reset_index(name=col_viz))
-  elif col_viz == 'max_indexer_latency':
-    # visualize
-    fig = getattr(px, chart_type)(
-      data_viz.groupby([data_viz['hour'], 'subgraph']).max_indexer_latency.max().reset_index(name=col_viz),
-      x="hour",
-      y=col_viz,
-      # size="pop",
-      color="subgraph",
-      hover_name="subgraph")
-    # fig.update_layout(showlegend=False)
-    st.plotly_chart(fig, theme="streamlit", use_container_width=True)
-    # table
-    st.dataframe(data_viz.groupby([data_viz['hour'], 'subgraph']).max_indexer_latency.max().reset_index(name=col_viz))
-  elif col_viz == 'max_query_fee':
-    # visualize
-    fig = getattr(px, chart_type)(
-      data_viz.groupby([data_viz['hour'], 'subgraph']).max_query_fee.max().reset_index(name=col_viz),
-      x="hour",
-      y=col_viz,
-      # size="pop",
-      color="subgraph",
-      hover_name="subgraph")
-    # fig.update_layout(showlegend=False)
-    st.plotly_chart(fig, theme="streamlit", use_container_width=True)
-    # table
-    st.dataframe(data_viz.groupby([data_viz['hour'], 'subgraph']).max_query_fee.max().reset_index(name=col_viz))
-  else:
-    st.write('still adding')
+  # Visualize data (5 min interval), thinned to the chart budget per subgraph keeping spikes
+  show_chart(chart_type,
+             downsample(df, 'date', col_viz, 'subgraph'),
+             x="date",
+             y=col_viz,
+             # size="pop",
+             color="subgraph",
+             hover_name="subgraph")
+
+# hourly, daily and weekly data
+if time_interval != '5 minutes' and chart_type != 'pie':
+  st.write(time_interval + " data of `" + col_viz + "` for indexer `" + indexer_sel + "`" + " from " + str(df['date'].min()) + " to " + str(df['date'].max()))
+  # every metric for this bucket size, from the rollup tables the store keeps up to date at ingest
+  # (or the pre-aggregated points), cached so switching metric or chart type doesn't read them again
+  data_viz = fetch_buckets(points, time_interval, 'subgraph')
+  # raw pulls stop at the rows asked for, so a store the ingest daemon doesn't keep may only hold a few buckets
+  if data_viz['date'].nunique() < MIN_BUCKETS:
+    st.info('Only ' + str(data_viz['date'].nunique()) + ' ' + time_interval + ' buckets in the rows pulled so far - pull more rows or run `python -m qos_oracle.ingest` for a longer history')
+  # visualize
+  show_chart(chart_type,
+             downsample(data_viz, 'date', col_viz, 'subgraph'),
+             x="date",
+             y=col_viz,
+             # size="pop",
+             color="subgraph",
+             hover_name="subgraph")
+  # table
+  st.dataframe(data_viz[['date', 'subgraph', col_viz]])
 
 if chart_type == 'pie':
   if col_viz == 'query_count' or col_viz == 'num_indexer_200_responses' or col_viz == 'total_query_fees':
-    fig = px.pie(df, values=col_viz, names='subgraph', title=col_viz + " by subgraph from " + str(df['date'].min()) + " to " + str(df['date'].max()))
-    # add labels inside (commented out for now)
-    #fig.update_traces(textposition='inside', textinfo='percent+label')
-    st.plotly_chart(fig, theme="streamlit", use_container_width=True)
+    # one slice per subgraph, summed here rather than by plotly
+    show_chart('pie', pie_frame(df, col_viz, 'subgraph'), values=col_viz, names='subgraph', title=col_viz + " by subgraph from " + str(df['date'].min()) + " to " + str(df['date'].max()))
   else:
     st.write('column not compatible with pie chart - please select a different column to visualize')
+
+
+# latency percentiles per subgraph, merged from the latency sketches kept per bucket (approximate,
+# within about 5%), rather than the average of averages the charts show
+st.write('### Latency percentiles per subgraph')
+st.dataframe(fetch_latency_quantiles(points, 'subgraph'))
+
+# where this rerun's time went, when the debug panel is on
+debug_panel(rerun)
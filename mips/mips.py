@@ -1,10 +1,17 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import requests
-import json
+import sys
+from pathlib import Path
+
+# add MIPs logo
+st.image("https://thegraph.com/images/mips/mips.png")
+
 from streamlit_autorefresh import st_autorefresh
-import plotly.express as px
+# import the shared qos_oracle package from the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from qos_oracle import ALL_NETWORKS, IndexerDirectory, catalog_ready, downsample, fetch_daily_datapoints, fetch_latency_quantiles, get_catalog, pie_frame, rollup, warm_catalogs
+from qos_oracle.ui import debug_panel, debug_rerun, download_button, show_chart, show_table
+
+rerun = debug_rerun()
 
 # get indexer query parameter from url if it exists
 query_params = st.experimental_get_query_params()
@@ -27,92 +34,30 @@ def add_bg_from_local(image_file):
 # could uncomment here to add background image
 #add_bg_from_local('space.png')    
 
-# add MIPs logo
-st.image("https://thegraph.com/images/mips/mips.png")
-
 # Automatically refresh app every 5 minutes - stops after 25 times
 count = st_autorefresh(interval=300000, limit=25, key="fizzbuzzcounter")
 
 st.write('### Choose Traffic Source Below:')
 
-gateway_sel = st.selectbox('deployment network', ["mainnet", "goerli testnet", "arbitrum"])
+gateway_sel = st.selectbox('deployment network', ["mainnet", "goerli testnet", "arbitrum", "all networks"])
 if gateway_sel == 'goerli testnet':
   gateway_sel = 'testnet'
+# every network's subgraphs merged into one list, QoS data compared across gateways below
+if gateway_sel == 'all networks':
+  gateway_sel = ALL_NETWORKS
 
 #chain_sel = st.selectbox('subgraph chain', ["mainnet", "gnosis", "arbitrum-one", "celo", "avalanche"])
 
-def get_subgraph_info(total_rows):
-    results = []
-    num_requests = total_rows // 1000
-    for i in range(num_requests):
-        query = '''
-        query {
-          subgraphs(
-            where: {active: true}
-            first: 1000
-            orderBy: signalledTokens
-            orderDirection: desc
-            skip: ''' + str(i*1000) + '''
-          ) {
-            displayName
-            signalledTokens
-            creatorAddress
-            versions(first: 1, orderBy: createdAt, orderDirection: desc) {
-              subgraphDeployment {
-                ipfsHash
-              }
-            }
-          }
-        }
-        '''
-        # Determine the correct URL based on gateway selection
-        url = "https://api.thegraph.com/subgraphs/name/graphprotocol/graph-network-mainnet"
-        if gateway_sel == "testnet":
-            url = "https://api.thegraph.com/subgraphs/name/graphprotocol/graph-network-goerli"
-        elif gateway_sel == "arbitrum":
-            url = "https://api.thegraph.com/subgraphs/name/graphprotocol/graph-network-arbitrum"
-        
-        response = requests.post(url, json={'query': query})
-        
-        if response.status_code == 200:
-            json_data = response.json()
-            if 'data' in json_data and 'subgraphs' in json_data['data']:
-                df = pd.DataFrame(json_data['data']['subgraphs'])
-                results.append(df)
-            else:
-                print(f"Unexpected JSON structure: {json_data}")
-        else:
-            print(f"Request failed with status code {response.status_code}: {response.text}")
-        
-    if results:
-        df = pd.concat(results)
-        return df
-    else:
-        return pd.DataFrame()  # Return an empty DataFrame if no data was added to results
-        
-    # Union the dataframes into a single dataframe
-    df = pd.concat(results)
-    # Return the results
-    return df
-# pull subgraphs info
-subgraphs_info = get_subgraph_info(1000).drop_duplicates(subset=['displayName', 'signalledTokens', 'creatorAddress'])
-
-# Iterate through the data and extract the ipfsHash values
-ipfs_hash_values = []
-for i in subgraphs_info.index:
-    try:
-        if len(subgraphs_info['versions'][i]) > 0:
-            ipfs_hash_values.append(subgraphs_info['versions'][i][0]['subgraphDeployment']['ipfsHash'])
-        else:
-            ipfs_hash_values.append(None) 
-    except IndexError:
-        ipfs_hash_values.append(None)  # Handling the IndexError
-
-# Set the ipfsHash values as a new column in the data structure
-subgraphs_info['ipfsHash'] = ipfs_hash_values
-# Drop the versions column
-del subgraphs_info['versions']
-
+# keep every network's catalog loaded (concurrently, in the background, from the snapshots on disk
+# when there are some) so switching is instant
+warm_catalogs()
+# pull subgraphs info from the process-wide catalog cache (refreshed in the background), waiting
+# behind a placeholder if it is still loading
+catalog_placeholder = st.empty()
+if not catalog_ready(gateway_sel):
+  catalog_placeholder.info('Loading the subgraph list...')
+catalog = get_catalog(gateway_sel)
+catalog_placeholder.empty()
 
 st.write('### Select Subgraph Below:')
 
@@ -121,23 +66,25 @@ st.write('### Select Subgraph Below:')
 # number of rows to pull user input
 #nrows = st.slider('How many rows of data do you want to pull? One observation per subgraph every 5 minutes', 1000, 50000, 3000, 1000)
 
-# create column which takes subgraph name, but uses ipfs hash when it doesn't exist
-subgraphs_info['subgraph'] = subgraphs_info['displayName'].where(subgraphs_info['displayName'].notnull(), subgraphs_info['ipfsHash'])
-
-# set default indexer from url
+# set default subgraph from url
 subgraph_default = query_params["deployment"][0] if "deployment" in query_params else 0
-subgraphs_list = subgraphs_info['displayName'].drop_duplicates().tolist()
+# search box narrowing the subgraph list
+subgraph_search = st.text_input("search subgraphs", "")
+subgraphs_list = catalog.names(subgraph_search)
 # if url selection exists then make it the default (by being first option of the list)
 if subgraph_default != 0:
-  # make first option the one from url
-  subgraph_default = subgraphs_info.loc[subgraphs_info['ipfsHash'] == subgraph_default]['subgraph'].values[0]
+  # make first option the one from url (a hash missing from the catalog is shown as is)
+  subgraph_default = catalog.name_for(subgraph_default) or subgraph_default
   subgraphs_list.insert(0,subgraph_default)
   subgraph_sel = st.selectbox('subgraph name', subgraphs_list)
-else:
+elif subgraphs_list:
   subgraph_sel = st.selectbox('subgraph name', subgraphs_list)
+else:
+  st.write('no subgraph matches "' + subgraph_search + '"')
+  st.stop()
 
 # figure out ipfs hash based on subgraph selected
-subgraph_filter = subgraphs_info.loc[subgraphs_info['subgraph'] == subgraph_sel]['ipfsHash'].values[0]
+subgraph_filter = catalog.hash_for(subgraph_sel) or subgraph_sel
 
 # optionally select ipfs hash manually
 ipfs_hash_option = st.text_input("optional: enter your own ipfs hash", "")
@@ -159,95 +106,24 @@ st.write('## Quality of Service Daily Data (All Indexers)')
   # number of rows to pull user input
   #nrows = st.slider('How many rows of data do you want to pull? One observation per subgraph every 5 minutes', 1000, 50000, 3000, 1000)
 
-# initialize text of how many rows have been pulled
-t = st.empty()
-#@st.cache(suppress_st_warning=True)
-def pull_data(nrows):
-  # Initialize an empty list to store the dataframes
-  df_list = []
-  # Initialize the minimum end_epoch value to a very large number
-  min_epoch = 999999999999999999
-  # Get data for the indexer (30k rows)
-  for i in range(int(nrows/1000)):
-      if i == 0:
-        skip = 0
-      else:
-        skip = i*1000
-      # Display the updated text using the st.cache function
-      #st.markdown(str("#### Now pulled " + str(i*1+1) + ",000 rows from subgraph"))
-      # Get data for the indexer
-      query = str('''{
-        indexerDailyDataPoints(orderBy: end_epoch, orderDirection: desc, where:{subgraph_deployment_ipfs_hash: "'''+subgraph_filter+'''"}, first: 1000, skip: '''+str(skip)+'''){
-          gateway_id
-          chain_id
-          dayStart
-          dayEnd
-          indexer_url
-          indexer_wallet
-          subgraph_deployment_ipfs_hash
-          avg_indexer_blocks_behind
-          avg_indexer_latency_ms
-          avg_query_fee
-          max_indexer_blocks_behind
-          max_indexer_latency_ms
-          max_query_fee
-          num_indexer_200_responses
-          proportion_indexer_200_responses
-          query_count
-          start_epoch
-          total_query_fees
-          }
-      }''')
-      # Set endpoint url
-      url = 'https://api.thegraph.com/subgraphs/name/graphprotocol/gateway-mips-qos-oracle'
-      r = requests.post(url, json={'query': query})
-      # Load result into json
-      json_data = json.loads(r.text)
-      #st.write(json_data)
-      # Convert json into a dataframe
-      df = pd.DataFrame(json_data['data']['indexerDailyDataPoints'])
-      # Convert unix timestamp to date
-      df['day_start'] = pd.to_datetime(df['dayStart'],unit='s')
-      # Update the minimum end_epoch value
-      min_epoch = min(min_epoch, df['dayStart'].astype(int).min())
-      # Add the dataframe to the list
-      df_list.append(df)
-  return df_list
-# pull data
+# rows already pulled are kept on disk, so reruns only fetch days newer than the stored ones
+# (or nothing at all while `python -m qos_oracle.ingest` keeps the store up to date)
 if subgraph_filter == "QmXWbpH76U6TM4teRNMZzog2ismx577CkH7dzn1Nw69FcV": #special case for Gnosis subgraph with a ton of indexers
-  df_list = pull_data(6000)
+  points = fetch_daily_datapoints(deployment=subgraph_filter, rows=6000, catalog=catalog)
 else:
-  df_list = pull_data(1000)
-# Union the dataframes into a single dataframe
-df = pd.concat(df_list)
-
-# Join subgraphs_info into new data
-df = pd.merge(left=df, right=subgraphs_info, left_on='subgraph_deployment_ipfs_hash', right_on='ipfsHash', how='inner')
-# create column which takes subgraph name, but uses ipfs hash when it doesn't exist
-df['subgraph'] = df['displayName'].where(df['displayName'].notnull(), df['subgraph_deployment_ipfs_hash'])
+  points = fetch_daily_datapoints(deployment=subgraph_filter, rows=1000, catalog=catalog)
+# typed frame with the subgraph name (from the catalog) and the day start as a date
+df = points.frame.rename(columns={'date': 'day_start'})
 
 # only keep select columns
-df = df[['subgraph', 'subgraph_deployment_ipfs_hash', 'day_start', 'indexer_wallet', 'indexer_url', 'query_count', 'num_indexer_200_responses', 'proportion_indexer_200_responses', 'avg_indexer_latency_ms', 'avg_indexer_blocks_behind', 'avg_query_fee', 'max_indexer_latency_ms', 'max_indexer_blocks_behind', 'max_query_fee', 'total_query_fees']]
+df = df[['subgraph', 'subgraph_deployment_ipfs_hash', 'day_start', 'gateway_id', 'chain_id', 'indexer_wallet', 'indexer_url', 'query_count', 'num_indexer_200_responses', 'proportion_indexer_200_responses', 'avg_indexer_latency_ms', 'avg_indexer_blocks_behind', 'avg_query_fee', 'max_indexer_latency_ms', 'max_indexer_blocks_behind', 'max_query_fee', 'total_query_fees']]
 
-# show data (only if data is less than 15k rows)
-if df.shape[0] < 15000:
-  #st.write("Daily Interval Data (All Indexers)")
-  st.dataframe(df.style.hide_index())
+# daily rows of every indexer, a page at a time
+#st.write("Daily Interval Data (All Indexers)")
+show_table(df, points.key)
 
 # Download data button
-#@st.cache
-def convert_df(df):
-    # Caches the conversion to prevent computation on every rerun
-    return df.to_csv().encode('utf-8')
-# convert
-csv = convert_df(df)
-# show button
-st.download_button(
-    label="Download data as CSV",
-    data=csv,
-    file_name='subgraph_indexer_data.csv',
-    mime='text/csv',
-)
+download_button(df, points.key, 'subgraph_indexer_data')
 
 st.write('### Visualization - All Indexers')
 
@@ -269,105 +145,70 @@ else:
 #time_interval = st.selectbox('Choose a time interval', ('1 hour', '5 minutes'))
 # chart type
 chart_type = st.selectbox('Choose chart type', ('bar', 'line', 'area', 'scatter', 'pie'))
+# across networks the data can also be compared per gateway or per chain
+group_col = 'indexer_url'
+if gateway_sel == ALL_NETWORKS:
+  group_col = st.selectbox('Compare by', ('indexer_url', 'gateway_id', 'chain_id'))
+# one row per day and gateway (or chain), weighted by query count like the other rollups
+df_viz = df if group_col == 'indexer_url' else rollup(df, 'D', [group_col], time_col='day_start', complete_only=False)
 
 st.write("Daily data of `" + col_viz + "` for subgraph Connext Network - Gnosis" + " from " + str(df['day_start'].min()) + " to " + str(df['day_start'].max()))
-                          
-# Convert column to numeric
-df[col_viz] = pd.to_numeric(df[col_viz])
 
 # visualizations:
 if chart_type != 'pie':
-  fig = getattr(px, chart_type)(
-    df,
-    x="day_start",
-    y=col_viz,
-    # size="pop",
-    color="indexer_url",
-    hover_name="indexer_url")
-  # fig.update_layout(showlegend=False)
-  st.plotly_chart(fig, theme="streamlit", use_container_width=True)
+  # at most the chart budget of points per indexer, keeping spikes
+  show_chart(chart_type,
+             downsample(df_viz, 'day_start', col_viz, group_col),
+             x="day_start",
+             y=col_viz,
+             # size="pop",
+             color=group_col,
+             hover_name=group_col)
   # table
   #st.dataframe(data_viz.groupby([data_viz['hour'], 'indexer_url']).max_query_fee.max().reset_index(name=col_viz))
 
 if chart_type == 'pie':
   if col_viz == 'query_count' or col_viz == 'num_indexer_200_responses' or col_viz == 'total_query_fees':
-    fig = px.pie(df, values=col_viz, names='indexer_url', title=col_viz + " by indexer url from " + str(df['day_start'].min()) + " to " + str(df['day_start'].max()))
-    # add labels inside (commented out for now)
-    #fig.update_traces(textposition='inside', textinfo='percent+label')
-    st.plotly_chart(fig, theme="streamlit", use_container_width=True)
+    # one slice per indexer
+    show_chart('pie', pie_frame(df, col_viz, group_col), values=col_viz, names=group_col, title=col_viz + " by " + group_col.replace('_', ' ') + " from " + str(df['day_start'].min()) + " to " + str(df['day_start'].max()))
   else:
     st.write('column not compatible with pie chart - please select a different column to visualize')
 
 
+# latency percentiles per indexer over the daily points
+st.write('### Latency percentiles per indexer')
+st.dataframe(fetch_latency_quantiles(points, 'indexer_url'))
+
 st.write('## Specific Indexer')
 
 # set default indexer from url
 indexer_default = query_params["indexer"][0] if "indexer" in query_params else 0
-indexers_list = df['indexer_wallet'].drop_duplicates().tolist()
+# wallet -> url lookup for the indexers on this subgraph
+indexer_directory = IndexerDirectory.from_frame(df)
+indexers_list = list(indexer_directory.wallets)
 # if url selection exists then make it the default (by being first option of the list)
 if indexer_default != 0:
   # make first option the one from url
   indexers_list.insert(0,indexer_default)
-  indexer_filter = st.selectbox('Which indexer do you want to visualize? This list is specific to the indexers on the selected subgraph', indexers_list)
+  indexer_filter = st.selectbox('Which indexer do you want to visualize? This list is specific to the indexers on the selected subgraph', indexers_list, format_func=indexer_directory.label)
 else:
-  indexer_filter = st.selectbox('Which indexer do you want to visualize? This list is specific to the indexers on the selected subgraph', indexers_list)
+  indexer_filter = st.selectbox('Which indexer do you want to visualize? This list is specific to the indexers on the selected subgraph', indexers_list, format_func=indexer_directory.label)
 
 st.write(subgraph_filter)
-# Get data for the indexer
-query = str('''{
-  indexerDailyDataPoints(orderBy: end_epoch, orderDirection: desc, where:{subgraph_deployment_ipfs_hash: "'''+subgraph_filter+'''", indexer_wallet: "'''+indexer_filter+'''"}, first: 1000){
-    dayStart
-    dayEnd
-    indexer_url
-    indexer_wallet
-    subgraph_deployment_ipfs_hash
-    avg_indexer_blocks_behind
-    avg_indexer_latency_ms
-    avg_query_fee
-    max_indexer_blocks_behind
-    max_indexer_latency_ms
-    max_query_fee
-    num_indexer_200_responses
-    proportion_indexer_200_responses
-    query_count
-    start_epoch
-    total_query_fees
-    }
-}''')
-# Set endpoint url
-url = 'https://api.thegraph.com/subgraphs/name/graphprotocol/gateway-mips-qos-oracle'
-r = requests.post(url, json={'query': query})
-# Load result into json
-json_data = json.loads(r.text)
-#st.write(json_data)
-# Convert json into a dataframe
-indexer_df = pd.DataFrame(json_data['data']['indexerDailyDataPoints'])
-# Convert unix timestamp to date
-indexer_df['day_start'] = pd.to_datetime(indexer_df['dayStart'],unit='s')
-
-
-# Join subgraphs_info into new data
-indexer_df = pd.merge(left=indexer_df, right=subgraphs_info, left_on='subgraph_deployment_ipfs_hash', right_on='ipfsHash', how='inner')
-# create column which takes subgraph name, but uses ipfs hash when it doesn't exist
-indexer_df['subgraph'] = indexer_df['displayName'].where(indexer_df['displayName'].notnull(), indexer_df['subgraph_deployment_ipfs_hash'])
+# Get data for the indexer (newest 1000 rows)
+indexer_points = fetch_daily_datapoints(deployment=subgraph_filter, indexer=indexer_filter, rows=1000, catalog=catalog)
+indexer_df = indexer_points.frame.rename(columns={'date': 'day_start'})
 
 # only keep select columns
-indexer_df = indexer_df[['subgraph', 'subgraph_deployment_ipfs_hash', 'day_start', 'indexer_wallet', 'indexer_url', 'query_count', 'num_indexer_200_responses', 'proportion_indexer_200_responses', 'avg_indexer_latency_ms', 'avg_indexer_blocks_behind', 'avg_query_fee', 'max_indexer_latency_ms', 'max_indexer_blocks_behind', 'max_query_fee', 'total_query_fees']]
+indexer_df = indexer_df[['subgraph', 'subgraph_deployment_ipfs_hash', 'day_start', 'gateway_id', 'chain_id', 'indexer_wallet', 'indexer_url', 'query_count', 'num_indexer_200_responses', 'proportion_indexer_200_responses', 'avg_indexer_latency_ms', 'avg_indexer_blocks_behind', 'avg_query_fee', 'max_indexer_latency_ms', 'max_indexer_blocks_behind', 'max_query_fee', 'total_query_fees']]
 
 # show data:
 #st.write("Daily Interval Data for Indexer: " + indexer_filter)
-st.dataframe(indexer_df.style.hide_index())
+# paged like the table above
+show_table(indexer_df, indexer_points.key, 'table_indexer')
 
-# Download data button
-# convert
-csvtwo = convert_df(indexer_df)
-# show button
-st.download_button(
-    label="Download indexer data as CSV",
-    data=csvtwo,
-    file_name='subgraph_indexer_data_'+indexer_filter+'.csv',
-    mime='text/csv',
-)
+# Download indexer data button
+download_button(indexer_df, indexer_points.key, 'subgraph_indexer_data_' + indexer_filter, 'Download indexer data', 'export_indexer')
 
 
 st.write('### Visualization - Specific Indexer')
@@ -385,29 +226,24 @@ col_viz_two = st.selectbox('Which column do you want to visualize?',
 chart_type_two = st.selectbox('Choose chart type', ('line', 'bar', 'area', 'scatter', 'pie'))
 
 st.write("Daily data of `" + col_viz_two + "` for subgraph Connext Network - Gnosis" + " from " + str(indexer_df['day_start'].min()) + " to " + str(indexer_df['day_start'].max()))
-                          
-# Convert column to numeric
-indexer_df[col_viz_two] = pd.to_numeric(indexer_df[col_viz_two])
 
 # visualizations:
 if chart_type_two != 'pie':
-  fig = getattr(px, chart_type_two)(
-    indexer_df,
-    x="day_start",
-    y=col_viz_two,
-    # size="pop",
-    color="indexer_url",
-    hover_name="indexer_url")
-  # fig.update_layout(showlegend=False)
-  st.plotly_chart(fig, theme="streamlit", use_container_width=True)
+  show_chart(chart_type_two,
+             downsample(indexer_df, 'day_start', col_viz_two, 'indexer_url'),
+             x="day_start",
+             y=col_viz_two,
+             # size="pop",
+             color="indexer_url",
+             hover_name="indexer_url")
   # table
   #st.dataframe(data_viz.groupby([data_viz['hour'], 'indexer_url']).max_query_fee.max().reset_index(name=col_viz))
 
 if chart_type_two == 'pie':
   if col_viz_two == 'query_count' or col_viz_two == 'num_indexer_200_responses' or col_viz_two == 'total_query_fees':
-    fig = px.pie(indexer_df, values=col_viz_two, names='indexer_url', title=col_viz_two + " by indexer url from " + str(indexer_df['day_start'].min()) + " to " + str(indexer_df['day_start'].max()))
-    # add labels inside (commented out for now)
-    #fig.update_traces(textposition='inside', textinfo='percent+label')
-    st.plotly_chart(fig, theme="streamlit", use_container_width=True)
+    show_chart('pie', pie_frame(indexer_df, col_viz_two, 'indexer_url'), values=col_viz_two, names='indexer_url', title=col_viz_two + " by indexer url from " + str(indexer_df['day_start'].min()) + " to " + str(indexer_df['day_start'].max()))
   else:
     st.write('column not compatible with pie chart - please select a different column to visualize')
+
+
+debug_panel(rerun)
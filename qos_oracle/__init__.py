@@ -0,0 +1,63 @@
+# Shared data access code for the QoS oracle dashboards (mips, by_indexer, by_subgraph)
+from qos_oracle.api import (
+    MIPS_ORACLE_URL,
+    QOS_ORACLE_URL,
+    DataPoints,
+    fetch_buckets,
+    fetch_daily_datapoints,
+    fetch_datapoints,
+    fetch_indexers,
+    fetch_latency_quantiles,
+    fetch_leaderboard,
+)
+from qos_oracle.catalog import (
+    ALL_NETWORKS,
+    CATALOG_DIR,
+    NETWORK_URLS,
+    Catalog,
+    CatalogService,
+    catalog_ready,
+    fetch_catalog,
+    get_catalog,
+    load_catalog,
+    load_snapshot,
+    merge_catalogs,
+    save_snapshot,
+    warm_catalogs,
+)
+from qos_oracle.client import GRAPH_HOST, GraphQLError, SingleFlight, flights, normalize_query, post_graphql, runner, session
+from qos_oracle.decode import JSON_BACKEND, columnar, loads
+from qos_oracle.downsample import POINTS_PER_SERIES, downsample, lttb_indices, minmax_indices, pie_frame
+from qos_oracle.export import FORMATS, ExportCache, available_formats, export_file, exports, fingerprint, iter_csv, write_export
+from qos_oracle.instrument import (
+    Recorder,
+    count_bytes,
+    count_cache,
+    observe_frame,
+    prometheus_text,
+    serve_metrics,
+    span,
+    start_rerun,
+    timed,
+    totals,
+)
+from qos_oracle.leaderboard import LEADERBOARD_WINDOWS, RANKINGS, Leaderboard, leaderboard_for, rank
+from qos_oracle.lookup import IndexerDirectory, SearchIndex
+from qos_oracle.planner import AGGREGATES, MIN_BUCKETS, RAW_ENTITY, Plan, exposed_aggregates, plan_view
+from qos_oracle.queries import INDEXERS_QUERY, QUERY_FIELDS_QUERY, SUBGRAPHS_QUERY, TYPE_FIELDS_QUERY
+from qos_oracle.pagination import build_query, iter_keyset, keyset_rows
+from qos_oracle.parallel import (
+    EPOCH_SECONDS,
+    MAX_WORKERS,
+    PAGE_SIZE,
+    epoch_windows,
+    fetch_ordered,
+    format_where,
+    pull_history,
+    pull_windowed,
+)
+from qos_oracle.sketch import QUANTILES, group_bins, point_bins, quantile_label
+from qos_oracle.store import SKETCH_ENTITIES, Store, bucket_starts, default_store, pull_incremental, serve_rows, stored_rollup
+from qos_oracle.rollup import BUCKETS, METRICS, RollupCache, choose_bucket, combine, rollup, rollups
+from qos_oracle.schema import DAILY_FIELDS, DATAPOINT_FIELDS, SCHEMA, Columns, apply_schema, as_columns, to_frame
+from qos_oracle.table import PAGE_ROWS, filter_rows, page_count, table_page, table_rows
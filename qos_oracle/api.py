@@ -0,0 +1,264 @@
+import threading
+import time
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from qos_oracle.catalog import Catalog, get_catalog
+from qos_oracle.client import GRAPH_HOST, post_graphql, runner
+from qos_oracle.instrument import observe_frame, span
+from qos_oracle.leaderboard import LEADERBOARD_WINDOWS, leaderboard_for, rank
+from qos_oracle.lookup import IndexerDirectory
+from qos_oracle.pagination import keyset_rows
+from qos_oracle.planner import MIN_BUCKETS, RAW_ENTITY, Plan, plan_view
+from qos_oracle.queries import INDEXERS_QUERY
+from qos_oracle.rollup import BUCKET_SECONDS, BUCKETS, WEIGHT, combine, rollup, rollups
+from qos_oracle.schema import DAILY_FIELDS, DATAPOINT_FIELDS, to_frame
+from qos_oracle.sketch import QUANTILES, group_bins, merge, quantile_label, quantiles, unpack
+from qos_oracle.store import SKETCH_ENTITIES, Store, bucket_starts, default_store, serve_rows, stored_rollup
+
+# Gateway QoS oracle (5 minute points, read by by_indexer and by_subgraph)
+QOS_ORACLE_URL = GRAPH_HOST + '/subgraphs/name/juanmardefago/gateway-qos-oracle'
+# MIPs QoS oracle (daily points, read by mips)
+MIPS_ORACLE_URL = GRAPH_HOST + '/subgraphs/name/graphprotocol/gateway-mips-qos-oracle'
+# Seconds the list of indexers is reused
+INDEXERS_TTL = 3600
+
+# Plan of the MIPs oracle, which only has daily points
+MIPS_PLAN = Plan('indexerDailyDataPoints', DAILY_FIELDS, 86400, 'dayStart', 'Daily', 'indexer_wallet')
+
+
+class DataPoints:
+    # Result of a fetch: the typed frame (with `date` and `subgraph` columns), the plan and scope
+    # that produced it and `key`, which changes whenever the data does so views of it can be cached
+
+    def __init__(self, frame, plan, source, scope, store, catalog):
+        self.frame = frame
+        self.plan = plan
+        self.source = source
+        self.scope = scope
+        self.store = store
+        self.catalog = catalog
+        newest = int(frame['end_epoch'].max()) if len(frame) else None
+        self.key = (source, plan.entity, tuple(sorted(scope.items())), len(frame), newest)
+
+
+def _pull(store, url, plan, scope, nrows):
+    # Newest nrows rows of a scope from the store, pulling what is missing through the pooled client
+    run_query = runner(url)
+    rows = serve_rows(store, url, plan.entity, scope,
+                      lambda lower, upper, limit: keyset_rows(run_query, plan.entity, plan.fields, scope, lower, upper, limit),
+                      nrows)
+    return to_frame(rows, plan.fields)
+
+
+def _pull_span(store, url, plan, scope, rows, view):
+    # Aggregated rows of the plan's entity covering the time span `rows` raw points of the scope would
+    # (and at least MIN_BUCKETS whole buckets of `view` seconds). How many series (indexer and
+    # deployment pairs) share that span is only known once rows are on hand, so the pull is resized
+    # until it covers it; the store only pulls what each resize adds.
+    nrows = plan.rows_for(rows, 1, view)
+    while True:
+        frame = _pull(store, url, plan, scope, nrows)
+        series = frame.groupby(['indexer_url', 'subgraph_deployment_ipfs_hash'], observed=True).ngroups
+        needed = plan.rows_for(rows, series, view)
+        if needed <= nrows or len(frame) < nrows:
+            return frame
+        nrows = needed
+
+
+def _reach_back(store, url, plan, scope, frame, since):
+    # Grow a pull until it reaches back to epoch `since` (or the oracle has nothing older), doubling it
+    # each time; the store only pulls what each step adds
+    nrows = max(len(frame), 1)
+    while len(frame) >= nrows and int(frame['end_epoch'].min()) >= since:
+        nrows *= 2
+        frame = _pull(store, url, plan, scope, nrows)
+    return frame
+
+
+def _points(frame, plan, url, scope, store, catalog, since):
+    if since is not None:
+        frame = frame[frame['end_epoch'] >= int(since)].reset_index(drop=True)
+    # bucket start as a date, and the subgraph name (the hash when the catalog doesn't know it)
+    frame['date'] = pd.to_datetime(frame[plan.start_field], unit='s')
+    with span('label'):
+        frame['subgraph'] = catalog.label_column(frame['subgraph_deployment_ipfs_hash'])
+    return DataPoints(observe_frame('points', frame), plan, url, scope, store, catalog)
+
+
+def fetch_datapoints(*, indexer: Optional[str] = None, deployment: Optional[str] = None, since: Optional[int] = None,
+                     resolution: Optional[str] = None, rows: int = 10000, required: Sequence[str] = (),
+                     catalog: Optional[Catalog] = None, store: Optional[Store] = None) -> DataPoints:
+    # Newest `rows` QoS data points of an indexer and/or deployment from the gateway oracle, served from
+    # the local store. resolution is an app interval ('5 minutes', '1 hour', '1 day', '1 week' or 'auto');
+    # when the oracle has pre-aggregated points that answer it (and every `required` field), those are
+    # pulled instead, covering the time span of `rows` raw points and at least a few whole buckets of
+    # the resolution. Raw pulls stay at `rows` rows: their coarse buckets are read from the store's
+    # rollup tables (see fetch_buckets). With since (unix seconds) the pull reaches back to it however
+    # many rows that takes, and older rows are dropped.
+    if indexer is None and deployment is None:
+        raise ValueError('fetch_datapoints needs an indexer or a deployment')
+    plan = plan_view(QOS_ORACLE_URL, BUCKETS.get(resolution), DATAPOINT_FIELDS, required)
+    scope = {}
+    if indexer is not None:
+        scope[plan.indexer_filter] = indexer
+    if deployment is not None:
+        scope['subgraph_deployment_ipfs_hash'] = deployment
+    store = store or default_store()
+    if plan.raw:
+        frame = _pull(store, QOS_ORACLE_URL, plan, scope, rows)
+    else:
+        frame = _pull_span(store, QOS_ORACLE_URL, plan, scope, rows, BUCKET_SECONDS.get(BUCKETS.get(resolution)))
+    if since is not None:
+        frame = _reach_back(store, QOS_ORACLE_URL, plan, scope, frame, int(since))
+    return _points(frame, plan, QOS_ORACLE_URL, scope, store, catalog or get_catalog('mainnet'), since)
+
+
+def fetch_daily_datapoints(*, deployment: str, indexer: Optional[str] = None, since: Optional[int] = None,
+                           rows: int = 1000, catalog: Optional[Catalog] = None, store: Optional[Store] = None) -> DataPoints:
+    # Newest `rows` daily data points of a deployment (and optionally one indexer) from the MIPs oracle,
+    # or with since every one from then on
+    scope = {'subgraph_deployment_ipfs_hash': deployment}
+    if indexer is not None:
+        scope['indexer_wallet'] = indexer
+    store = store or default_store()
+    frame = _pull(store, MIPS_ORACLE_URL, MIPS_PLAN, scope, rows)
+    if since is not None:
+        frame = _reach_back(store, MIPS_ORACLE_URL, MIPS_PLAN, scope, frame, int(since))
+    return _points(frame, MIPS_PLAN, MIPS_ORACLE_URL, scope, store, catalog or get_catalog('mainnet'), since)
+
+
+def fetch_buckets(points: DataPoints, resolution: str, by: str) -> pd.DataFrame:
+    # Every metric of points bucketed by resolution per `by` ('subgraph' or 'indexer_url'), cached per
+    # data version. Raw points are read from the store's rollup tables, aggregated ones regrouped here.
+    # The rollup tables also hold what the store has of the scope beyond the pulled rows (everything
+    # the ingest daemon keeps), so coarse buckets reach back at least MIN_BUCKETS whole buckets when
+    # the store has them, without pulling any more raw rows.
+    freq = BUCKETS[resolution]
+
+    def compute():
+        if not points.plan.raw:
+            # points already aggregated at this bucket size are whole buckets (but for the open newest one)
+            return rollup(points.frame, freq, [by], complete_only=points.plan.bucket < BUCKET_SECONDS[freq])
+        since = None
+        if len(points.frame):
+            since = min(int(points.frame['end_epoch'].min()),
+                        int(points.frame['end_epoch'].max()) - (MIN_BUCKETS + 2) * BUCKET_SECONDS[freq])
+        parts = stored_rollup(points.store, points.source, points.plan.entity, freq, points.scope, since)
+        if parts.empty:
+            return rollup(points.frame, freq, [by])
+        if by == 'subgraph':
+            parts['subgraph'] = points.catalog.label_column(parts['subgraph_deployment_ipfs_hash'])
+        else:
+            # indexers only the store has rows of are shown by wallet
+            parts['indexer_url'] = parts['indexer_wallet'].map(IndexerDirectory.from_frame(points.frame).urls).fillna(
+                parts['indexer_wallet'])
+        return combine(parts, [by])
+    return observe_frame('buckets', rollups.get((points.key, resolution, by), compute))
+
+
+def _sketch_freq(entity, freq):
+    # Stored sketch frequency answering buckets of freq (the finest one for a whole window), or None
+    stored = SKETCH_ENTITIES.get(entity, ())
+    if freq is None:
+        return stored[0] if stored else None
+    fitting = [each for each in stored if BUCKET_SECONDS[freq] % BUCKET_SECONDS[each] == 0]
+    return fitting[-1] if fitting else None
+
+
+def _groups(keys, nrows):
+    # (group code of every row, one row of keys per group) of the distinct combinations of keys,
+    # missing labels grouped as ''
+    if not keys:
+        return np.zeros(nrows, dtype='int64'), pd.DataFrame(index=range(1 if nrows else 0))
+    frame = pd.DataFrame({name: values if name == 'date' else pd.Series(values, dtype=object).fillna('').to_numpy()
+                          for name, values in keys.items()})
+    grouped = frame.groupby(list(keys), sort=True)
+    return grouped.ngroup().to_numpy(), grouped.size().index.to_frame(index=False)
+
+
+def _latency_frame(groups, codes, bins, queries, peaks, qs):
+    # One row per group: its keys, queries and latency quantiles
+    peaks = pd.Series(np.asarray(peaks, dtype='float64')).groupby(codes).max().reindex(range(len(groups))).to_numpy()
+    groups['query_count'] = np.bincount(codes, np.nan_to_num(np.asarray(queries, dtype='float64')), len(groups))
+    for q, values in quantiles(bins, qs, peaks).items():
+        groups[quantile_label(q)] = values
+    if 'date' in groups.columns:
+        groups['date'] = pd.to_datetime(groups['date'], unit='s')
+    return groups
+
+
+def fetch_latency_quantiles(points: DataPoints, by: Optional[str] = None, resolution: Optional[str] = None,
+                            qs: Sequence[float] = QUANTILES) -> pd.DataFrame:
+    # Latency quantiles (p50/p90/p99_latency_ms by default) over points' scope and window per `by`
+    # ('subgraph', 'indexer_url', 'indexer_wallet', 'gateway_id' or None for the whole scope) and, with
+    # a resolution, per time bucket (`date`). Merged from the latency sketches the store keeps per
+    # bucket, so whole buckets are counted; points the store doesn't sketch (pre-aggregated plans,
+    # 5 minute buckets) are sketched from the frame instead. Cached per data version.
+    freq = BUCKETS.get(resolution)
+
+    def compute():
+        frame = points.frame
+        stored = _sketch_freq(points.plan.entity, freq)
+        rows = None
+        if stored is not None and len(frame):
+            rows = points.store.sketch_rows(points.source, points.plan.entity, stored, points.scope,
+                                            int(frame['end_epoch'].min()))
+        keys = {}
+        # sketches are only kept per indexer, deployment and gateway
+        if rows is not None and len(rows) and by in (None, 'subgraph', 'indexer_url') + tuple(rows.fields):
+            if freq is not None:
+                keys['date'] = bucket_starts(rows['bucket'], freq)
+            if by == 'subgraph':
+                keys[by] = points.catalog.label_column(pd.Series(rows['subgraph_deployment_ipfs_hash'])).to_numpy()
+            elif by == 'indexer_url':
+                wallets = pd.Series(rows['indexer_wallet'])
+                keys[by] = wallets.map(IndexerDirectory.from_frame(frame).urls).fillna(wallets).to_numpy()
+            elif by is not None:
+                keys[by] = rows[by]
+            codes, groups = _groups(keys, len(rows))
+            bins = merge(codes, len(groups), unpack(rows['lo'], rows['bins']))
+            return _latency_frame(groups, codes, bins, rows['queries'], rows['peak'], qs)
+        # sketched here from the data points themselves
+        if freq is not None:
+            keys['date'] = bucket_starts(frame['end_epoch'], freq)
+        if by == 'subgraph' and by not in frame.columns:
+            keys[by] = points.catalog.label_column(frame['subgraph_deployment_ipfs_hash']).to_numpy()
+        elif by is not None:
+            keys[by] = frame[by].to_numpy()
+        codes, groups = _groups(keys, len(frame))
+        peaks = frame['max_indexer_latency_ms'] if 'max_indexer_latency_ms' in frame.columns else None
+        stdevs = frame['stdev_indexer_latency_ms'] if 'stdev_indexer_latency_ms' in frame.columns else None
+        bins = group_bins(codes, len(groups), frame[WEIGHT].to_numpy('float64'),
+                          frame['avg_indexer_latency_ms'].to_numpy('float64'),
+                          None if stdevs is None else stdevs.to_numpy('float64'),
+                          None if peaks is None else peaks.to_numpy('float64'))
+        return _latency_frame(groups, codes, bins, frame[WEIGHT], np.full(len(frame), np.nan) if peaks is None else peaks, qs)
+    return observe_frame('latency', rollups.get((points.key, 'latency', by, resolution, tuple(qs)), compute))
+
+
+def fetch_leaderboard(window: str = '24 hours', by: str = 'p95_latency_ms', min_queries: float = 0,
+                      store: Optional[Store] = None) -> pd.DataFrame:
+    # Every indexer of the gateway oracle ranked by `by` across all deployments over a window (a key of
+    # LEADERBOARD_WINDOWS), from the rollup tables the store keeps at ingest. Only buckets written since
+    # the last call are read, and the ranked table is cached per data version.
+    seconds, freq = LEADERBOARD_WINDOWS[window]
+    board = leaderboard_for(store or default_store(), QOS_ORACLE_URL, RAW_ENTITY, freq).refresh()
+    key = ('leaderboard', board.store.path, freq, board.version, window, by, min_queries)
+    return observe_frame('leaderboard', rollups.get(key, lambda: rank(board.table(seconds, min_queries), by)))
+
+
+_indexers = None
+_indexers_lock = threading.Lock()
+
+
+def fetch_indexers(ttl: float = INDEXERS_TTL) -> IndexerDirectory:
+    # Directory of the indexers known to the gateway oracle, downloaded at most once per ttl seconds
+    global _indexers
+    with _indexers_lock:
+        if _indexers is None or time.time() - _indexers[0] >= ttl:
+            data = post_graphql(QOS_ORACLE_URL, INDEXERS_QUERY)
+            _indexers = (time.time(), IndexerDirectory(indexer['id'] for indexer in data['indexers']))
+        return _indexers[1]
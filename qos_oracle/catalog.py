@@ -0,0 +1,347 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from qos_oracle.client import GRAPH_HOST, post_graphql
+from qos_oracle.instrument import span, timed
+from qos_oracle.lookup import LabelDictionary, SearchIndex
+from qos_oracle.parallel import PAGE_SIZE, fetch_ordered, format_where
+from qos_oracle.queries import SUBGRAPHS_QUERY
+
+# Network subgraph for each gateway network
+NETWORK_URLS = {
+    'mainnet': GRAPH_HOST + '/subgraphs/name/graphprotocol/graph-network-mainnet',
+    'testnet': GRAPH_HOST + '/subgraphs/name/graphprotocol/graph-network-goerli',
+    'arbitrum': GRAPH_HOST + '/subgraphs/name/graphprotocol/graph-network-arbitrum',
+}
+# Name of the catalog merging every gateway network
+ALL_NETWORKS = 'all'
+# Seconds a catalog is served before it is refreshed in the background
+CATALOG_TTL = 3600
+# Where the last downloaded catalog of each network is kept, so a cold start serves it straight away
+CATALOG_DIR = os.environ.get('QOS_ORACLE_CATALOGS', str(Path.home() / '.cache' / 'qos_oracle' / 'catalogs'))
+# Subgraph labels shared by every catalog, so their categorical codes survive refreshes
+subgraph_labels = LabelDictionary()
+# Shards the id space of a network subgraph is split into and paged concurrently
+ID_SHARDS = 16
+# Id formats the shards can be picked for, as (prefix, digits in sort order): hex accounts (with a
+# '-<number>' suffix) and base58 hashes. Ids of any other format are paged as one shard.
+ID_FORMATS = [
+    ('0x', '0123456789abcdef'),
+    ('', '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'),
+]
+
+
+def _latest_hash(subgraph):
+    versions = subgraph.get('versions') or []
+    if versions and versions[0].get('subgraphDeployment'):
+        return versions[0]['subgraphDeployment']['ipfsHash']
+    return None
+
+
+class Catalog:
+    # Immutable snapshot of the active subgraphs on one gateway network, with O(1) lookups
+    # by display name and by latest deployment IPFS hash and a type-ahead search index over names.
+    # Everything is built once per download, so page views only do lookups.
+
+    def __init__(self, network, records, fetched_at):
+        self.network = network
+        self.records = records
+        self.fetched_at = fetched_at
+        self.by_hash = {}
+        self.by_name = {}
+        # records are in signal order, so the first one seen wins a shared name
+        for record in records:
+            if record['ipfsHash'] is not None:
+                self.by_hash.setdefault(record['ipfsHash'], record)
+            if record['subgraph'] is not None:
+                self.by_name.setdefault(record['subgraph'], record)
+        self.search = SearchIndex(record['subgraph'] for record in records)
+
+    def hash_for(self, name):
+        record = self.by_name.get(name)
+        return record['ipfsHash'] if record is not None else None
+
+    def name_for(self, ipfs_hash):
+        record = self.by_hash.get(ipfs_hash)
+        return record['subgraph'] if record is not None else None
+
+    def label_column(self, hashes):
+        # Subgraph name for every deployment hash in a column, as a categorical; hashes this catalog
+        # doesn't know are labelled by the hash itself, so their rows are kept
+        return subgraph_labels.encode(hashes, lambda ipfs_hash: self.name_for(ipfs_hash) or ipfs_hash)
+
+    def names(self, text=''):
+        # Unique subgraph names in signal order, narrowed to those matching text when given
+        return self.search.search(text)
+
+    def position(self, name, default=0):
+        # Position of a name in names()
+        return self.search.positions.get(name, default)
+
+
+def _subgraph_page(url, where):
+    return post_graphql(url, SUBGRAPHS_QUERY % (format_where(dict(where, active=True)), PAGE_SIZE))['subgraphs']
+
+
+def _shard_subgraphs(url, lower, upper, after=None):
+    # Every active subgraph with lower <= id < upper (None = unbounded) and id > after when given,
+    # keyset paginated on id
+    subgraphs = []
+    last_id = after
+    while True:
+        where = {}
+        if last_id is not None:
+            where['id_gt'] = last_id
+        elif lower is not None:
+            where['id_gte'] = lower
+        if upper is not None:
+            where['id_lt'] = upper
+        page = _subgraph_page(url, where)
+        subgraphs.extend(page)
+        if len(page) < PAGE_SIZE:
+            return subgraphs
+        last_id = page[-1]['id']
+
+
+def _id_bounds(url, ids, shards=ID_SHARDS):
+    # Lower bounds of all but the first shard, evenly spaced over the digits of the id format the
+    # sampled ids are in; none (a single shard) when they are in no known format
+    for prefix, digits in ID_FORMATS:
+        if all(id.startswith(prefix) and set(id[len(prefix):].split('-')[0]) <= set(digits) for id in ids):
+            return [prefix + digits[round(k * len(digits) / shards)] for k in range(1, shards)]
+    print(f"Subgraph ids of {url} are in an unknown format, the catalog is paged as one shard")
+    return []
+
+
+def _signal(subgraph):
+    try:
+        return int(subgraph['signalledTokens'] or 0)
+    except ValueError:
+        return float(subgraph['signalledTokens'])
+
+
+@timed('catalog.fetch')
+def fetch_catalog(network='mainnet', total_rows=None):
+    # Download every active subgraph of a network (or the total_rows with the most signal) and
+    # reshape them into a Catalog. The first page of ids shows their format, the rest of the id space
+    # is split by it into shards paged concurrently, then everything is sorted by signal.
+    url = NETWORK_URLS[network]
+    first = _subgraph_page(url, {})
+    shards = [first]
+    if len(first) == PAGE_SIZE:
+        last_id = first[-1]['id']
+        bounds = [bound for bound in _id_bounds(url, [subgraph['id'] for subgraph in first]) if bound > last_id]
+        bounds = [None] + bounds + [None]
+        # the first shard carries on after the sampled page
+        ranges = [(lower, upper, last_id if lower is None else None) for lower, upper in zip(bounds[:-1], bounds[1:])]
+        shards += fetch_ordered(lambda shard: _shard_subgraphs(url, *shard), ranges)
+    subgraphs = sorted((subgraph for shard in shards for subgraph in shard), key=_signal, reverse=True)
+    records = []
+    seen = set()
+    for subgraph in subgraphs[:total_rows]:
+        # same subgraph listed twice
+        key = (subgraph['displayName'], subgraph['signalledTokens'], subgraph['creatorAddress'])
+        if key in seen:
+            continue
+        seen.add(key)
+        ipfs_hash = _latest_hash(subgraph)
+        records.append({
+            'displayName': subgraph['displayName'],
+            'signalledTokens': subgraph['signalledTokens'],
+            'creatorAddress': subgraph['creatorAddress'],
+            'ipfsHash': ipfs_hash,
+            # subgraph name, but the ipfs hash when it doesn't have one
+            'subgraph': subgraph['displayName'] if subgraph['displayName'] is not None else ipfs_hash,
+        })
+    return Catalog(network, records, time.time())
+
+
+def save_snapshot(catalog, directory=CATALOG_DIR):
+    # Write a catalog to disk (atomically, a reader never sees half a file)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'network': catalog.network, 'fetched_at': catalog.fetched_at, 'records': catalog.records}, f)
+        os.replace(tmp, directory / (catalog.network + '.json'))
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def load_snapshot(network, directory=CATALOG_DIR):
+    # The catalog last saved for a network, or None when there is no readable one
+    try:
+        with open(Path(directory) / (network + '.json')) as f:
+            snapshot = json.load(f)
+        return Catalog(network, snapshot['records'], snapshot['fetched_at'])
+    except (OSError, ValueError, KeyError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Catalog snapshot for {network} not loaded: {e}")
+        return None
+
+
+def merge_catalogs(parts):
+    # One Catalog over several networks, in the order given. Records are tagged with their network
+    # and a deployment listed on more than one network keeps its first record.
+    records = []
+    seen = set()
+    for catalog in parts:
+        for record in catalog.records:
+            if record['ipfsHash'] is not None:
+                if record['ipfsHash'] in seen:
+                    continue
+                seen.add(record['ipfsHash'])
+            records.append(dict(record, network=catalog.network))
+    return Catalog(ALL_NETWORKS, records, min(catalog.fetched_at for catalog in parts))
+
+
+class CatalogService:
+    # Process-wide TTL cache of catalogs per network, shared by every session and app in the process.
+    # A cold process serves the snapshot saved on disk by the last download; only a network that has
+    # never been downloaded blocks on it. A stale catalog keeps being served while a single
+    # background thread fetches its replacement (and saves it as the new snapshot).
+
+    def __init__(self, ttl=CATALOG_TTL, fetch=fetch_catalog, snapshots=CATALOG_DIR):
+        self.ttl = ttl
+        self.fetch = fetch
+        self.snapshots = snapshots
+        self._catalogs = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._network_locks = {}
+        self._merged = None
+        self._warming = False
+
+    def _network_lock(self, network):
+        with self._lock:
+            return self._network_locks.setdefault(network, threading.Lock())
+
+    def get(self, network='mainnet'):
+        if network == ALL_NETWORKS:
+            return self.merged()
+        catalog = self._catalogs.get(network)
+        if catalog is None:
+            with self._network_lock(network):
+                # another session may have loaded it while we waited
+                catalog = self._catalogs.get(network)
+                if catalog is None:
+                    catalog = self._snapshot(network)
+                    if catalog is None:
+                        catalog = self._download(network)
+                    self._catalogs[network] = catalog
+        if time.time() - catalog.fetched_at >= self.ttl:
+            self.refresh(network)
+        return catalog
+
+    def ready(self, network='mainnet'):
+        # Whether get(network) would return without waiting on a download
+        networks = list(NETWORK_URLS) if network == ALL_NETWORKS else [network]
+        return all(name in self._catalogs or self._has_snapshot(name) for name in networks)
+
+    def load(self, network='mainnet'):
+        # Start loading a network (or every network for ALL_NETWORKS) in the background
+        if network == ALL_NETWORKS:
+            self.warm()
+        elif network not in self._catalogs:
+            threading.Thread(target=self._load, args=(network,), daemon=True).start()
+
+    def _load(self, network):
+        try:
+            self.get(network)
+        except Exception as e:
+            print(f"Catalog load for {network} failed: {e}")
+
+    def _has_snapshot(self, network):
+        return self.snapshots is not None and (Path(self.snapshots) / (network + '.json')).exists()
+
+    def _snapshot(self, network):
+        return load_snapshot(network, self.snapshots) if self.snapshots is not None else None
+
+    def _download(self, network):
+        catalog = self.fetch(network)
+        if self.snapshots is not None:
+            try:
+                save_snapshot(catalog, self.snapshots)
+            except OSError as e:
+                print(f"Catalog snapshot for {network} not saved: {e}")
+        return catalog
+
+    def get_all(self, networks=None):
+        # Catalog of every network, the ones not loaded yet downloaded concurrently
+        networks = list(networks or NETWORK_URLS)
+        return dict(zip(networks, fetch_ordered(self.get, networks, len(networks))))
+
+    def merged(self, networks=None):
+        # Every network merged into one catalog, rebuilt only when one of them was refreshed
+        parts = list(self.get_all(networks).values())
+        key = tuple((catalog.network, catalog.fetched_at) for catalog in parts)
+        merged = self._merged
+        if merged is None or merged[0] != key:
+            merged = self._merged = (key, merge_catalogs(parts))
+        return merged[1]
+
+    def warm(self, networks=None):
+        # Load (or refresh when stale) every network in the background, so switching network
+        # never waits on a download
+        with self._lock:
+            if self._warming:
+                return
+            self._warming = True
+        threading.Thread(target=self._warm, args=(networks,), daemon=True).start()
+
+    def _warm(self, networks):
+        try:
+            self.get_all(networks)
+        except Exception as e:
+            print(f"Catalog warm up failed: {e}")
+        finally:
+            with self._lock:
+                self._warming = False
+
+    def refresh(self, network):
+        # Start a background refresh of one network unless one is already running
+        with self._lock:
+            if network in self._refreshing:
+                return
+            self._refreshing.add(network)
+        threading.Thread(target=self._refresh, args=(network,), daemon=True).start()
+
+    def _refresh(self, network):
+        try:
+            self._catalogs[network] = self._download(network)
+        except Exception as e:
+            # keep serving the stale catalog, the next stale get() will try again
+            print(f"Catalog refresh for {network} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(network)
+
+
+catalogs = CatalogService()
+
+
+def get_catalog(network='mainnet'):
+    # Catalog for a gateway network (or ALL_NETWORKS) from the process-wide cache
+    with span('catalog'):
+        return catalogs.get(network)
+
+
+def load_catalog(network='mainnet'):
+    # Start loading a catalog in the background, so a page can draw itself while it loads
+    catalogs.load(network)
+
+
+def catalog_ready(network='mainnet'):
+    # Whether get_catalog(network) returns straight away (loaded, or a snapshot is on disk)
+    return catalogs.ready(network)
+
+
+def warm_catalogs(networks=None):
+    # Start loading every gateway network's catalog in the background
+    catalogs.warm(networks)
@@ -0,0 +1,195 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from qos_oracle.decode import columnar, loads
+from qos_oracle.instrument import count_bytes, count_cache, span
+from qos_oracle.parallel import MAX_WORKERS
+
+# Host serving every subgraph the apps read; point it at a local stand-in to run offline
+GRAPH_HOST = os.environ.get('QOS_ORACLE_GRAPH_HOST', 'https://api.thegraph.com').rstrip('/')
+# (connect, read) timeout in seconds for every request
+TIMEOUT = (5, 30)
+# Attempts after the first one for connection errors, timeouts and retryable status codes
+RETRIES = 4
+# Base of the exponential backoff in seconds, and its ceiling
+BACKOFF = 0.5
+MAX_BACKOFF = 10
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Keep enough pooled connections per host for a full set of concurrent page fetches
+POOL_SIZE = MAX_WORKERS * 2
+# Seconds an identical query is answered from memory instead of the endpoint (0 only coalesces)
+RESPONSE_TTL = 30
+# Most responses kept in memory
+RESPONSE_CACHE_SIZE = 256
+
+
+class GraphQLError(Exception):
+    # Raised when the endpoint answers with a GraphQL `errors` list
+
+    def __init__(self, url, errors):
+        self.url = url
+        self.errors = errors
+        super().__init__(url + ': ' + '; '.join(str(error.get('message', error)) for error in errors))
+
+
+class _RetryableStatus(Exception):
+    def __init__(self, response):
+        self.response = response
+        super().__init__('HTTP ' + str(response.status_code) + ' from ' + response.url)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def session():
+    # One pooled keep-alive session for the whole process, shared by every app, rerun and thread,
+    # so TLS handshakes are paid once per host rather than once per page
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+            _session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Content-Type': 'application/json'})
+        return _session
+
+
+def _backoff(attempt):
+    # Full jitter: sleep a random time up to the exponential bound
+    return random.uniform(0, min(MAX_BACKOFF, BACKOFF * 2 ** attempt))
+
+
+def _fetch_graphql(url, query, variables, timeout, retries):
+    # Post a GraphQL query and return its `data` dict.
+    # Connection errors, timeouts, 429 and 5xx are retried with jittered backoff, other HTTP errors
+    # are raised as requests.HTTPError and GraphQL errors as GraphQLError.
+    payload = {'query': query}
+    if variables:
+        payload['variables'] = variables
+    for attempt in range(retries + 1):
+        try:
+            with span('graphql'):
+                r = session().post(url, json=payload, timeout=timeout)
+            count_bytes(len(r.content))
+            if r.status_code in RETRY_STATUS:
+                raise _RetryableStatus(r)
+            r.raise_for_status()
+            with span('decode'):
+                # parsed straight from the response bytes, skipping requests' text decoding
+                body = loads(r.content)
+        except (requests.ConnectionError, requests.Timeout, _RetryableStatus) as error:
+            if attempt == retries:
+                if isinstance(error, _RetryableStatus):
+                    error.response.raise_for_status()
+                raise
+            time.sleep(_backoff(attempt))
+            continue
+        if body.get('errors'):
+            raise GraphQLError(url, body['errors'])
+        return body['data']
+
+
+def normalize_query(query):
+    # Query text with insignificant whitespace removed (string literals are kept as they are), so
+    # queries that only differ in layout share a key
+    parts = re.split(r'("(?:\\.|[^"\\])*")', query)
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r'\s*([{}()\[\]:,!=@$])\s*', r'\1', re.sub(r'\s+', ' ', parts[i])).strip()
+    return ''.join(parts)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Coalesces identical requests: while one is in flight every other caller with the same key
+    # waits for it and gets its result (or its exception), and a result is then served from memory
+    # for `ttl` seconds. Upstream load stays at one request per key however many sessions ask.
+    # Results are shared between callers and must not be mutated.
+
+    def __init__(self, ttl=RESPONSE_TTL, maxsize=RESPONSE_CACHE_SIZE, name='responses'):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.name = name
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._cache = OrderedDict()
+
+    def get(self, key, fetch, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > time.time():
+                self._cache.move_to_end(key)
+                count_cache(self.name, True)
+                return cached[1]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        # a caller joining a request already in flight counts as a hit
+        count_cache(self.name, not leader)
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fetch()
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None and ttl > 0:
+                    self._cache[key] = (time.time() + ttl, flight.result)
+                    self._cache.move_to_end(key)
+                    while len(self._cache) > self.maxsize:
+                        self._cache.popitem(last=False)
+            flight.done.set()
+        return flight.result
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+flights = SingleFlight()
+
+
+def post_graphql(url, query, variables=None, timeout=TIMEOUT, retries=RETRIES, ttl=None, columns=False):
+    # Post a GraphQL query and return its `data` dict, sharing one in-flight request and a short
+    # lived response (ttl seconds, RESPONSE_TTL by default) with every identical query in the process.
+    # With columns, every list of rows in `data` comes back as schema.Columns (and is cached that way).
+    key = (url, normalize_query(query), json.dumps(variables or {}, sort_keys=True), columns)
+
+    def fetch():
+        data = _fetch_graphql(url, query, variables, timeout, retries)
+        if not columns:
+            return data
+        with span('columns'):
+            return columnar(data)
+    return flights.get(key, fetch, ttl)
+
+
+def runner(url):
+    # A run_query(query) function bound to one endpoint, as expected by the paginator: pages come
+    # back as Columns
+    def run_query(query):
+        return post_graphql(url, query, columns=True)
+    return run_query
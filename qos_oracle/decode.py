@@ -0,0 +1,31 @@
+import importlib
+import importlib.util
+import json
+import os
+
+from qos_oracle.schema import Columns
+
+# JSON parser for GraphQL responses: msgspec or orjson when installed (both several times faster than
+# the standard library on oracle pages), else json. QOS_ORACLE_JSON forces one of them.
+JSON_BACKENDS = ('msgspec', 'orjson', 'json')
+JSON_BACKEND = os.environ.get('QOS_ORACLE_JSON') or next(
+    name for name in JSON_BACKENDS if name == 'json' or importlib.util.find_spec(name) is not None)
+
+
+def _loader(backend):
+    if backend == 'msgspec':
+        return importlib.import_module('msgspec.json').Decoder().decode
+    if backend == 'orjson':
+        return importlib.import_module('orjson').loads
+    if backend == 'json':
+        return json.loads
+    raise ValueError('Unknown JSON backend: ' + backend)
+
+
+loads = _loader(JSON_BACKEND)
+
+
+def columnar(data):
+    # A GraphQL `data` dict with every list of rows turned into Columns, so the parsed dicts only
+    # live as long as the page they came in
+    return {key: Columns.from_rows(value) if isinstance(value, list) else value for key, value in data.items()}
@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from qos_oracle.instrument import timed
+
+# Most points sent to the browser per chart series, overridable with QOS_ORACLE_CHART_POINTS
+POINTS_PER_SERIES = int(os.environ.get('QOS_ORACLE_CHART_POINTS', 500))
+# Metrics where a single bad bucket matters, downsampled with min/max so spikes always survive
+SPIKE_METRICS = ('latency', 'blocks_behind')
+
+
+def minmax_indices(y, threshold):
+    # Keep the first and last point plus the min and max of each of threshold/2 equal buckets
+    n = len(y)
+    if n <= threshold:
+        return np.arange(n)
+    buckets = max(threshold // 2 - 1, 1)
+    edges = np.linspace(1, n - 1, buckets + 1).astype(int)
+    keep = [np.array([0, n - 1])]
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            chunk = y[start:end]
+            keep.append(np.array([start + np.nanargmin(chunk), start + np.nanargmax(chunk)]))
+    return np.unique(np.concatenate(keep))
+
+
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: keep the point of each bucket that forms the largest
+    # triangle with the previously kept point and the average of the next bucket
+    n = len(y)
+    if n <= threshold or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = np.empty(threshold, dtype=int)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_start = min(end, n - 1)
+        avg_x = x[next_start:max(next_end, next_start + 1)].mean()
+        avg_y = y[next_start:max(next_end, next_start + 1)].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return np.unique(keep)
+
+
+def _is_spiky(column):
+    return any(marker in column for marker in SPIKE_METRICS)
+
+
+@timed('downsample')
+def downsample(df, x, y, series=None, points=POINTS_PER_SERIES, method=None):
+    # Reduce df to at most `points` rows per series before it is handed to plotly.
+    # method is 'minmax' or 'lttb'; by default latency and blocks-behind use min/max so spikes
+    # are kept, everything else uses LTTB.
+    if method is None:
+        method = 'minmax' if _is_spiky(y) else 'lttb'
+    groups = df.groupby(series, observed=True, sort=False) if series else [(None, df)]
+    keep = []
+    for _, group in groups:
+        group = group[group[y].notna()]
+        if len(group) <= points:
+            keep.append(group.index.to_numpy())
+            continue
+        group = group.sort_values(x)
+        values = group[y].to_numpy(dtype='float64')
+        if method == 'minmax':
+            positions = minmax_indices(values, points)
+        else:
+            xs = pd.to_numeric(group[x]).to_numpy(dtype='float64') if group[x].dtype.kind == 'M' else group[x].to_numpy(dtype='float64')
+            positions = lttb_indices(xs, values, points)
+        keep.append(group.index.to_numpy()[positions])
+    if not keep:
+        return df.iloc[0:0]
+    return df.loc[np.concatenate(keep)].sort_values(x, kind='stable')
+
+
+def pie_frame(df, values, names):
+    # One row per slice, so px.pie gets the totals rather than every raw row
+    return df.groupby(names, observed=True, sort=False)[values].sum().reset_index()
@@ -0,0 +1,143 @@
+import gzip
+import hashlib
+import importlib.util
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from qos_oracle.instrument import count_cache, timed
+
+# Where encoded downloads are kept, next to the store
+EXPORT_DIR = os.environ.get('QOS_ORACLE_EXPORTS', str(Path.home() / '.cache' / 'qos_oracle' / 'exports'))
+# Most artifacts kept on disk before the least recently used are deleted
+MAX_ARTIFACTS = 32
+# Rows encoded at a time, so an export never holds a second full copy of the frame in memory
+CHUNK_ROWS = 50000
+
+# Download formats: file extension, mime type and the optional module they need
+FORMATS = {
+    'CSV': ('csv', 'text/csv', None),
+    'CSV (gzip)': ('csv.gz', 'application/gzip', None),
+    'CSV (zstd)': ('csv.zst', 'application/zstd', 'zstandard'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet', 'pyarrow'),
+}
+
+
+def available_formats():
+    # Formats whose optional dependency is installed, plain CSV first
+    return [name for name, (_, _, module) in FORMATS.items()
+            if module is None or importlib.util.find_spec(module) is not None]
+
+
+def fingerprint(df):
+    # Content hash of a frame (columns, dtypes and every row), used as the artifact cache key
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr([(str(column), str(dtype)) for column, dtype in df.dtypes.items()]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _key_name(key):
+    # File name of an artifact for a caller's key (any value with a stable repr)
+    return hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def iter_csv(df, chunk_rows=CHUNK_ROWS):
+    # CSV bytes of df, header first, one chunk of rows at a time
+    yield df.iloc[0:0].to_csv().encode('utf-8')
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(header=False).encode('utf-8')
+
+
+def _write_parquet(df, path, chunk_rows):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.Schema.from_pandas(df.iloc[0:0])
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        # one row group per chunk
+        for start in range(0, len(df), chunk_rows):
+            writer.write_table(pa.Table.from_pandas(df.iloc[start:start + chunk_rows], schema=schema))
+
+
+@timed('export')
+def write_export(df, fmt, path, chunk_rows=CHUNK_ROWS):
+    # Encode df to path in one of FORMATS, streaming chunks straight into the (compressed) file
+    if fmt == 'Parquet':
+        _write_parquet(df, path, chunk_rows)
+        return
+    with open(path, 'wb') as raw:
+        if fmt == 'CSV (gzip)':
+            out = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6, mtime=0)
+        elif fmt == 'CSV (zstd)':
+            import zstandard
+            out = zstandard.ZstdCompressor(level=3).stream_writer(raw)
+        else:
+            out = raw
+        try:
+            for chunk in iter_csv(df, chunk_rows):
+                out.write(chunk)
+        finally:
+            if out is not raw:
+                out.close()
+
+
+class ExportCache:
+    # Encoded downloads on disk keyed by content fingerprint and format. A frame is only encoded
+    # the first time someone asks for it; later reruns, sessions and apps reuse the file.
+
+    def __init__(self, directory=EXPORT_DIR, max_artifacts=MAX_ARTIFACTS):
+        self.directory = Path(directory)
+        self.max_artifacts = max_artifacts
+        self._lock = threading.Lock()
+        self._building = {}
+
+    def path_for(self, key, fmt):
+        return self.directory / (key + '.' + FORMATS[fmt][0])
+
+    def get(self, df, fmt, key=None):
+        # Path of the artifact for df in fmt, building it on a miss. key, which must change whenever
+        # df's content does, saves hashing every row; without it the content fingerprint is used.
+        # Concurrent requests for the same artifact wait for one build.
+        key = fingerprint(df) if key is None else _key_name(key)
+        path = self.path_for(key, fmt)
+        with self._lock:
+            lock = self._building.setdefault(path, threading.Lock())
+        with lock:
+            count_cache('exports', path.exists())
+            if path.exists():
+                os.utime(path)
+            else:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+                os.close(fd)
+                try:
+                    write_export(df, fmt, tmp)
+                    os.replace(tmp, path)
+                finally:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+                self._prune()
+        return path
+
+    def _prune(self):
+        # Drop the least recently used artifacts beyond max_artifacts
+        artifacts = sorted((path for path in self.directory.iterdir() if not path.name.endswith('.tmp')),
+                           key=lambda path: path.stat().st_mtime, reverse=True)
+        for path in artifacts[self.max_artifacts:]:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+exports = ExportCache()
+
+
+def export_file(df, fmt, key=None):
+    # (path, file extension, mime type) of df encoded as fmt, from the process-wide cache
+    extension, mime, _ = FORMATS[fmt]
+    return exports.get(df, fmt, key), extension, mime
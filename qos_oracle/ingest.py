@@ -0,0 +1,119 @@
+import argparse
+import math
+import time
+
+from qos_oracle.api import MIPS_ORACLE_URL, QOS_ORACLE_URL
+from qos_oracle.client import runner
+from qos_oracle.pagination import iter_keyset, keyset_rows
+from qos_oracle.parallel import EPOCH_SECONDS, MAX_WORKERS, epoch_windows, fetch_ordered
+from qos_oracle.schema import DAILY_FIELDS, DATAPOINT_FIELDS
+from qos_oracle.store import DEFAULT_PATH, Store
+
+# Oracles the dashboards read: subgraph url, entity, fields and the filter that selects one indexer
+SOURCES = {
+    'qos': (QOS_ORACLE_URL, 'indexerDataPoints', DATAPOINT_FIELDS, 'indexer'),
+    'mips': (MIPS_ORACLE_URL, 'indexerDailyDataPoints', DAILY_FIELDS, 'indexer_wallet'),
+}
+# History pulled the first time a scope is ingested
+HISTORY_SECONDS = 7 * 86400
+# Epoch windows pulled per batch on a cold start
+COLD_WINDOWS = 4 * MAX_WORKERS
+
+
+def _write_pages(store, url, entity, pages):
+    # Upsert pages as they arrive, returning (rows written, newest, oldest end_epoch)
+    written, newest, oldest = 0, None, None
+    for page in pages:
+        store.upsert(url, entity, page)
+        epochs = page['end_epoch']
+        written += len(page)
+        newest = int(epochs.max()) if newest is None else max(newest, int(epochs.max()))
+        oldest = int(epochs.min()) if oldest is None else min(oldest, int(epochs.min()))
+    return written, newest, oldest
+
+
+def ingest_scope(store, run_query, url, entity, fields, scope, history=HISTORY_SECONDS, now=None):
+    # Bring one scope up to date in the store and return the number of rows written.
+    # A new scope gets `history` seconds of rows pulled in concurrent epoch windows; after that
+    # every poll re-reads from the stored high-water epoch, which is usually a page or two.
+    now = int(now or time.time())
+    cov = store.coverage(url, entity, scope)
+    if cov is None:
+        upper = now + EPOCH_SECONDS
+        span = max(history // COLD_WINDOWS, EPOCH_SECONDS)
+        windows = epoch_windows(upper, span, math.ceil(history / span))
+
+        def cold_pages():
+            # a batch of windows at a time, so only a batch is ever held in memory
+            for start in range(0, len(windows), MAX_WORKERS):
+                yield from fetch_ordered(lambda window: keyset_rows(run_query, entity, fields, scope, *window),
+                                         windows[start:start + MAX_WORKERS])
+        written, newest, oldest = _write_pages(store, url, entity, (page for page in cold_pages() if len(page)))
+        if newest is None:
+            # nothing there yet, try the whole history again next poll
+            return 0
+        store.set_coverage(url, entity, scope, newest, oldest, False, now)
+        return written
+    # re-read the high-water epoch too, it may have been written over several blocks
+    written, newest, _ = _write_pages(store, url, entity, iter_keyset(run_query, entity, fields, scope, cov['newest']))
+    store.set_coverage(url, entity, scope, max(cov['newest'], newest or cov['newest']), cov['oldest'],
+                       cov['exhausted'], now)
+    return written
+
+
+def scopes_for(indexer_filter, indexers=(), deployments=()):
+    # Scopes to ingest for one source: everything, or only the given indexers and deployments
+    scopes = [{indexer_filter: wallet} for wallet in indexers]
+    scopes += [{'subgraph_deployment_ipfs_hash': deployment} for deployment in deployments]
+    return scopes or [{}]
+
+
+def poll(store, sources, indexers=(), deployments=(), history=HISTORY_SECONDS):
+    # One pass over every configured source and scope
+    for name in sources:
+        url, entity, fields, indexer_filter = SOURCES[name]
+        run_query = runner(url)
+        for scope in scopes_for(indexer_filter, indexers, deployments):
+            started = time.time()
+            try:
+                written = ingest_scope(store, run_query, url, entity, fields, scope, history)
+            except Exception as e:
+                # keep the daemon alive, the scope is retried next epoch
+                print(f"Ingest of {entity} {scope or 'all'} failed: {e}")
+                continue
+            store.mark_ingested(url, entity, scope, time.time())
+            print(f"{entity} {scope or 'all'}: {written} rows in {time.time() - started:.1f}s")
+
+
+def run(store, sources, indexers=(), deployments=(), history=HISTORY_SECONDS, interval=EPOCH_SECONDS, once=False):
+    # Poll every `interval` seconds (one oracle epoch by default) until interrupted
+    while True:
+        started = time.time()
+        poll(store, sources, indexers, deployments, history)
+        if once:
+            return
+        time.sleep(max(interval - (time.time() - started), 1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m qos_oracle.ingest',
+                                     description='Keep the local QoS oracle store up to date for the dashboards.')
+    parser.add_argument('--source', action='append', choices=sorted(SOURCES),
+                        help='oracle to ingest, repeatable (default: all)')
+    parser.add_argument('--indexer', action='append', default=[], help='only this indexer wallet, repeatable')
+    parser.add_argument('--deployment', action='append', default=[], help='only this deployment IPFS hash, repeatable')
+    parser.add_argument('--history-days', type=float, default=HISTORY_SECONDS / 86400,
+                        help='history pulled the first time a scope is ingested')
+    parser.add_argument('--interval', type=float, default=EPOCH_SECONDS, help='seconds between polls')
+    parser.add_argument('--store', default=DEFAULT_PATH, help='SQLite store path')
+    parser.add_argument('--once', action='store_true', help='poll once and exit')
+    args = parser.parse_args(argv)
+    try:
+        run(Store(args.store), args.source or list(SOURCES), args.indexer, args.deployment,
+            int(args.history_days * 86400), args.interval, args.once)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import contextvars
+import importlib
+import importlib.util
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+# Port of the Prometheus text endpoint (/metrics), started with the first rerun when set
+METRICS_PORT = os.environ.get('QOS_ORACLE_METRICS_PORT')
+# Also emit every span to OpenTelemetry when this is set and opentelemetry-api is installed
+OTEL = os.environ.get('QOS_ORACLE_OTEL', '') not in ('', '0')
+
+
+class Recorder:
+    # Stage timings, bytes fetched, cache hits and misses and the largest frame seen, for one rerun
+    # or (`totals`) the whole process. Updated from the page fetching threads too, so it locks.
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages = {}
+        self.caches = {}
+        self.bytes = 0
+        self.peak_frame = (0, None)
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            calls, total = self.stages.get(name, (0, 0.0))
+            self.stages[name] = (calls + 1, total + seconds)
+
+    def add_cache(self, name, hit):
+        with self._lock:
+            hits, misses = self.caches.get(name, (0, 0))
+            self.caches[name] = (hits + 1, misses) if hit else (hits, misses + 1)
+
+    def add_bytes(self, nbytes):
+        with self._lock:
+            self.bytes += nbytes
+
+    def add_frame(self, name, nbytes):
+        with self._lock:
+            if nbytes > self.peak_frame[0]:
+                self.peak_frame = (nbytes, name)
+
+    def elapsed(self):
+        return time.time() - self.started
+
+    def stage_frame(self):
+        # One row per stage, slowest first
+        rows = [(name, calls, total) for name, (calls, total) in self.stages.items()]
+        return pd.DataFrame(rows, columns=['stage', 'calls', 'seconds']).sort_values('seconds', ascending=False, ignore_index=True)
+
+    def cache_frame(self):
+        rows = [(name, hits, misses) for name, (hits, misses) in self.caches.items()]
+        return pd.DataFrame(rows, columns=['cache', 'hits', 'misses']).sort_values('cache', ignore_index=True)
+
+
+# Everything recorded since the process started (what the Prometheus endpoint serves)
+totals = Recorder()
+# Recorder of the current rerun, when its debug panel is on
+_current = contextvars.ContextVar('qos_oracle_rerun', default=None)
+_tracer = None
+
+
+def _recorders():
+    current = _current.get()
+    return (totals,) if current is None else (totals, current)
+
+
+def _otel_tracer():
+    global _tracer
+    if _tracer is None:
+        if OTEL and importlib.util.find_spec('opentelemetry') is not None:
+            _tracer = importlib.import_module('opentelemetry.trace').get_tracer('qos_oracle')
+        else:
+            _tracer = False
+    return _tracer
+
+
+@contextmanager
+def span(name):
+    # Time a stage; nested and concurrent spans are each counted in full
+    tracer = _otel_tracer()
+    started = time.perf_counter()
+    try:
+        if tracer:
+            with tracer.start_as_current_span(name):
+                yield
+        else:
+            yield
+    finally:
+        elapsed = time.perf_counter() - started
+        for recorder in _recorders():
+            recorder.add_stage(name, elapsed)
+
+
+def timed(name):
+    # Decorator running the whole function in a span
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count_cache(name, hit):
+    for recorder in _recorders():
+        recorder.add_cache(name, hit)
+
+
+def count_bytes(nbytes):
+    for recorder in _recorders():
+        recorder.add_bytes(nbytes)
+
+
+def observe_frame(name, df):
+    # Track the largest frame of the rerun; only measured while its debug panel is on, as a deep
+    # memory count walks every string
+    current = _current.get()
+    if current is not None:
+        current.add_frame(name, int(df.memory_usage(deep=True).sum()))
+    return df
+
+
+def start_rerun(enabled=True):
+    # Start recording a new rerun of an app (the script thread and every page fetch it starts) and
+    # return its Recorder, or None when not enabled. Also starts the metrics endpoint when configured.
+    if METRICS_PORT:
+        serve_metrics(int(METRICS_PORT))
+    recorder = Recorder() if enabled else None
+    _current.set(recorder)
+    return recorder
+
+
+def prometheus_text(recorder=None):
+    # Counters of a recorder (the process totals by default) in the Prometheus text format
+    recorder = recorder or totals
+    lines = [
+        '# HELP qos_oracle_stage_seconds_total Seconds spent in each instrumented stage.',
+        '# TYPE qos_oracle_stage_seconds_total counter',
+    ]
+    stages = sorted(recorder.stages.items())
+    lines += ['qos_oracle_stage_seconds_total{stage="%s"} %f' % (name, total) for name, (_, total) in stages]
+    lines += [
+        '# HELP qos_oracle_stage_calls_total Times each instrumented stage ran.',
+        '# TYPE qos_oracle_stage_calls_total counter',
+    ]
+    lines += ['qos_oracle_stage_calls_total{stage="%s"} %d' % (name, calls) for name, (calls, _) in stages]
+    lines += [
+        '# HELP qos_oracle_fetched_bytes_total Response bytes read from GraphQL endpoints.',
+        '# TYPE qos_oracle_fetched_bytes_total counter',
+        'qos_oracle_fetched_bytes_total %d' % recorder.bytes,
+        '# HELP qos_oracle_cache_requests_total Cache lookups by cache and result.',
+        '# TYPE qos_oracle_cache_requests_total counter',
+    ]
+    for name, (hits, misses) in sorted(recorder.caches.items()):
+        lines.append('qos_oracle_cache_requests_total{cache="%s",result="hit"} %d' % (name, hits))
+        lines.append('qos_oracle_cache_requests_total{cache="%s",result="miss"} %d' % (name, misses))
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server = None
+_metrics_lock = threading.Lock()
+
+
+def serve_metrics(port, host='0.0.0.0'):
+    # Serve prometheus_text() at /metrics on a background thread, once per process
+    global _metrics_server
+    with _metrics_lock:
+        if _metrics_server is None:
+            try:
+                _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                # another app process already serves this port
+                print(f"Metrics endpoint on port {port} not started: {e}")
+                _metrics_server = False
+                return None
+            _metrics_server.daemon_threads = True
+            threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+        return _metrics_server or None
@@ -0,0 +1,198 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from qos_oracle.instrument import timed
+from qos_oracle.rollup import BUCKET_SECONDS, WEIGHT
+from qos_oracle.sketch import merge, quantiles, unpack
+from qos_oracle.store import BUCKET_SIZES, bucket_start
+
+# Windows the leaderboard ranks over: seconds, and the stored rollup read for them (hourly buckets
+# up to a week, daily beyond, so a month stays a few rows per indexer and deployment)
+LEADERBOARD_WINDOWS = {
+    '24 hours': (86400, 'h'),
+    '7 days': (7 * 86400, 'h'),
+    '30 days': (30 * 86400, 'D'),
+}
+# Columns the leaderboard can be ranked by, True where lower is better
+RANKINGS = {
+    'p50_latency_ms': True,
+    'p95_latency_ms': True,
+    'p99_latency_ms': True,
+    'success_rate': False,
+    'blocks_behind': True,
+    'fee_per_query': True,
+    'query_count': False,
+}
+# Rollup columns kept per (indexer, deployment, bucket) row
+PART_COLUMNS = ['bucket', 'indexer_wallet', 'subgraph_deployment_ipfs_hash', 'indexer_url', WEIGHT,
+                'total_query_fees',
+                'proportion_indexer_200_responses__w', 'proportion_indexer_200_responses__wx',
+                'avg_indexer_blocks_behind__w', 'avg_indexer_blocks_behind__wx']
+LABELS = ('indexer_wallet', 'subgraph_deployment_ipfs_hash', 'indexer_url')
+
+
+def _indexer_sketches(rows):
+    # Stored latency sketches merged per (indexer, bucket): a frame of indexer_wallet, bucket and
+    # peak, and the float32 bins of each of its rows
+    keys = pd.DataFrame({'indexer_wallet': rows.column('indexer_wallet'), 'bucket': rows.column('bucket')})
+    grouped = keys.groupby(['indexer_wallet', 'bucket'], sort=False)
+    codes = grouped.ngroup().to_numpy()
+    frame = grouped.size().index.to_frame(index=False)
+    frame['peak'] = pd.Series(rows.column('peak'), dtype='float64').groupby(codes).max().reindex(range(len(frame))).to_numpy()
+    return frame, merge(codes, len(frame), unpack(rows.column('lo'), rows.column('bins'))).astype('float32')
+
+
+def _bucket_ranges(ranges, freq):
+    # [lower, upper) bucket starts holding the (lower, upper) end_epoch ranges, overlapping ones joined
+    size, _ = BUCKET_SIZES[freq]
+    joined = []
+    for lower, upper in sorted((bucket_start(lower, freq), bucket_start(upper, freq) + size) for lower, upper in ranges):
+        if joined and lower <= joined[-1][1]:
+            joined[-1][1] = max(joined[-1][1], upper)
+        else:
+            joined.append([lower, upper])
+    return joined
+
+
+def _outside(buckets, ranges):
+    # Mask of the buckets in none of the ranges
+    keep = np.ones(len(buckets), dtype=bool)
+    for lower, upper in ranges:
+        keep &= (buckets < lower) | (buckets >= upper)
+    return keep
+
+
+class Leaderboard:
+    # Every indexer ranked across all deployments from one stored rollup (hourly or daily) of a
+    # source and its latency sketches. The rows of the last `horizon` seconds are kept in memory
+    # (sketches already merged per indexer); a refresh asks the store's write log which end_epoch
+    # ranges were upserted since the last one and only re-reads the buckets holding them, wherever
+    # they fall (the newest bucket filling up, or older ones being backfilled).
+
+    def __init__(self, store, source, entity, freq, horizon):
+        self.store = store
+        self.source = source
+        self.entity = entity
+        self.freq = freq
+        self.horizon = horizon
+        self.newest = None
+        self.version = 0
+        self._seq = None
+        self._parts = None
+        self._sketches = None
+        self._lock = threading.Lock()
+
+    def _read(self, since, before=None):
+        # (rollup parts, sketches) of the buckets from epoch since to before
+        rows = self.store.rollup_rows(self.source, self.entity, self.freq, {}, since, before)
+        parts = pd.DataFrame({column: rows.column(column) for column in PART_COLUMNS})
+        return parts, _indexer_sketches(self.store.sketch_rows(self.source, self.entity, self.freq, {}, since, before))
+
+    @timed('leaderboard.refresh')
+    def refresh(self):
+        # Re-read the buckets written since the last refresh and drop those older than the horizon
+        with self._lock:
+            seq, ranges = self.store.writes_since(self.source, self.entity, self._seq)
+            if ranges is not None and not ranges:
+                self._seq = seq
+                return self
+            newest = self.store.newest_bucket(self.source, self.entity, self.freq)
+            if newest is None:
+                return self
+            oldest = newest + BUCKET_SECONDS[self.freq] - self.horizon
+            if self._parts is None or ranges is None:
+                parts, (frame, bins) = self._read(oldest)
+            else:
+                ranges = [(max(lower, oldest), upper) for lower, upper in _bucket_ranges(ranges, self.freq) if upper > oldest]
+                parts = [self._parts[_outside(self._parts['bucket'].to_numpy(), ranges)]]
+                frame, bins = self._sketches
+                kept = _outside(frame['bucket'].to_numpy(), ranges)
+                frames, binses = [frame[kept]], [bins[kept]]
+                for lower, upper in ranges:
+                    fresh_parts, (fresh_frame, fresh_bins) = self._read(lower, upper)
+                    parts.append(fresh_parts)
+                    frames.append(fresh_frame)
+                    binses.append(fresh_bins)
+                parts = pd.concat(parts, ignore_index=True)
+                frame, bins = pd.concat(frames, ignore_index=True), np.concatenate(binses)
+            for column in LABELS:
+                parts[column] = parts[column].astype('category')
+            self._parts = parts[parts['bucket'] >= oldest].reset_index(drop=True)
+            window = (frame['bucket'] >= oldest).to_numpy()
+            self._sketches = (frame[window].reset_index(drop=True), bins[window])
+            self._seq = seq
+            self.newest = newest
+            self.version += 1
+            return self
+
+    @timed('leaderboard')
+    def table(self, seconds, min_queries=0):
+        # One row per indexer over the last `seconds` of stored buckets (ending with the newest):
+        # queries, deployments served, p50/p95/p99 latency from its merged sketches, success rate
+        # (proportion of 200s weighted by queries), blocks behind and fee per query
+        with self._lock:
+            parts = self._parts
+            newest = self.newest
+            sketches = self._sketches
+        if parts is None or not len(parts):
+            return pd.DataFrame(columns=['indexer_wallet', 'indexer_url', 'deployments'] + list(RANKINGS))
+        frame, bins = sketches
+        start = newest + BUCKET_SECONDS[self.freq] - seconds
+        parts = parts[parts['bucket'] >= start]
+        codes, wallets = pd.factorize(parts['indexer_wallet'].astype(str))
+        # the indexers' sketches of the window, merged per indexer in the same order
+        window = (frame['bucket'] >= start).to_numpy()
+        sketch_codes = pd.Index(wallets).get_indexer(frame.loc[window, 'indexer_wallet'].astype(str))
+        matched = sketch_codes >= 0
+        merged = merge(sketch_codes[matched], len(wallets), bins[window][matched])
+        peaks = (frame.loc[window, 'peak'][matched].groupby(sketch_codes[matched]).max()
+                 .reindex(range(len(wallets))).to_numpy())
+        latency = quantiles(merged, (0.5, 0.95, 0.99), peaks)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sums = parts.groupby(codes).agg(
+                query_count=(WEIGHT, 'sum'),
+                fees=('total_query_fees', 'sum'),
+                success_w=('proportion_indexer_200_responses__w', 'sum'),
+                success_wx=('proportion_indexer_200_responses__wx', 'sum'),
+                behind_w=('avg_indexer_blocks_behind__w', 'sum'),
+                behind_wx=('avg_indexer_blocks_behind__wx', 'sum'),
+                deployments=('subgraph_deployment_ipfs_hash', 'nunique'),
+                indexer_url=('indexer_url', 'last'),
+            ).reindex(range(len(wallets)))
+            board = pd.DataFrame({
+                'indexer_wallet': wallets,
+                'indexer_url': sums['indexer_url'].astype(object).to_numpy(),
+                'deployments': sums['deployments'].to_numpy(),
+                'p50_latency_ms': latency[0.5],
+                'p95_latency_ms': latency[0.95],
+                'p99_latency_ms': latency[0.99],
+                'success_rate': (sums['success_wx'] / sums['success_w'].replace(0, np.nan)).to_numpy(),
+                'blocks_behind': (sums['behind_wx'] / sums['behind_w'].replace(0, np.nan)).to_numpy(),
+                'fee_per_query': (sums['fees'] / sums['query_count'].replace(0, np.nan)).to_numpy(),
+                'query_count': sums['query_count'].to_numpy(),
+            })
+        return board[board['query_count'] >= min_queries].reset_index(drop=True)
+
+
+def rank(board, by):
+    # Board sorted best first on `by` (missing values last), with a 1-based `rank` column
+    board = board.sort_values(by, ascending=RANKINGS[by], na_position='last', kind='stable', ignore_index=True)
+    board.insert(0, 'rank', np.arange(1, len(board) + 1))
+    return board
+
+
+_boards = {}
+_boards_lock = threading.Lock()
+
+
+def leaderboard_for(store, source, entity, freq):
+    # One Leaderboard per (store, source, entity, rollup) for the whole process, holding the
+    # longest window that reads this rollup
+    horizon = max(seconds for seconds, window_freq in LEADERBOARD_WINDOWS.values() if window_freq == freq)
+    key = (store.path, source, entity, freq)
+    with _boards_lock:
+        if key not in _boards:
+            _boards[key] = Leaderboard(store, source, entity, freq, horizon)
+        return _boards[key]
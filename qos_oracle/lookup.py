@@ -0,0 +1,115 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    # Type-ahead index over names: prefix matches come from a sorted list (binary search) and
+    # substring matches from a trigram index, so a search never scans every name.
+    # Results keep the order the names were given in (signal order for the catalog).
+
+    def __init__(self, names):
+        self.names = []
+        self.positions = {}
+        for name in names:
+            if name is not None and name not in self.positions:
+                self.positions[name] = len(self.names)
+                self.names.append(name)
+        self._sorted = sorted((name.lower(), position) for position, name in enumerate(self.names))
+        self._keys = [key for key, _ in self._sorted]
+        self._trigrams = defaultdict(set)
+        for position, name in enumerate(self.names):
+            for trigram in _trigrams(name.lower()):
+                self._trigrams[trigram].add(position)
+
+    def prefix(self, text):
+        # Positions of names starting with text (case insensitive)
+        text = text.lower()
+        start = bisect_left(self._keys, text)
+        positions = []
+        for key, position in self._sorted[start:]:
+            if not key.startswith(text):
+                break
+            positions.append(position)
+        return positions
+
+    def search(self, text, limit=None):
+        # Names matching text, prefix matches first, then names containing it
+        text = text.strip().lower()
+        if not text:
+            return self.names[:limit]
+        found = sorted(self.prefix(text))
+        if len(text) >= 3:
+            candidates = None
+            # start from the rarest trigram so the intersection stays small
+            for trigram in sorted(_trigrams(text), key=lambda trigram: len(self._trigrams.get(trigram, ()))):
+                positions = self._trigrams.get(trigram, set())
+                candidates = set(positions) if candidates is None else candidates & positions
+                if not candidates:
+                    break
+            seen = set(found)
+            found += sorted(position for position in candidates or ()
+                            if position not in seen and text in self.names[position].lower())
+        return [self.names[position] for position in found][:limit]
+
+
+class IndexerDirectory:
+    # Indexers with O(1) lookups of their list position and of wallet -> url
+
+    def __init__(self, wallets, urls=None):
+        self.wallets = list(wallets)
+        self.positions = {wallet: position for position, wallet in enumerate(self.wallets)}
+        self.urls = dict(urls or {})
+
+    def position(self, wallet, default=0):
+        return self.positions.get(wallet, default)
+
+    def label(self, wallet):
+        # "url (wallet)" for a selectbox, or just the wallet when its url isn't known
+        url = self.urls.get(wallet)
+        return url + ' (' + wallet + ')' if url else wallet
+
+    @classmethod
+    def from_frame(cls, df, wallet='indexer_wallet', url='indexer_url'):
+        # Directory of the indexers present in a frame of data points, in order of first appearance
+        pairs = df[[wallet, url]].drop_duplicates(subset=[wallet])
+        return cls(pairs[wallet].tolist(), zip(pairs[wallet], pairs[url]))
+
+
+class LabelDictionary:
+    # Append-only dictionary of display labels, shared by every catalog snapshot, so a label keeps
+    # the same code across refreshes and every distinct key is only ever looked up once
+
+    def __init__(self):
+        self.labels = []
+        self.codes = {}
+        self._lock = threading.Lock()
+
+    def code(self, label):
+        code = self.codes.get(label)
+        if code is None:
+            with self._lock:
+                code = self.codes.get(label)
+                if code is None:
+                    code = self.codes[label] = len(self.labels)
+                    self.labels.append(label)
+        return code
+
+    def encode(self, keys, label_for):
+        # Categorical of label_for(key) for every value of keys, looking up each distinct key once
+        # and then mapping the codes in a single vectorized take. Missing keys stay missing. Only the
+        # labels present are kept as categories, so a frame (or a page of it sent to the browser)
+        # doesn't carry every label seen in the process.
+        keys = keys if isinstance(keys.dtype, pd.CategoricalDtype) else keys.astype('category')
+        # one extra slot so code -1 (missing) maps to -1
+        table = np.array([self.code(label_for(key)) for key in keys.cat.categories] + [-1], dtype='int64')
+        codes = table[keys.cat.codes.to_numpy()]
+        labels = pd.Categorical.from_codes(codes, categories=pd.Index(list(self.labels)))
+        return pd.Series(labels.remove_unused_categories(), index=keys.index, name=keys.name)
@@ -0,0 +1,71 @@
+from qos_oracle.parallel import PAGE_SIZE, format_where
+from qos_oracle.schema import Columns, as_columns
+
+
+def build_query(entity, fields, where, order_by, order_direction, first=PAGE_SIZE):
+    # Build a GraphQL query for one page of `entity`
+    return ('{\n  ' + entity + '(orderBy: ' + order_by + ', orderDirection: ' + order_direction
+            + ', where:{' + format_where(where) + '}, first: ' + str(first) + '){\n    '
+            + '\n    '.join(fields) + '\n    }\n}')
+
+
+def iter_keyset(run_query, entity, fields, where, lower=None, upper=None, cursor='end_epoch'):
+    # Yield pages of `entity` rows, newest `cursor` first, with lower <= cursor < upper (None = unbounded).
+    # run_query(query) posts a GraphQL query and returns its `data` dict; pages are yielded as Columns.
+    #
+    # Pages are keyed on the composite (cursor, id) position instead of `skip`, so every page costs the
+    # same however deep it is, no row is returned twice and a page that comes back short ends the pull.
+    # A full page may stop part way through its oldest cursor value; those rows are held back and the
+    # next page starts over at that value (cursor values are integers), so it costs no extra query.
+    # Only when a single value fills a whole page is it read separately in `id` order, which also copes
+    # with more than 1,000 rows sharing it.
+    fields = _page_fields(fields, cursor)
+    while True:
+        filters = dict(where)
+        if lower is not None:
+            filters[cursor + '_gte'] = lower
+        if upper is not None:
+            filters[cursor + '_lt'] = upper
+        page = as_columns(run_query(build_query(entity, fields, filters, cursor, 'desc'))[entity], fields)
+        if len(page) < PAGE_SIZE:
+            if len(page):
+                yield page
+            return
+        epochs = page[cursor]
+        boundary = int(epochs[-1])
+        if int(epochs[0]) != boundary:
+            yield page.take(epochs != boundary)
+            upper = boundary + 1
+            continue
+        # read every row at the boundary value, paging on id
+        last_id = None
+        while True:
+            filters = dict(where)
+            filters[cursor] = boundary
+            if last_id is not None:
+                filters['id_gt'] = last_id
+            drained = as_columns(run_query(build_query(entity, fields, filters, 'id', 'asc'))[entity], fields)
+            if len(drained):
+                yield drained
+            if len(drained) < PAGE_SIZE:
+                break
+            last_id = drained['id'][-1]
+        upper = boundary
+
+
+def keyset_rows(run_query, entity, fields, where, lower=None, upper=None, limit=None, cursor='end_epoch'):
+    # Collect rows from iter_keyset into one Columns, stopping as soon as `limit` rows have been read
+    pages = []
+    read = 0
+    for page in iter_keyset(run_query, entity, fields, where, lower, upper, cursor):
+        pages.append(page)
+        read += len(page)
+        if limit is not None and read >= limit:
+            break
+    rows = Columns.concat(pages, _page_fields(fields, cursor))
+    return rows if limit is None else rows.head(limit)
+
+
+def _page_fields(fields, cursor):
+    # Fields of the pages iter_keyset yields
+    return list(fields) + [key for key in ('id', cursor) if key not in fields]
@@ -0,0 +1,75 @@
+import contextvars
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from qos_oracle.schema import Columns
+
+# Rows returned per GraphQL page (graph-node caps `first` at 1000, other endpoints may cap lower)
+PAGE_SIZE = int(os.environ.get('QOS_ORACLE_PAGE_SIZE', 1000))
+# Number of pages requested from the oracle at the same time
+MAX_WORKERS = 8
+# Length of one QoS oracle epoch in seconds
+EPOCH_SECONDS = 300
+
+
+def format_where(filters):
+    # Render a dict of filters as the inside of a GraphQL `where: {...}` block
+    return ', '.join(key + ': ' + json.dumps(value) for key, value in filters.items())
+
+
+def fetch_ordered(fetch, args, max_workers=MAX_WORKERS):
+    # Call fetch(arg) for every arg on a bounded thread pool.
+    # Results come back in the order of args, not in completion order, so merging them is deterministic.
+    # Each call runs in a copy of the caller's context, so its spans count towards the caller's rerun.
+    args = list(args)
+    if len(args) <= 1 or max_workers <= 1:
+        return [fetch(arg) for arg in args]
+    contexts = [contextvars.copy_context() for _ in args]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(args))) as pool:
+        return list(pool.map(lambda context, arg: context.run(fetch, arg), contexts, args))
+
+
+def epoch_windows(upper, span, count):
+    # Split the epochs below `upper` into `count` windows of `span` seconds, newest first.
+    # Each window is (lower, upper) with lower inclusive and upper exclusive.
+    return [(upper - (k + 1) * span, upper - k * span) for k in range(count)]
+
+
+def pull_history(pull_range, nrows, max_workers=MAX_WORKERS, cursor='end_epoch'):
+    # Pull up to nrows rows, newest first, fetching `cursor` windows in parallel. Returns (rows, ended):
+    # ended is True only when an unbounded pull towards older rows came back short, i.e. the oracle has
+    # nothing older; a window coming back empty (a gap in the data) ends nothing.
+    # pull_range(lower, upper, limit) must return Columns of at most `limit` rows, newest first, with
+    # lower <= cursor < upper (None = unbounded) and no row repeated.
+
+    # Probe the newest page serially to learn where the data starts and how dense it is
+    probe = pull_range(None, None, PAGE_SIZE)
+    if len(probe) < PAGE_SIZE or nrows <= PAGE_SIZE:
+        return probe.head(nrows), len(probe) < PAGE_SIZE
+    epochs = probe[cursor]
+    newest = int(epochs[0])
+    boundary = int(epochs[-1])
+    # the boundary value may continue past this page, so it is re-read by the first window
+    head = probe.take(epochs > boundary)
+    # one window is roughly one page worth of epochs
+    span = max(newest - boundary, EPOCH_SECONDS)
+    remaining = nrows - len(head)
+    windows = epoch_windows(boundary + 1, span, math.ceil(remaining / PAGE_SIZE))
+    pages = fetch_ordered(lambda window: pull_range(window[0], window[1], remaining), windows, max_workers)
+    parts = [head] + pages
+    read = sum(len(part) for part in parts)
+    ended = False
+    # sparser history than the probe suggested (or a gap over the last windows): keep paging below
+    # the last window, only a short read there means the history is over
+    if read < nrows:
+        older = pull_range(None, windows[-1][0], nrows - read)
+        parts.append(older)
+        ended = len(older) < nrows - read
+    return Columns.concat(parts, probe.fields).head(nrows), ended
+
+
+def pull_windowed(pull_range, nrows, max_workers=MAX_WORKERS, cursor='end_epoch'):
+    # Rows of pull_history, without whether the history ended
+    return pull_history(pull_range, nrows, max_workers, cursor)[0]
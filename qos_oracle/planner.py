@@ -0,0 +1,108 @@
+import math
+import threading
+import time
+
+from qos_oracle.client import post_graphql
+from qos_oracle.queries import QUERY_FIELDS_QUERY, TYPE_FIELDS_QUERY
+from qos_oracle.rollup import BUCKET_SECONDS
+
+# Entity of raw 5 minute data points
+RAW_ENTITY = 'indexerDataPoints'
+# Pre-aggregated entities an oracle may expose, coarsest first: entity, bucket length in seconds,
+# the field holding the bucket start and how the apps describe it
+AGGREGATES = [
+    ('indexerDailyDataPoints', 86400, 'dayStart', 'Daily'),
+    ('indexerHourlyDataPoints', 3600, 'hourStart', 'Hourly'),
+]
+# Fields every view needs: the deployment and indexer it groups by and the weight of its averages
+REQUIRED_FIELDS = ('subgraph_deployment_ipfs_hash', 'indexer_url', 'query_count')
+# Seconds the entities an endpoint exposes are remembered
+SCHEMA_TTL = 3600
+# Whole buckets of the chosen interval every pull covers at least, once the partly covered first
+# and last buckets are dropped
+MIN_BUCKETS = 3
+
+_schemas = {}
+_schemas_lock = threading.Lock()
+
+
+def _type_name(entity):
+    # indexerDailyDataPoints -> IndexerDailyDataPoint
+    return entity[0].upper() + entity[1:-1]
+
+
+def _fetch_schema(url):
+    # {entity: set of field names} for every aggregate entity the endpoint exposes
+    exposed = {field['name'] for field in post_graphql(url, QUERY_FIELDS_QUERY)['__type']['fields']}
+    schema = {}
+    for entity, _, _, _ in AGGREGATES:
+        if entity in exposed:
+            fields = post_graphql(url, TYPE_FIELDS_QUERY % _type_name(entity))['__type']['fields']
+            schema[entity] = {field['name'] for field in fields}
+    return schema
+
+
+def exposed_aggregates(url):
+    # Aggregate entities of an endpoint (introspected once per SCHEMA_TTL). An endpoint that can't
+    # be introspected is treated as exposing none, so views fall back to raw points.
+    cached = _schemas.get(url)
+    if cached is not None and time.time() - cached[0] < SCHEMA_TTL:
+        return cached[1]
+    with _schemas_lock:
+        try:
+            schema = _fetch_schema(url)
+        except Exception as e:
+            print(f"Introspection of {url} failed, using raw data points: {e}")
+            # try again in a minute rather than on every page view
+            _schemas[url] = (time.time() - SCHEMA_TTL + 60, {})
+            return {}
+        _schemas[url] = (time.time(), schema)
+        return schema
+
+
+class Plan:
+    # Upstream entity chosen to answer a view: what to pull, which of the wanted fields it has,
+    # how many seconds one of its rows covers and the filter that selects one indexer
+
+    def __init__(self, entity, fields, bucket, start_field, label, indexer_filter='indexer'):
+        self.entity = entity
+        self.fields = fields
+        self.bucket = bucket
+        self.start_field = start_field
+        self.label = label
+        self.indexer_filter = indexer_filter
+
+    @property
+    def raw(self):
+        return self.entity == RAW_ENTITY
+
+    def rows_for(self, raw_rows, series=1, view=None):
+        # Rows of this entity covering the time span raw_rows raw 5 minute rows of `series` indexer
+        # and deployment pairs would, and at least MIN_BUCKETS whole buckets of `view` seconds
+        span = raw_rows // max(series, 1) * BUCKET_SECONDS['5min']
+        if view is not None:
+            span = max(span, (MIN_BUCKETS + 2) * view)
+        return max(math.ceil(span / self.bucket), 1) * max(series, 1)
+
+
+def plan_view(url, freq, fields, required=()):
+    # Coarsest upstream entity whose buckets tile `freq` (a rollup frequency, None for raw points)
+    # and that has every required field (plus REQUIRED_FIELDS), keeping the wanted fields it has.
+    # Falls back to raw data points for fine-grained views.
+    raw = Plan(RAW_ENTITY, list(fields), BUCKET_SECONDS['5min'], 'end_epoch', '5 Minute')
+    if freq is None or freq not in BUCKET_SECONDS:
+        return raw
+    schema = exposed_aggregates(url)
+    for entity, bucket, start_field, label in AGGREGATES:
+        # it must page on (end_epoch, id) and have its bucket start and every field the view reads
+        needed = {'id', 'end_epoch', start_field, *REQUIRED_FIELDS, *required}
+        tiles = bucket <= BUCKET_SECONDS[freq] and BUCKET_SECONDS[freq] % bucket == 0
+        if entity in schema and needed <= schema[entity] and tiles:
+            available = schema[entity]
+            wanted = [field for field in fields if field in available]
+            if start_field not in wanted:
+                wanted.append(start_field)
+            # aggregates carry the wallet as a plain field rather than the indexer relation
+            indexer_filter = 'indexer_wallet' if 'indexer_wallet' in available else 'indexer'
+            return Plan(entity, wanted, bucket, start_field, label, indexer_filter)
+    return raw
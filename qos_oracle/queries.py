@@ -0,0 +1,37 @@
+# GraphQL queries the dashboards send (data point pages are built by pagination.build_query)
+
+# Indexers known to the QoS oracle
+INDEXERS_QUERY = '''
+{
+  indexers(first: 1000) {
+    id
+  }
+}
+'''
+
+# One page of active subgraphs of a network subgraph, keyset paginated on id (%s is the where filter)
+SUBGRAPHS_QUERY = '''
+query {
+  subgraphs(
+    where: {%s}
+    first: %d
+    orderBy: id
+    orderDirection: asc
+  ) {
+    id
+    displayName
+    signalledTokens
+    creatorAddress
+    versions(first: 1, orderBy: createdAt, orderDirection: desc) {
+      subgraphDeployment {
+        ipfsHash
+      }
+    }
+  }
+}
+'''
+
+# Root fields of an endpoint, to find the entities it exposes
+QUERY_FIELDS_QUERY = '{ __type(name: "Query") { fields { name } } }'
+# Fields of one entity type (%s is the type name)
+TYPE_FIELDS_QUERY = '{ __type(name: "%s") { fields { name } } }'
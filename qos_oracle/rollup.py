@@ -0,0 +1,166 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from qos_oracle.instrument import count_cache, timed
+
+# Weight used for averages and proportions
+WEIGHT = 'query_count'
+
+# How every metric combines across the data points that fall in one bucket
+METRICS = {
+    'query_count': 'sum',
+    'num_indexer_200_responses': 'sum',
+    'total_query_fees': 'sum',
+    'max_indexer_blocks_behind': 'max',
+    'max_indexer_latency_ms': 'max',
+    'max_query_fee': 'max',
+    'avg_indexer_blocks_behind': 'mean',
+    'avg_indexer_latency_ms': 'mean',
+    'avg_query_fee': 'mean',
+    'proportion_indexer_200_responses': 'mean',
+    'stdev_indexer_latency_ms': 'stdev',
+}
+# Mean each stdev is taken around, needed to pool it across buckets
+STDEV_MEANS = {'stdev_indexer_latency_ms': 'avg_indexer_latency_ms'}
+
+# Bucket sizes offered by the apps, as pandas frequencies (weeks start on Monday)
+BUCKETS = {'5 minutes': '5min', '1 hour': 'h', '1 day': 'D', '1 week': 'W-MON'}
+# Bucket length in seconds for each frequency
+BUCKET_SECONDS = {'5min': 300, 'h': 3600, 'D': 86400, 'W-MON': 604800}
+# Most points a chart can show per series, roughly its width in pixels
+CHART_POINTS = 1000
+
+
+def component_aggs(metrics):
+    # Additive components kept per bucket for each metric and how they combine across buckets.
+    # Sums and maxes are kept as is; weighted means keep the weight and weighted sum; stdevs also
+    # keep the weighted mean and weighted sum of squares so they can be pooled later.
+    aggs = {}
+    for metric in metrics:
+        kind = METRICS[metric]
+        if kind in ('sum', 'max'):
+            aggs[metric] = kind
+        elif kind == 'mean':
+            aggs[metric + '__w'] = 'sum'
+            aggs[metric + '__wx'] = 'sum'
+        else:
+            aggs[metric + '__w'] = 'sum'
+            aggs[metric + '__wm'] = 'sum'
+            aggs[metric + '__wss'] = 'sum'
+    return aggs
+
+
+def components(df, metrics):
+    # Per row component columns for the given metrics
+    weight = df[WEIGHT].astype('float64').fillna(0.0) if WEIGHT in df.columns else pd.Series(1.0, index=df.index)
+    columns = {}
+    for metric in metrics:
+        kind = METRICS[metric]
+        values = df[metric].astype('float64')
+        if kind in ('sum', 'max'):
+            columns[metric] = values
+            continue
+        # weights only count where the metric is present
+        w = weight.where(values.notna(), 0.0)
+        columns[metric + '__w'] = w
+        if kind == 'mean':
+            columns[metric + '__wx'] = values * w
+        else:
+            mean = df[STDEV_MEANS[metric]].astype('float64')
+            # pooled variance: sum of w * (s^2 + m^2), minus the square of the pooled mean
+            columns[metric + '__wm'] = mean * w
+            columns[metric + '__wss'] = (values ** 2 + mean ** 2) * w
+    return columns
+
+
+def finalize(grouped, metrics):
+    # Turn aggregated components back into metric values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for metric in metrics:
+            kind = METRICS[metric]
+            if kind == 'mean':
+                grouped[metric] = grouped[metric + '__wx'] / grouped[metric + '__w'].replace(0, np.nan)
+            elif kind == 'stdev':
+                w = grouped[metric + '__w'].replace(0, np.nan)
+                mean = grouped[metric + '__wm'] / w
+                grouped[metric] = np.sqrt((grouped[metric + '__wss'] / w - mean ** 2).clip(lower=0))
+    return grouped[metrics]
+
+
+def _complete(result, time_col, complete_only):
+    if complete_only and not result.empty:
+        edges = [result[time_col].min(), result[time_col].max()]
+        result = result[~result[time_col].isin(edges)]
+    return result.reset_index(drop=True)
+
+
+@timed('rollup')
+def rollup(df, freq, by=(), time_col='date', complete_only=True):
+    # Aggregate every metric present in df into `freq` buckets per `by` group in one groupby pass.
+    # Sums and maxes combine directly, averages and proportions are means weighted by query_count
+    # and stdevs are pooled around the weighted mean. With complete_only the first and last buckets,
+    # which may only be partly covered by the pull, are dropped.
+    by = list(by)
+    metrics = [metric for metric in METRICS if metric in df.columns]
+    work = pd.DataFrame({time_col: df[time_col], **{key: df[key] for key in by}, **components(df, metrics)})
+    if not metrics:
+        return work[[time_col] + by].drop_duplicates()
+    grouper = pd.Grouper(key=time_col, freq=freq, label='left', closed='left')
+    grouped = work.groupby([grouper] + by, observed=True, sort=True).agg(component_aggs(metrics))
+    return _complete(finalize(grouped, metrics).reset_index(), time_col, complete_only)
+
+
+@timed('rollup')
+def combine(parts, by=(), time_col='date', complete_only=True):
+    # Regroup already bucketed components (such as the store's rollup tables) by time and `by`
+    by = list(by)
+    metrics = [metric for metric in METRICS if all(column in parts.columns for column in component_aggs([metric]))]
+    grouped = parts.groupby([time_col] + by, observed=True, sort=True).agg(component_aggs(metrics))
+    return _complete(finalize(grouped, metrics).reset_index(), time_col, complete_only)
+
+
+def choose_bucket(start_epoch, end_epoch, max_points=CHART_POINTS):
+    # Finest bucket size that keeps a series between two epochs within max_points, so long
+    # windows read pre-aggregated rows instead of every 5 minute point
+    span = max(int(end_epoch) - int(start_epoch), 0)
+    for interval, freq in BUCKETS.items():
+        if span / BUCKET_SECONDS[freq] <= max_points:
+            return interval
+    return list(BUCKETS)[-1]
+
+
+class RollupCache:
+    # Small LRU of rollups keyed by the caller (scope, bucket size and data version), so switching
+    # the metric or chart type on a rerun reuses the rollup instead of recomputing it
+
+    def __init__(self, maxsize=32, name='rollups'):
+        self.maxsize = maxsize
+        self.name = name
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        # Cached result for key, calling compute() to build it on a miss
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                count_cache(self.name, True)
+                return self._items[key]
+        count_cache(self.name, False)
+        result = compute()
+        with self._lock:
+            self._items[key] = result
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+rollups = RollupCache()
+
@@ -0,0 +1,167 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from qos_oracle.instrument import timed
+
+# Fields pulled for every indexerDataPoint (5 minute buckets)
+DATAPOINT_FIELDS = ['id', 'end_epoch', 'indexer_url', 'indexer_wallet', 'subgraph_deployment_ipfs_hash',
+                    'avg_indexer_blocks_behind', 'avg_indexer_latency_ms', 'avg_query_fee',
+                    'max_indexer_blocks_behind', 'max_indexer_latency_ms', 'max_query_fee',
+                    'num_indexer_200_responses', 'proportion_indexer_200_responses', 'query_count',
+                    'start_epoch', 'stdev_indexer_latency_ms', 'total_query_fees']
+
+# Fields pulled for every indexerDailyDataPoint
+DAILY_FIELDS = ['id', 'end_epoch', 'gateway_id', 'chain_id', 'dayStart', 'dayEnd', 'indexer_url', 'indexer_wallet',
+                'subgraph_deployment_ipfs_hash', 'avg_indexer_blocks_behind', 'avg_indexer_latency_ms', 'avg_query_fee',
+                'max_indexer_blocks_behind', 'max_indexer_latency_ms', 'max_query_fee', 'num_indexer_200_responses',
+                'proportion_indexer_200_responses', 'query_count', 'start_epoch', 'total_query_fees']
+
+# dtype of every field the apps pull. Epochs and counts are int64, fees stay float64 so sums keep
+# their precision, per bucket latency/blocks/proportion fit in float32 and the strings repeated on
+# every row (wallets, urls, hashes, gateway/chain ids) are dictionary encoded as categoricals.
+SCHEMA = {
+    'id': 'object',
+    'end_epoch': 'int64',
+    'start_epoch': 'int64',
+    'dayStart': 'int64',
+    'dayEnd': 'int64',
+    'gateway_id': 'category',
+    'chain_id': 'category',
+    'indexer_url': 'category',
+    'indexer_wallet': 'category',
+    'subgraph_deployment_ipfs_hash': 'category',
+    'query_count': 'int64',
+    'num_indexer_200_responses': 'int64',
+    'proportion_indexer_200_responses': 'float32',
+    'avg_indexer_blocks_behind': 'float32',
+    'max_indexer_blocks_behind': 'float32',
+    'avg_indexer_latency_ms': 'float32',
+    'max_indexer_latency_ms': 'float32',
+    'stdev_indexer_latency_ms': 'float32',
+    'avg_query_fee': 'float64',
+    'max_query_fee': 'float64',
+    'total_query_fees': 'float64',
+}
+
+
+# Schema dtypes parsed into numpy arrays as soon as a page is decoded
+NUMERIC_DTYPES = {'int64', 'float32', 'float64'}
+
+
+def _array(values, dtype):
+    # One column of a page as a numpy array: numbers parsed once (wider than their schema dtype, the
+    # store keeps full precision), everything else as objects
+    if dtype in NUMERIC_DTYPES:
+        try:
+            return np.array(values, dtype='int64' if dtype == 'int64' else 'float64')
+        except (TypeError, ValueError, OverflowError):
+            # missing or malformed values, NaN where they can't be parsed
+            return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy()
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+class Columns:
+    # Rows of one entity held as one array per field instead of a dict per row. GraphQL pages are
+    # turned into Columns as soon as they are decoded and stay columnar through pagination, the
+    # store and into the DataFrame, so no per-row objects outlive the page they came in.
+
+    def __init__(self, data, length=0):
+        self.data = data
+        self.length = len(next(iter(data.values()))) if data else length
+
+    @classmethod
+    def from_rows(cls, rows, fields=None, schema=SCHEMA):
+        # From a list of dicts (one decoded GraphQL page)
+        if fields is None:
+            fields = list(rows[0]) if rows else []
+        return cls({field: _array([row.get(field) for row in rows], schema.get(field)) for field in fields}, len(rows))
+
+    @classmethod
+    def from_tuples(cls, rows, fields, schema=SCHEMA):
+        # From a list of tuples in fields order (database rows)
+        values = list(zip(*rows)) if rows else [()] * len(fields)
+        return cls({field: _array(list(column), schema.get(field)) for field, column in zip(fields, values)}, len(rows))
+
+    @classmethod
+    def concat(cls, parts, fields=None):
+        # One Columns of every part in order; fields defaults to those of the first part
+        parts = [part for part in parts if len(part)]
+        if fields is None:
+            fields = parts[0].fields if parts else []
+        if not parts:
+            return cls({field: _array([], SCHEMA.get(field)) for field in fields})
+        if len(parts) == 1 and parts[0].fields == list(fields):
+            return parts[0]
+        return cls({field: np.concatenate([part.column(field) for part in parts]) for field in fields})
+
+    @property
+    def fields(self):
+        return list(self.data)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, field):
+        return self.data[field]
+
+    def column(self, field):
+        # A field's array, all missing (None) when this page doesn't have the field
+        if field in self.data:
+            return self.data[field]
+        return np.full(self.length, None, dtype=object)
+
+    def take(self, index):
+        # Rows selected by a slice, positions or a boolean mask
+        if isinstance(index, slice) and index.indices(self.length) == (0, self.length, 1):
+            return self
+        return Columns({field: values[index] for field, values in self.data.items()})
+
+    def head(self, n):
+        return self.take(slice(0, n))
+
+    def drop(self, field):
+        return Columns({name: values for name, values in self.data.items() if name != field}, self.length)
+
+    def tuples(self, fields, prefix=()):
+        # Row tuples (prefix + the fields' values as Python objects), for database inserts
+        return zip(*([itertools.repeat(value, self.length) for value in prefix]
+                     + [self.column(field).tolist() for field in fields]))
+
+
+def as_columns(rows, fields=None):
+    # Columns of a page that may still be a list of dicts
+    return rows if isinstance(rows, Columns) else Columns.from_rows(rows, fields)
+
+
+def cast_column(values, dtype):
+    # Convert one column to its schema dtype
+    if dtype == 'category':
+        return values.astype('category')
+    if dtype == 'object':
+        return values
+    values = pd.to_numeric(values, errors='coerce')
+    if dtype == 'int64' and values.isna().any():
+        # missing values can't live in int64, keep them as NaN
+        return values.astype('float64')
+    return values.astype(dtype)
+
+
+def apply_schema(df, schema=SCHEMA):
+    # Cast every known column of df to its schema dtype in place, once, at ingest
+    for column in df.columns:
+        dtype = schema.get(column)
+        if dtype is not None and str(df[column].dtype) != dtype:
+            df[column] = cast_column(df[column], dtype)
+    return df
+
+
+@timed('frame')
+def to_frame(rows, fields, schema=SCHEMA):
+    # Build a typed DataFrame from Columns (or a list of dicts), with a column for every field even when empty
+    if isinstance(rows, Columns):
+        return apply_schema(pd.DataFrame({field: rows.column(field) for field in fields}, columns=fields), schema)
+    return apply_schema(pd.DataFrame(rows, columns=fields), schema)
@@ -0,0 +1,151 @@
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+from qos_oracle.instrument import timed
+
+# Relative accuracy of a latency read from a sketch: bins are log spaced (as in DDSketch) so every
+# value is known to within ALPHA of itself, and sketches merge by adding their bins
+ALPHA = 0.05
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+# Latencies (ms) below MIN_MS share the first bin and those above MAX_MS the last
+MIN_MS = 1.0
+MAX_MS = 600000.0
+NBINS = int(math.ceil(math.log(MAX_MS / MIN_MS) / math.log(GAMMA))) + 1
+# Upper edge of every bin
+EDGES = MIN_MS * GAMMA ** np.arange(NBINS)
+# Quantiles reported by default
+QUANTILES = (0.5, 0.9, 0.99)
+# Bins holding less than this share of a sketch's queries are dropped when it is stored
+TRIM = 1e-4
+# Data points turned into bins at a time, bounding the (points x bins) work array
+CHUNK = 4096
+
+_LOG_EDGES = np.log(EDGES)
+
+
+def _normal_cdf(x):
+    # Standard normal CDF (Abramowitz & Stegun 7.1.26, within 1e-7), vectorized and NaN safe
+    z = np.abs(x) / math.sqrt(2)
+    t = 1 / (1 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1 - poly * np.exp(-z * z)
+    return 0.5 * (1 + np.sign(x) * erf)
+
+
+def _max_z(count):
+    # Standard normal quantile where the largest of `count` draws lands, computed once per distinct
+    # count (points share a handful of counts) and 0 below one query
+    counts, inverse = np.unique(count, return_inverse=True)
+    normal = NormalDist()
+    z = np.array([normal.inv_cdf(1 - 1 / (n + 1)) if n >= 1 else 0.0 for n in counts.tolist()])
+    return z[inverse.reshape(-1)]
+
+
+def _sigma(count, mean, stdev, peak):
+    # Log-space spread of each point's latencies, modelled as lognormal around its mean: matched to
+    # the stdev when there is one, otherwise so that the max is where the largest of `count`
+    # queries would land; 0 (every query at the mean) when neither is known
+    with np.errstate(divide='ignore', invalid='ignore'):
+        from_stdev = np.sqrt(np.log1p((stdev / mean) ** 2))
+        z = _max_z(count)
+        spread = 2 * np.log(peak / mean)
+        from_peak = np.where(z * z >= spread, z - np.sqrt(np.maximum(z * z - spread, 0)), z)
+    sigma = np.where(np.isfinite(from_stdev) & (stdev > 0), from_stdev,
+                     np.where(np.isfinite(spread) & (peak > mean), from_peak, 0.0))
+    return np.nan_to_num(sigma)
+
+
+def point_bins(count, mean, stdev=None, peak=None):
+    # (points x NBINS) queries per bin for data points given as arrays of query count, mean, stdev
+    # and max latency (stdev and max may be missing). Each point is a lognormal with its mean and
+    # spread, cut at its max: whatever lies above the max is counted in the max's bin.
+    count = np.nan_to_num(np.asarray(count, dtype='float64')).clip(min=0)
+    mean = np.asarray(mean, dtype='float64')
+    stdev = np.full(len(count), np.nan) if stdev is None else np.asarray(stdev, dtype='float64')
+    peak = np.full(len(count), np.nan) if peak is None else np.asarray(peak, dtype='float64')
+    sigma = _sigma(count, mean, stdev, peak)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mu = np.log(mean) - sigma ** 2 / 2
+        x = (_LOG_EDGES[None, :] - mu[:, None]) / sigma[:, None]
+        cdf = np.where(sigma[:, None] > 0, _normal_cdf(x), (EDGES[None, :] >= mean[:, None]).astype('float64'))
+    cdf[EDGES[None, :] >= peak[:, None]] = 1.0
+    cdf[:, -1] = 1.0
+    bins = np.diff(cdf, axis=1, prepend=0.0) * count[:, None]
+    bins[~((count > 0) & (mean > 0))] = 0.0
+    return bins
+
+
+@timed('sketch')
+def group_bins(codes, ngroups, count, mean, stdev=None, peak=None):
+    # (ngroups x NBINS) merged sketch of the data points of every group code, a chunk at a time
+    merged = np.zeros((ngroups, NBINS))
+    codes = np.asarray(codes)
+    for start in range(0, len(codes), CHUNK):
+        part = slice(start, start + CHUNK)
+        bins = point_bins(count[part], mean[part], None if stdev is None else stdev[part],
+                          None if peak is None else peak[part])
+        merged += merge(codes[part], ngroups, bins)
+    return merged
+
+
+def merge(codes, ngroups, bins):
+    # (ngroups x NBINS) sum of the sketches (rows of bins) sharing a group code
+    merged = np.zeros((ngroups, bins.shape[1]))
+    if len(codes):
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        merged[sorted_codes[starts]] = np.add.reduceat(bins[order], starts, axis=0)
+    return merged
+
+
+def quantiles(bins, qs=QUANTILES, peak=None):
+    # {q: value of the q quantile of every sketch (row of bins)}, capped at the sketch's max when
+    # known and NaN for an empty sketch. Within its bin a quantile is interpolated in log space on
+    # the bin's share of queries, so close sketches don't all land on the same bin value.
+    cumulative = np.cumsum(bins, axis=1)
+    total = cumulative[:, -1]
+    rows = np.arange(len(bins))
+    result = {}
+    for q in qs:
+        target = q * total
+        index = np.minimum((cumulative < target[:, None]).sum(axis=1), NBINS - 1)
+        below = cumulative[rows, index] - bins[rows, index]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            share = np.nan_to_num((target - below) / bins[rows, index], nan=0.5).clip(0, 1)
+        values = EDGES[index] * GAMMA ** (share - 1)
+        if peak is not None:
+            values = np.fmin(values, peak)
+        result[q] = np.where(total > 0, values, np.nan)
+    return result
+
+
+def pack(bins):
+    # (first bin, float32 bytes of the bins from there to the last one kept) of every sketch, for
+    # storage; bins under TRIM of the sketch's queries are dropped
+    packed = []
+    for row in bins:
+        kept = np.flatnonzero(row > TRIM * row.sum())
+        if not len(kept):
+            packed.append((0, b''))
+            continue
+        lo, hi = int(kept[0]), int(kept[-1])
+        packed.append((lo, row[lo:hi + 1].astype('float32').tobytes()))
+    return packed
+
+
+def unpack(los, blobs):
+    # (sketches x NBINS) bins of stored sketches
+    bins = np.zeros((len(los), NBINS))
+    for i, (lo, blob) in enumerate(zip(los, blobs)):
+        if blob:
+            row = np.frombuffer(blob, dtype='float32')
+            bins[i, int(lo):int(lo) + len(row)] = row
+    return bins
+
+
+def quantile_label(q):
+    # Column name of a latency quantile: 0.5 -> p50_latency_ms, 0.999 -> p99.9_latency_ms
+    return 'p' + format(q * 100, 'g') + '_latency_ms'
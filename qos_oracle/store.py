@@ -0,0 +1,518 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from qos_oracle.instrument import timed
+from qos_oracle.parallel import EPOCH_SECONDS, pull_history
+from qos_oracle.rollup import METRICS, STDEV_MEANS, WEIGHT, component_aggs
+from qos_oracle.schema import SCHEMA, Columns, as_columns
+from qos_oracle.sketch import group_bins, merge, pack, unpack
+
+# Where pulled data points are kept between reruns and restarts
+DEFAULT_PATH = os.environ.get('QOS_ORACLE_STORE', str(Path.home() / '.cache' / 'qos_oracle' / 'store.sqlite'))
+# Seconds a scope is served from disk before asking the oracle for newer rows
+REFRESH_SECONDS = 60
+# Seconds without an ingest daemon heartbeat before pages pull from the oracle themselves again
+INGEST_STALE_SECONDS = 3 * EPOCH_SECONDS
+# Fields kept as text, everything else is stored with numeric affinity
+TEXT_COLUMNS = {'id', 'gateway_id', 'chain_id', 'indexer_url', 'indexer_wallet', 'subgraph_deployment_ipfs_hash'}
+# Where filters that don't have a column of the same name
+SCOPE_COLUMNS = {'indexer': 'indexer_wallet'}
+# Entities rolled up into hourly, daily and weekly tables per (indexer, deployment) at ingest
+ROLLUP_ENTITIES = {'indexerDataPoints'}
+ROLLUP_KEYS = ('indexer_wallet', 'subgraph_deployment_ipfs_hash')
+# Text kept alongside each rollup bucket: the indexer's url as of the bucket
+ROLLUP_LABELS = {'indexer_url': 'MAX(indexer_url)'}
+# Start of the bucket an epoch {column} falls in for each rolled up frequency (weeks start on Monday,
+# 1970-01-05 being the first one). Every frequency is rolled up from the one before it, whose
+# buckets it tiles: hours from the points' end_epoch, days from hours and weeks from days.
+BUCKET_SQL = {
+    'h': '({column} / 3600) * 3600',
+    'D': '({column} / 86400) * 86400',
+    'W-MON': '(({column} - 345600) / 604800) * 604800 + 345600',
+}
+# (size, offset) in seconds of the buckets of each frequency
+BUCKET_SIZES = {'5min': (300, 0), 'h': (3600, 0), 'D': (86400, 0), 'W-MON': (604800, 345600)}
+# Entities whose latency is also kept as mergeable sketches (see qos_oracle.sketch) per (indexer,
+# deployment, gateway) and bucket, for each frequency listed: the first is built from the points,
+# every next one by merging the sketches of the one before
+SKETCH_ENTITIES = {'indexerDataPoints': ('h', 'D'), 'indexerDailyDataPoints': ('D',)}
+SKETCH_KEYS = ('indexer_wallet', 'subgraph_deployment_ipfs_hash', 'gateway_id')
+# Fields a sketch is built from, stdev and max only when the entity has them
+SKETCH_FIELDS = (WEIGHT, 'avg_indexer_latency_ms', 'stdev_indexer_latency_ms', 'max_indexer_latency_ms')
+# Database rows turned into arrays at a time when loading
+LOAD_CHUNK = 10000
+# Upserts remembered in the write log; a reader further behind than this re-reads everything
+WRITES_KEPT = 10000
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def bucket_start(epoch, freq):
+    # Python twin of BUCKET_SQL
+    size, offset = BUCKET_SIZES[freq]
+    return (int(epoch) - offset) // size * size + offset
+
+
+def bucket_starts(epochs, freq):
+    # bucket_start of every epoch of an array
+    size, offset = BUCKET_SIZES[freq]
+    return (np.asarray(epochs, dtype='int64') - offset) // size * size + offset
+
+
+def _component_sql(metric):
+    # SQL aggregates for the rollup components of one metric, named as in rollup.component_aggs
+    kind = METRICS[metric]
+    value = _quote(metric)
+    weight = 'COALESCE(' + _quote(WEIGHT) + ', 0)'
+    present = 'CASE WHEN ' + value + ' IS NOT NULL THEN ' + weight + ' ELSE 0 END'
+    if kind in ('sum', 'max'):
+        return [(metric, kind.upper() + '(' + value + ')')]
+    if kind == 'mean':
+        return [(metric + '__w', 'SUM(' + present + ')'),
+                (metric + '__wx', 'SUM(' + value + ' * ' + weight + ')')]
+    mean = _quote(STDEV_MEANS[metric])
+    return [(metric + '__w', 'SUM(' + present + ')'),
+            (metric + '__wm', 'SUM(CASE WHEN ' + value + ' IS NOT NULL THEN ' + mean + ' * ' + weight + ' END)'),
+            (metric + '__wss', 'SUM(CASE WHEN ' + value + ' IS NOT NULL THEN (' + value + ' * ' + value
+             + ' + ' + mean + ' * ' + mean + ') * ' + weight + ' END)')]
+
+
+class Store:
+    # SQLite store of oracle rows, one table per entity keyed by (source, id) and indexed by
+    # (indexer, deployment, end_epoch). A coverage table remembers, per pulled scope, which
+    # end_epoch range is complete on disk so refreshes only ask the oracle for newer rows.
+    # 5 minute data points are also rolled up into hourly, daily and weekly tables as they arrive.
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ':memory:':
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS coverage (
+            source TEXT, entity TEXT, scope TEXT, newest INTEGER, oldest INTEGER,
+            exhausted INTEGER, refreshed_at REAL, PRIMARY KEY (source, entity, scope))''')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS ingest (
+            source TEXT, entity TEXT, scope TEXT, polled_at REAL, PRIMARY KEY (source, entity, scope))''')
+        # end_epoch range of every upsert in write order, so readers of derived tables (the
+        # leaderboard) can re-read exactly what changed, whichever process wrote it
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS writes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT, source TEXT, entity TEXT, lower INTEGER, upper INTEGER)''')
+        self._columns = {}
+
+    def _ensure_table(self, entity, fields):
+        columns = self._columns.get(entity)
+        if columns is None:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS ' + _quote(entity)
+                               + ' (source TEXT, id TEXT, end_epoch INTEGER, PRIMARY KEY (source, id))')
+            columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(' + _quote(entity) + ')')}
+            self._columns[entity] = columns
+        for field in fields:
+            if field not in columns:
+                affinity = 'TEXT' if field in TEXT_COLUMNS else 'NUMERIC'
+                self._conn.execute('ALTER TABLE ' + _quote(entity) + ' ADD COLUMN ' + _quote(field) + ' ' + affinity)
+                columns.add(field)
+        for key in (('indexer_wallet', 'subgraph_deployment_ipfs_hash', 'end_epoch'),
+                    ('subgraph_deployment_ipfs_hash', 'end_epoch')):
+            if all(column in columns for column in key):
+                self._conn.execute('CREATE INDEX IF NOT EXISTS ' + _quote(entity + '_' + '_'.join(key))
+                                   + ' ON ' + _quote(entity) + ' (source, ' + ', '.join(key) + ')')
+
+    def _scope_sql(self, scope):
+        clauses = []
+        params = []
+        for key, value in sorted(scope.items()):
+            clauses.append(_quote(SCOPE_COLUMNS.get(key, key)) + ' = ?')
+            params.append(value)
+        return clauses, params
+
+    @timed('store.upsert')
+    def upsert(self, source, entity, rows):
+        # Insert rows (Columns or a list of dicts), replacing any already stored with the same id
+        if not len(rows):
+            return
+        rows = as_columns(rows)
+        fields = rows.fields
+        with self._lock, self._conn:
+            self._ensure_table(entity, fields)
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO ' + _quote(entity) + ' (source, ' + ', '.join(map(_quote, fields))
+                + ') VALUES (?' + ', ?' * len(fields) + ')',
+                rows.tuples(fields, (source,)))
+            if entity in ROLLUP_ENTITIES:
+                self._update_rollups(source, entity, rows)
+            if entity in SKETCH_ENTITIES:
+                self._update_sketches(source, entity, rows)
+            if 'end_epoch' in fields:
+                seq = self._conn.execute('INSERT INTO writes (source, entity, lower, upper) VALUES (?, ?, ?, ?)',
+                                         (source, entity, int(rows['end_epoch'].min()), int(rows['end_epoch'].max()))).lastrowid
+                self._conn.execute('DELETE FROM writes WHERE seq <= ?', (seq - WRITES_KEPT,))
+
+    def writes_since(self, source, entity, seq=None):
+        # (newest write seq, [(lower, upper) end_epoch range of every upsert of source and entity
+        # after seq]), the ranges being None when seq is None or has left the log, i.e. everything
+        # may have changed
+        with self._lock:
+            oldest, newest = self._conn.execute('SELECT MIN(seq), MAX(seq) FROM writes').fetchone()
+            newest = newest or 0
+            if seq is None or (oldest is not None and seq < oldest - 1):
+                return newest, None
+            ranges = self._conn.execute('SELECT lower, upper FROM writes WHERE seq > ? AND seq <= ? AND source = ? AND entity = ?',
+                                        (seq, newest, source, entity)).fetchall()
+        return newest, [tuple(row) for row in ranges]
+
+    def _ensure_rollup_table(self, table, names, labels=()):
+        # Returns True when the table was just created and still needs a full build
+        columns = self._columns.get(table)
+        created = False
+        if columns is None:
+            created = not self._table_exists(table)
+            self._conn.execute('CREATE TABLE IF NOT EXISTS ' + _quote(table) + ' (source TEXT, bucket INTEGER, '
+                               + ', '.join(key + ' TEXT' for key in ROLLUP_KEYS)
+                               + ', PRIMARY KEY (source, ' + ', '.join(ROLLUP_KEYS) + ', bucket))')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS ' + _quote(table + '_deployment') + ' ON '
+                               + _quote(table) + ' (source, subgraph_deployment_ipfs_hash, bucket)')
+            # every indexer and deployment at once (the leaderboard) reads by bucket alone
+            self._conn.execute('CREATE INDEX IF NOT EXISTS ' + _quote(table + '_bucket') + ' ON '
+                               + _quote(table) + ' (source, bucket)')
+            columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(' + _quote(table) + ')')}
+            self._columns[table] = columns
+        for name in names:
+            if name not in columns:
+                self._conn.execute('ALTER TABLE ' + _quote(table) + ' ADD COLUMN ' + _quote(name) + ' REAL')
+                columns.add(name)
+        for name in labels:
+            if name not in columns:
+                self._conn.execute('ALTER TABLE ' + _quote(table) + ' ADD COLUMN ' + _quote(name) + ' TEXT')
+                columns.add(name)
+        return created
+
+    def _update_rollups(self, source, entity, rows):
+        # Rebuild the rollup buckets touched by rows, only for the (indexer, deployment) pairs in rows,
+        # so replaced rows are never counted twice: hours from the raw points, every coarser frequency
+        # from the buckets of the one before (their components add up), each bounded to the buckets
+        # rows fall in so an upsert costs the same however far into a day or week it lands
+        columns = self._columns[entity]
+        if not all(key in columns for key in ROLLUP_KEYS + ('end_epoch',)):
+            return
+        metrics = [metric for metric in METRICS if metric in columns
+                   and (METRICS[metric] != 'stdev' or STDEV_MEANS[metric] in columns)]
+        selects = [component for metric in metrics for component in _component_sql(metric)]
+        labels = [(name, expr) for name, expr in ROLLUP_LABELS.items() if name in columns]
+        start, end = int(rows['end_epoch'].min()), int(rows['end_epoch'].max())
+        in_keys = self._touched_keys(rows)
+        # components of a coarser bucket from those of the finer ones it holds
+        merges = [(name, kind.upper() + '(' + _quote(name) + ')') for name, kind in component_aggs(metrics).items()]
+        previous, column = entity, 'end_epoch'
+        for freq, bucket in BUCKET_SQL.items():
+            table = entity + '_rollup_' + freq
+            if self._ensure_rollup_table(table, [name for name, _ in selects], [name for name, _ in labels]):
+                # first rollup of this table: build it from everything already on disk
+                where, params = 'source = ?', [source]
+            else:
+                size, _ = BUCKET_SIZES[freq]
+                where = 'source = ? AND {column} >= ? AND {column} < ? AND ' + in_keys
+                params = [source, bucket_start(start, freq), bucket_start(end, freq) + size]
+            self._conn.execute('DELETE FROM ' + _quote(table) + ' WHERE ' + where.format(column='bucket'), params)
+            grouping = bucket.format(column=_quote(column))
+            self._conn.execute(
+                'INSERT INTO ' + _quote(table) + ' (source, bucket, ' + ', '.join(ROLLUP_KEYS) + ', '
+                + ', '.join(_quote(name) for name, _ in selects + labels) + ') SELECT source, ' + grouping + ', '
+                + ', '.join(ROLLUP_KEYS) + ', ' + ', '.join(expr for _, expr in selects + labels) + ' FROM ' + _quote(previous)
+                + ' WHERE ' + where.format(column=_quote(column)) + ' GROUP BY ' + grouping + ', ' + ', '.join(ROLLUP_KEYS), params)
+            previous, column, selects = table, 'bucket', merges
+
+    def _touched_keys(self, rows):
+        # SQL condition matching the (indexer, deployment) pairs present in rows
+        self._conn.execute('CREATE TEMP TABLE IF NOT EXISTS rollup_keys (indexer_wallet TEXT, subgraph_deployment_ipfs_hash TEXT)')
+        self._conn.execute('DELETE FROM rollup_keys')
+        self._conn.executemany('INSERT INTO rollup_keys VALUES (?, ?)', set(rows.tuples(ROLLUP_KEYS)))
+        return '(' + ', '.join(ROLLUP_KEYS) + ') IN (SELECT ' + ', '.join(ROLLUP_KEYS) + ' FROM rollup_keys)'
+
+    def _ensure_sketch_table(self, table):
+        # Returns True when the table was just created and still needs a full build
+        if table in self._columns:
+            return False
+        created = not self._table_exists(table)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS ' + _quote(table) + ' (source TEXT, '
+                           + ', '.join(key + ' TEXT' for key in SKETCH_KEYS)
+                           + ', bucket INTEGER, queries REAL, peak REAL, lo INTEGER, bins BLOB'
+                           + ', PRIMARY KEY (source, ' + ', '.join(SKETCH_KEYS) + ', bucket))')
+        for key in (('subgraph_deployment_ipfs_hash', 'bucket'), ('bucket',)):
+            self._conn.execute('CREATE INDEX IF NOT EXISTS ' + _quote(table + '_' + '_'.join(key)) + ' ON '
+                               + _quote(table) + ' (source, ' + ', '.join(key) + ')')
+        self._columns[table] = {'source', 'bucket', 'queries', 'peak', 'lo', 'bins'} | set(SKETCH_KEYS)
+        return created
+
+    def _update_sketches(self, source, entity, rows):
+        # Rebuild the latency sketches of the buckets touched by rows, like the rollups: the first
+        # frequency from the raw points of the touched (indexer, deployment) pairs, every next one
+        # from the sketches of the frequency before
+        columns = self._columns[entity]
+        if not all(key in columns for key in ROLLUP_KEYS + ('end_epoch',) + SKETCH_FIELDS[:2]):
+            return
+        start, end = int(rows['end_epoch'].min()), int(rows['end_epoch'].max())
+        in_keys = self._touched_keys(rows)
+        previous = None
+        for freq in SKETCH_ENTITIES[entity]:
+            table = entity + '_sketch_' + freq
+            if self._ensure_sketch_table(table):
+                # first build of this table: everything already on disk
+                where, params = 'source = ?', [source]
+            else:
+                # only the buckets rows fall in, so pages arriving out of order don't redo newer ones
+                size, _ = BUCKET_SIZES[freq]
+                where = 'source = ? AND {column} >= ? AND {column} < ? AND ' + in_keys
+                params = [source, bucket_start(start, freq), bucket_start(end, freq) + size]
+            if previous is None:
+                fields = [field for field in SKETCH_KEYS + ('end_epoch',) + SKETCH_FIELDS if field in columns]
+                points = self._read('SELECT ' + ', '.join(map(_quote, fields)) + ' FROM ' + _quote(entity)
+                                    + ' WHERE ' + where.format(column='end_epoch'), params)
+                keys, codes = _sketch_groups(points, bucket_starts(points['end_epoch'], freq))
+                bins = group_bins(codes, len(keys), points[WEIGHT], points['avg_indexer_latency_ms'],
+                                  points.column('stdev_indexer_latency_ms'), points.column('max_indexer_latency_ms'))
+                queries, peaks = points[WEIGHT], points.column('max_indexer_latency_ms')
+            else:
+                parts = self._read('SELECT * FROM ' + _quote(previous) + ' WHERE ' + where.format(column='bucket'),
+                                   params, _sketch_dtype)
+                keys, codes = _sketch_groups(parts, bucket_starts(parts['bucket'], freq))
+                bins = merge(codes, len(keys), unpack(parts['lo'], parts['bins']))
+                queries, peaks = parts['queries'], parts['peak']
+            queries = np.bincount(codes, np.nan_to_num(np.asarray(queries, dtype='float64')), len(keys))
+            peaks = pd.Series(np.asarray(peaks, dtype='float64')).groupby(codes).max().reindex(range(len(keys)))
+            self._conn.execute('DELETE FROM ' + _quote(table) + ' WHERE ' + where.format(column='bucket'), params)
+            self._conn.executemany(
+                'INSERT INTO ' + _quote(table) + ' (source, ' + ', '.join(SKETCH_KEYS)
+                + ', bucket, queries, peak, lo, bins) VALUES (?' + ', ?' * (len(SKETCH_KEYS) + 5) + ')',
+                [(source,) + key + (float(count), None if np.isnan(peak) else float(peak), lo, blob)
+                 for key, count, peak, (lo, blob) in zip(keys, queries.tolist(), peaks.tolist(), pack(bins))])
+            previous = table
+
+    def sketch_rows(self, source, entity, freq, scope, since=None, before=None):
+        # Columns of the stored latency sketches for a scope, oldest bucket first, from the bucket of
+        # epoch `since` to the buckets starting before `before`
+        table = entity + '_sketch_' + freq
+        clauses, params = self._scope_sql(scope)
+        if since is not None:
+            clauses.append('bucket >= ?')
+            params.append(bucket_start(since, freq))
+        if before is not None:
+            clauses.append('bucket < ?')
+            params.append(before)
+        with self._lock:
+            if table not in self._columns and not self._table_exists(table):
+                return Columns({})
+            return self._read('SELECT * FROM ' + _quote(table) + ' WHERE source = ?'
+                              + ''.join(' AND ' + clause for clause in clauses) + ' ORDER BY bucket',
+                              [source] + params, _sketch_dtype)
+
+    def rollup_rows(self, source, entity, freq, scope, since=None, before=None):
+        # Columns of the stored rollup components for a scope, oldest bucket first, from the bucket of
+        # epoch `since` to the buckets starting before `before`
+        table = entity + '_rollup_' + freq
+        clauses, params = self._scope_sql(scope)
+        if since is not None:
+            clauses.append('bucket >= ?')
+            params.append(bucket_start(since, freq))
+        if before is not None:
+            clauses.append('bucket < ?')
+            params.append(before)
+        with self._lock:
+            if table not in self._columns and not self._table_exists(table):
+                return Columns({})
+            return self._read('SELECT * FROM ' + _quote(table) + ' WHERE source = ?'
+                              + ''.join(' AND ' + clause for clause in clauses) + ' ORDER BY bucket',
+                              [source] + params, _rollup_dtype)
+
+    def newest_bucket(self, source, entity, freq):
+        # Start of the newest stored rollup bucket of an entity, None when nothing is rolled up yet
+        table = entity + '_rollup_' + freq
+        with self._lock:
+            if table not in self._columns and not self._table_exists(table):
+                return None
+            return self._conn.execute('SELECT MAX(bucket) FROM ' + _quote(table) + ' WHERE source = ?',
+                                      (source,)).fetchone()[0]
+
+    @timed('store.load')
+    def load(self, source, entity, scope, oldest=None, limit=None):
+        # Columns of the rows in scope, newest end_epoch first
+        clauses, params = self._scope_sql(scope)
+        if oldest is not None:
+            clauses.append('end_epoch >= ?')
+            params.append(oldest)
+        sql = ('SELECT * FROM ' + _quote(entity) + ' WHERE source = ?'
+               + ''.join(' AND ' + clause for clause in clauses) + ' ORDER BY end_epoch DESC, id')
+        if limit is not None:
+            sql += ' LIMIT ' + str(int(limit))
+        with self._lock:
+            if entity not in self._columns and not self._table_exists(entity):
+                return Columns({})
+            return self._read(sql, [source] + params)
+
+    def _read(self, sql, params, dtype=SCHEMA.get):
+        # Columns of a query's rows without their source, read as plain tuples and turned into
+        # arrays a chunk at a time; dtype(column) is the schema dtype of each column
+        cursor = self._conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(sql, params)
+        names = [column[0] for column in cursor.description]
+        schema = {name: dtype(name) for name in names}
+        chunks = [Columns.from_tuples(chunk, names, schema) for chunk in iter(lambda: cursor.fetchmany(LOAD_CHUNK), [])]
+        return Columns.concat(chunks, names).drop('source')
+
+    def count(self, source, entity, scope, oldest=None, newest=None):
+        clauses, params = self._scope_sql(scope)
+        if oldest is not None:
+            clauses.append('end_epoch >= ?')
+            params.append(oldest)
+        if newest is not None:
+            clauses.append('end_epoch <= ?')
+            params.append(newest)
+        with self._lock:
+            if entity not in self._columns and not self._table_exists(entity):
+                return 0
+            return self._conn.execute('SELECT COUNT(*) FROM ' + _quote(entity) + ' WHERE source = ?'
+                                      + ''.join(' AND ' + clause for clause in clauses),
+                                      [source] + params).fetchone()[0]
+
+    def _table_exists(self, entity):
+        return self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                  (entity,)).fetchone() is not None
+
+    def coverage(self, source, entity, scope):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM coverage WHERE source = ? AND entity = ? AND scope = ?',
+                                     (source, entity, json.dumps(scope, sort_keys=True))).fetchone()
+        return dict(row) if row is not None else None
+
+    def set_coverage(self, source, entity, scope, newest, oldest, exhausted, refreshed_at):
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (source, entity, json.dumps(scope, sort_keys=True), newest, oldest,
+                                int(exhausted), refreshed_at))
+
+    def mark_ingested(self, source, entity, scope, polled_at):
+        # Heartbeat of the ingest daemon: scope was brought up to date at polled_at
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO ingest VALUES (?, ?, ?, ?)',
+                               (source, entity, json.dumps(scope, sort_keys=True), polled_at))
+
+    def ingesting(self, source, entity, scope, max_age=INGEST_STALE_SECONDS):
+        # True when a live ingest daemon keeps a scope containing this one up to date
+        wanted = _normalize(scope)
+        with self._lock:
+            rows = self._conn.execute('SELECT scope FROM ingest WHERE source = ? AND entity = ? AND polled_at >= ?',
+                                      (source, entity, time.time() - max_age)).fetchall()
+        return any(_normalize(json.loads(row['scope'])).items() <= wanted.items() for row in rows)
+
+
+def _rollup_dtype(name):
+    # dtype of a rollup table column: keys and labels are text, buckets int64, components float64
+    if name in ROLLUP_KEYS or name in ROLLUP_LABELS or name == 'source':
+        return 'object'
+    return 'int64' if name == 'bucket' else 'float64'
+
+
+def _sketch_dtype(name):
+    # dtype of a sketch table column
+    if name in ('bucket', 'lo'):
+        return 'int64'
+    return 'float64' if name in ('queries', 'peak') else 'object'
+
+
+def _sketch_groups(rows, buckets):
+    # ([(indexer, deployment, gateway, bucket)] of every group, group code of every row); gateway is
+    # '' for entities without one
+    keys = [rows.column(key).tolist() for key in SKETCH_KEYS[:2]]
+    keys.append(['' if gateway is None else gateway for gateway in rows.column('gateway_id').tolist()])
+    codes, uniques = pd.MultiIndex.from_arrays(keys + [buckets.tolist()]).factorize()
+    return [tuple(key) for key in uniques], codes
+
+
+def _normalize(scope):
+    # Scope keyed by store column names
+    return {SCOPE_COLUMNS.get(key, key): value for key, value in scope.items()}
+
+
+def pull_incremental(store, source, entity, scope, pull_range, nrows, max_age=REFRESH_SECONDS):
+    # Serve the newest nrows rows for a scope from the store, only asking the oracle for what is missing:
+    # rows at or after the stored high-water mark, and older rows when the store holds fewer than nrows.
+    # pull_range(lower, upper, limit) is the same keyset pull used by pull_windowed.
+    cov = store.coverage(source, entity, scope)
+    now = time.time()
+    if cov is None:
+        # cold start: nothing on disk for this scope yet
+        rows, ended = pull_history(pull_range, nrows)
+        if not len(rows):
+            return rows
+        store.upsert(source, entity, rows)
+        cov = {'newest': int(rows['end_epoch'].max()), 'oldest': int(rows['end_epoch'].min()), 'exhausted': ended}
+    else:
+        cov['exhausted'] = bool(cov['exhausted'])
+        if now - cov['refreshed_at'] >= max_age:
+            # re-read the high-water epoch too, it may have been written over several blocks
+            fresh = pull_range(cov['newest'], None, nrows)
+            store.upsert(source, entity, fresh)
+            if len(fresh) >= nrows:
+                # the gap is larger than a whole pull, so what was on disk is no longer contiguous
+                cov['oldest'] = int(fresh['end_epoch'].min())
+                cov['exhausted'] = False
+            if len(fresh):
+                cov['newest'] = max(cov['newest'], int(fresh['end_epoch'].max()))
+        else:
+            now = cov['refreshed_at']
+        # backfill older rows when a larger pull is asked for than is on disk
+        have = store.count(source, entity, scope, cov['oldest'])
+        if have < nrows and not cov['exhausted']:
+            oldest = cov['oldest']
+            # the oldest epoch may only be partly on disk, so read it again in full
+            limit = nrows - have + store.count(source, entity, scope, oldest, oldest)
+            older, ended = pull_history(lambda lower, upper, n: pull_range(lower, oldest + 1 if upper is None else min(upper, oldest + 1), n), limit)
+            store.upsert(source, entity, older)
+            # only a short unbounded read ends the history, a gap in the oracle's data doesn't
+            cov['exhausted'] = ended
+            if len(older):
+                cov['oldest'] = min(cov['oldest'], int(older['end_epoch'].min()))
+    store.set_coverage(source, entity, scope, cov['newest'], cov['oldest'], cov['exhausted'], now)
+    return store.load(source, entity, scope, cov['oldest'], nrows)
+
+
+def serve_rows(store, source, entity, scope, pull_range, nrows):
+    # Newest nrows rows for a scope. When the ingest daemon keeps the scope up to date the page only
+    # reads the store; otherwise it falls back to pulling what is missing itself.
+    if store.ingesting(source, entity, scope):
+        return store.load(source, entity, scope, limit=nrows)
+    return pull_incremental(store, source, entity, scope, pull_range, nrows)
+
+
+def stored_rollup(store, source, entity, freq, scope, since=None):
+    # Rollup components for a scope as a DataFrame with a `date` column, ready for rollup.combine
+    parts = pd.DataFrame(store.rollup_rows(source, entity, freq, scope, since).data)
+    if parts.empty:
+        return parts
+    parts['date'] = pd.to_datetime(parts['bucket'], unit='s')
+    return parts
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def default_store(path=DEFAULT_PATH):
+    # One shared Store per path for the whole process, so every session and rerun reuses it
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = Store(path)
+        return _stores[path]
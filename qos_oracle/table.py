@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from qos_oracle.instrument import timed
+from qos_oracle.rollup import RollupCache
+
+# Rows sent to the browser per page of a raw data table
+PAGE_ROWS = 100
+
+# Row orders of recently viewed tables, keyed by the caller's data version, filter text and sort,
+# so turning pages doesn't filter and sort the whole frame again
+orders = RollupCache(maxsize=16, name='table orders')
+
+
+def filter_rows(df, text):
+    # Boolean mask of the rows where any text column contains text (case insensitive). Categorical
+    # columns are matched on their categories, so the search is over distinct values only.
+    text = text.strip().lower()
+    if not text:
+        return np.ones(len(df), dtype=bool)
+    mask = np.zeros(len(df), dtype=bool)
+    for column in df.columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            matches = [code for code, category in enumerate(values.cat.categories) if text in str(category).lower()]
+            if matches:
+                mask |= np.isin(values.cat.codes.to_numpy(), matches)
+        elif values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+            mask |= values.astype(str).str.lower().str.contains(text, regex=False).to_numpy()
+    return mask
+
+
+@timed('table.filter')
+def table_rows(df, text='', sort_by=None, ascending=True, key=None):
+    # Positions (into df) of the rows left after filtering by text, in sort_by order. Cached when
+    # key, which must change whenever df's content does, is given.
+    def compute():
+        positions = np.flatnonzero(filter_rows(df, text))
+        if sort_by is None:
+            return positions
+        values = df[sort_by].iloc[positions].reset_index(drop=True)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # categories (such as subgraph labels) come in the order they were first seen, sort on their values
+            values = values.cat.set_categories(values.cat.categories.sort_values(), ordered=True)
+        order = values.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+        return positions[order]
+    if key is None:
+        return compute()
+    return orders.get((key, text.strip().lower(), sort_by, ascending), compute)
+
+
+def page_count(rows, page_rows=PAGE_ROWS):
+    return max((rows + page_rows - 1) // page_rows, 1)
+
+
+@timed('table')
+def table_page(df, positions, page, page_rows=PAGE_ROWS):
+    # Rows of one page (1-based), indexed by their row number in the filtered and sorted table
+    start = (page - 1) * page_rows
+    rows = positions[start:start + page_rows]
+    return df.iloc[rows].set_axis(pd.RangeIndex(start + 1, start + 1 + len(rows)), axis=0)
@@ -0,0 +1,62 @@
+# Streamlit widgets shared by the apps (not imported by the package itself, so the ingest daemon
+# doesn't need streamlit)
+import streamlit as st
+
+from qos_oracle.export import available_formats, export_file
+from qos_oracle.instrument import span, start_rerun
+from qos_oracle.table import page_count, table_page, table_rows
+
+
+def show_table(df, key, prefix='table'):
+    # df a page at a time: filtering and sorting run here over the whole frame (cached per key, which
+    # must change whenever df's content does) and only the visible page is sent to the browser.
+    # prefix keeps the widgets of several tables on one page apart.
+    cols = st.columns(4)
+    text = cols[0].text_input('Filter rows', key=prefix + '_filter')
+    sort_by = cols[1].selectbox('Sort by', ['none'] + list(df.columns), key=prefix + '_sort')
+    descending = cols[2].checkbox('Descending', key=prefix + '_desc')
+    positions = table_rows(df, text, None if sort_by == 'none' else sort_by, not descending, key=(prefix, key))
+    pages = page_count(len(positions))
+    # keyed on the page count so the page resets when a filter shrinks the table
+    page = cols[3].number_input('Page of ' + str(pages), 1, pages, 1, key=prefix + '_page_' + str(pages))
+    st.dataframe(table_page(df, positions, page))
+    st.write(str(len(positions)) + " of " + str(len(df)) + " rows")
+
+
+def download_button(df, key, file_name, label='Download data', prefix='export'):
+    # Download of df in a chosen format. The file is only encoded once asked for, streamed to disk in
+    # chunks and cached by key (the data version) and df's columns, so reruns neither encode nor hash
+    # the data again.
+    fmt = st.selectbox('Download format', available_formats(), key=prefix + '_format')
+    if st.checkbox('Prepare download', key=prefix + '_prepare'):
+        path, extension, mime = export_file(df, fmt, (key, tuple(df.columns)))
+        with open(path, 'rb') as f:
+            st.download_button(label=label, data=f, file_name=file_name + '.' + extension, mime=mime)
+
+
+def debug_rerun():
+    # Opt-in debug panel: a sidebar checkbox that, when ticked, records the timings of every stage of
+    # this rerun. Returns the Recorder (None when off) for debug_panel at the end of the script.
+    return start_rerun(st.sidebar.checkbox('Show debug timings', key='debug_timings'))
+
+
+def debug_panel(rerun):
+    # Where this rerun's time went, at the bottom of the sidebar
+    if rerun is None:
+        return
+    with st.sidebar:
+        st.write('### Debug timings (this rerun)')
+        st.write(str(round(rerun.elapsed(), 3)) + "s total, " + str(round(rerun.bytes / 1e6, 2)) + " MB fetched, largest frame "
+                 + str(round(rerun.peak_frame[0] / 1e6, 2)) + " MB (" + str(rerun.peak_frame[1]) + ")")
+        st.dataframe(rerun.stage_frame())
+        st.dataframe(rerun.cache_frame())
+
+
+def show_chart(kind, frame, **options):
+    # plotly express chart of kind ('line', 'bar', 'area', 'scatter' or 'pie') across the page. Building
+    # the figure (and its serialization) is timed for the debug panel, and plotly is only imported once
+    # a chart is drawn, it is the slowest import of the apps.
+    with span('chart'):
+        import plotly.express as px
+        fig = getattr(px, kind)(frame, **options)
+        st.plotly_chart(fig, theme="streamlit", use_container_width=True)
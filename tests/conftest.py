@@ -0,0 +1,91 @@
+# Shared fixtures: the qos_oracle package pointed at nothing (every test drives it through an
+# in-memory run_query over the benchmark stand-in's synthetic Dataset, no HTTP) with small pages
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+os.environ['QOS_ORACLE_PAGE_SIZE'] = '100'
+os.environ['QOS_ORACLE_GRAPH_HOST'] = 'http://127.0.0.1:9'
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+import standin  # noqa: E402
+
+from qos_oracle import PAGE_SIZE, Store, fetch_catalog, keyset_rows, rollups  # noqa: E402
+from qos_oracle import api, catalog, planner  # noqa: E402
+
+# Newest epoch of every test dataset
+NOW = 1700000000
+
+
+class GappedDataset(standin.Dataset):
+    # Stand-in data with no data points at all in the [lower, upper) end_epoch ranges of `gaps`
+
+    def __init__(self, gaps=(), **kwargs):
+        super().__init__(**kwargs)
+        self.gaps = list(gaps)
+
+    def ends(self, bucket):
+        return [end for end in super().ends(bucket) if not any(lower <= end < upper for lower, upper in self.gaps)]
+
+
+def make_dataset(gaps=(), days=40, **kwargs):
+    options = dict(seed=1, indexers=4, deployments=6, subgraphs=40, allocations=3, days=days, now=NOW)
+    options.update(kwargs)
+    return GappedDataset(gaps, **options)
+
+
+class FakeOracle:
+    # run_query over a Dataset, counting queries; `wallet`/`deployment` scopes build pull_range functions
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.queries = 0
+
+    def run_query(self, query):
+        self.queries += 1
+        return self.dataset.answer(query, PAGE_SIZE)
+
+    def pull_range(self, entity, fields, scope):
+        return lambda lower, upper, limit: keyset_rows(self.run_query, entity, fields, scope, lower, upper, limit)
+
+
+@pytest.fixture
+def dataset():
+    return make_dataset()
+
+
+@pytest.fixture
+def oracle(dataset):
+    return FakeOracle(dataset)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return Store(str(tmp_path / 'store.sqlite'))
+
+
+@pytest.fixture
+def offline(monkeypatch, oracle):
+    # Every endpoint of the package answered by the fake oracle; returns its mainnet Catalog.
+    # The planner's introspection and the process-wide rollup cache start empty.
+    def post_graphql(url, query, *args, **kwargs):
+        return oracle.run_query(query)
+    monkeypatch.setattr(catalog, 'post_graphql', post_graphql)
+    monkeypatch.setattr(planner, 'post_graphql', post_graphql)
+    monkeypatch.setattr(planner, '_schemas', {})
+    monkeypatch.setattr(api, 'runner', lambda url: oracle.run_query)
+    rollups.clear()
+    return fetch_catalog('mainnet')
+
+
+@pytest.fixture
+def raw_only(monkeypatch, offline):
+    # An oracle without pre-aggregated entities: introspection fails, views read raw points
+    def post_graphql(url, query, *args, **kwargs):
+        raise RuntimeError('no introspection')
+    monkeypatch.setattr(planner, 'post_graphql', post_graphql)
+    return offline
@@ -0,0 +1,24 @@
+from conftest import NOW
+
+from qos_oracle import DATAPOINT_FIELDS, fetch_datapoints, keyset_rows
+
+DAY = 86400
+
+
+def test_since_older_than_the_rows_asked_for_is_reached(raw_only, oracle, dataset, store):
+    deployment = dataset.busiest_deployment()
+    since = NOW - 3 * DAY
+    points = fetch_datapoints(deployment=deployment, since=since, rows=1000, catalog=raw_only, store=store)
+    expected = keyset_rows(oracle.run_query, 'indexerDataPoints', DATAPOINT_FIELDS,
+                           {'subgraph_deployment_ipfs_hash': deployment}, since)
+    assert len(expected) > 1000
+    assert sorted(points.frame['id']) == sorted(expected['id'])
+
+
+def test_since_within_the_rows_asked_for_only_drops_older_rows(raw_only, dataset, store):
+    deployment = dataset.busiest_deployment()
+    since = NOW - 3600
+    points = fetch_datapoints(deployment=deployment, since=since, rows=1000, catalog=raw_only, store=store)
+    assert 0 < len(points.frame) < 1000
+    assert points.frame['end_epoch'].min() >= since
+    assert len(store.load(points.source, 'indexerDataPoints', points.scope)) == 1000
@@ -0,0 +1,88 @@
+import random
+
+import pandas as pd
+import pytest
+
+from conftest import FakeOracle, make_dataset
+
+from qos_oracle import PAGE_SIZE, Catalog, fetch_catalog, load_snapshot, merge_catalogs, save_snapshot
+from qos_oracle import catalog
+from qos_oracle.catalog import ID_FORMATS, ID_SHARDS, _id_bounds
+
+
+def test_fetch_catalog_pages_every_subgraph_in_signal_order(offline, dataset):
+    # 40 subgraphs, all on the first page
+    assert len(offline.records) == len(dataset.subgraphs)
+    signals = [int(record['signalledTokens']) for record in offline.records]
+    assert signals == sorted(signals, reverse=True)
+
+
+def test_lookups_by_name_and_hash(offline, dataset):
+    deployment = dataset.busiest_deployment()
+    name = offline.name_for(deployment)
+    assert name is not None and offline.hash_for(name) == deployment
+    assert offline.names(name)[0] == name
+    assert offline.label_column(pd.Series([deployment, 'QmUnknown'])).tolist() == [name, 'QmUnknown']
+
+
+def test_snapshot_round_trip(offline, tmp_path):
+    save_snapshot(offline, tmp_path)
+    loaded = load_snapshot('mainnet', tmp_path)
+    assert loaded.records == offline.records
+    assert load_snapshot('testnet', tmp_path) is None
+
+
+def test_merge_catalogs_keeps_the_first_record_of_a_deployment(offline):
+    other = Catalog('arbitrum', [dict(offline.records[0], subgraph='Copy'), {'displayName': None, 'signalledTokens': '0',
+                     'creatorAddress': '0x0', 'ipfsHash': 'QmOnlyOnArbitrum', 'subgraph': 'Only on arbitrum'}], 0)
+    merged = merge_catalogs([offline, other])
+    assert len(merged.records) == len(offline.records) + 1
+    assert merged.name_for(offline.records[0]['ipfsHash']) == offline.records[0]['subgraph']
+    assert merged.by_hash['QmOnlyOnArbitrum']['network'] == 'arbitrum'
+
+
+def _with_ids(dataset, make_id):
+    # dataset with its subgraph ids replaced (and re-sorted)
+    rng = random.Random(7)
+    for subgraph in dataset.subgraphs:
+        subgraph['id'] = make_id(rng)
+    dataset.subgraphs.sort(key=lambda subgraph: subgraph['id'])
+    dataset.subgraph_ids = [subgraph['id'] for subgraph in dataset.subgraphs]
+    return dataset
+
+
+ID_MAKERS = {
+    'hex': lambda rng: '0x%040x-%d' % (rng.getrandbits(160), rng.randrange(3)),
+    'base58': lambda rng: ''.join(rng.choice(ID_FORMATS[1][1]) for _ in range(44)),
+    'other': lambda rng: 'subgraph_%06d' % rng.randrange(10 ** 6),
+}
+
+
+def test_id_bounds_follow_the_id_format():
+    rng = random.Random(1)
+    hex_bounds = _id_bounds('http://network', [ID_MAKERS['hex'](rng) for _ in range(10)])
+    assert hex_bounds[0] == '0x1' and len(hex_bounds) == ID_SHARDS - 1
+    base58_bounds = _id_bounds('http://network', [ID_MAKERS['base58'](rng) for _ in range(10)])
+    assert base58_bounds == sorted(base58_bounds) and len(base58_bounds) == ID_SHARDS - 1
+    assert _id_bounds('http://network', ['subgraph_1', 'subgraph_2']) == []
+
+
+@pytest.mark.parametrize('format', ['hex', 'base58', 'other'])
+def test_fetch_catalog_shards_any_id_format(monkeypatch, format):
+    oracle = FakeOracle(_with_ids(make_dataset(subgraphs=12 * PAGE_SIZE), ID_MAKERS[format]))
+    queries = []
+
+    def post_graphql(url, query, *args, **kwargs):
+        queries.append(query)
+        return oracle.run_query(query)
+    monkeypatch.setattr(catalog, 'post_graphql', post_graphql)
+    fetched = fetch_catalog('mainnet')
+    assert sorted(record['ipfsHash'] for record in fetched.records) == sorted(
+        subgraph['versions'][0]['subgraphDeployment']['ipfsHash'] for subgraph in oracle.dataset.subgraphs)
+    # first page of every shard but the one carrying on after the sampled page
+    shards = sum('id_gte' in query for query in queries)
+    if format == 'other':
+        assert shards == 0
+        assert len(queries) == 12 + 1
+    else:
+        assert shards > ID_SHARDS // 2
@@ -0,0 +1,169 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from qos_oracle import GraphQLError, SingleFlight, normalize_query
+from qos_oracle import client
+
+
+def _concurrently(n, call):
+    # Results (or exceptions) of call() run by n threads released together
+    barrier = threading.Barrier(n)
+    results = [None] * n
+
+    def run(i):
+        barrier.wait()
+        try:
+            results[i] = call()
+        except Exception as error:
+            results[i] = error
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _slow(calls, result):
+    # fetch that takes long enough for every other caller to join its flight
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return fetch
+
+
+def test_concurrent_gets_share_one_fetch():
+    flights = SingleFlight()
+    calls = []
+    result = {'rows': [1, 2]}
+    results = _concurrently(8, lambda: flights.get('key', _slow(calls, result)))
+    assert len(calls) == 1
+    assert all(each is result for each in results)
+
+
+def test_every_waiter_gets_the_leaders_exception_and_it_is_not_cached():
+    flights = SingleFlight()
+    calls = []
+    error = ValueError('upstream failed')
+    results = _concurrently(8, lambda: flights.get('key', _slow(calls, error)))
+    assert len(calls) == 1
+    assert all(each is error for each in results)
+    assert flights.get('key', lambda: 'fresh') == 'fresh'
+
+
+def test_results_expire_after_the_ttl(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(client, 'time', SimpleNamespace(time=lambda: clock[0], sleep=time.sleep))
+    flights = SingleFlight(ttl=30)
+    assert flights.get('key', lambda: 'first') == 'first'
+    clock[0] += 29
+    assert flights.get('key', lambda: 'second') == 'first'
+    clock[0] += 2
+    assert flights.get('key', lambda: 'third') == 'third'
+    # a per call ttl overrides the default
+    assert flights.get('other', lambda: 'once', ttl=5) == 'once'
+    clock[0] += 6
+    assert flights.get('other', lambda: 'again', ttl=5) == 'again'
+
+
+def test_zero_ttl_only_coalesces_requests_in_flight():
+    flights = SingleFlight(ttl=0)
+    calls = []
+    _concurrently(4, lambda: flights.get('key', _slow(calls, 'shared')))
+    assert len(calls) == 1
+    assert flights.get('key', lambda: 'new') == 'new'
+
+
+def test_least_recently_used_results_are_dropped():
+    flights = SingleFlight(maxsize=2)
+    for key in ('a', 'b', 'c'):
+        flights.get(key, lambda: key)
+    assert flights.get('a', lambda: 'refetched') == 'refetched'
+    assert flights.get('c', lambda: 'refetched') == 'c'
+
+
+def test_normalize_query_keeps_string_literals():
+    query = '{\n  indexers(where: {url: "https://a  b/"},  first: 10) {\n    id\n  }\n}'
+    assert normalize_query(query) == '{indexers(where:{url:"https://a  b/"},first:10){id}}'
+    assert normalize_query('{ a(where: {name: "say \\"hi  there\\""}) { id } }') == '{a(where:{name:"say \\"hi  there\\""}){id}}'
+    assert normalize_query(query) == normalize_query(query.replace('\n', ' '))
+
+
+class _Session:
+    # Stub of the pooled session answering posts from a list of (status, body) or exceptions
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.posts = 0
+
+    def post(self, url, json=None, timeout=None):
+        self.posts += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        response = requests.Response()
+        response.status_code, response._content = answer
+        response.url = url
+        return response
+
+
+@pytest.fixture
+def answer(monkeypatch):
+    # Makes the client post to a stub session with the given answers, without sleeping between retries
+    sleeps = []
+    monkeypatch.setattr(client, 'time', SimpleNamespace(time=time.time, sleep=sleeps.append))
+
+    def answer(*answers):
+        stub = _Session(answers)
+        stub.sleeps = sleeps
+        monkeypatch.setattr(client, 'session', lambda: stub)
+        return stub
+    return answer
+
+
+OK = (200, b'{"data": {"indexers": [{"id": "0xa"}]}}')
+
+
+def test_throttling_server_errors_and_timeouts_are_retried(answer):
+    stub = answer((429, b''), (503, b''), requests.Timeout('read timed out'), requests.ConnectionError('reset'), OK)
+    assert client._fetch_graphql('http://oracle', '{indexers{id}}', None, 1, 4) == {'indexers': [{'id': '0xa'}]}
+    assert stub.posts == 5
+    assert len(stub.sleeps) == 4
+
+
+def test_the_last_status_is_raised_once_retries_run_out(answer):
+    stub = answer((502, b''), (502, b''), (504, b''))
+    with pytest.raises(requests.HTTPError) as raised:
+        client._fetch_graphql('http://oracle', '{indexers{id}}', None, 1, 2)
+    assert raised.value.response.status_code == 504
+    assert stub.posts == 3
+
+
+def test_timeouts_are_raised_once_retries_run_out(answer):
+    stub = answer(*[requests.Timeout('read timed out')] * 3)
+    with pytest.raises(requests.Timeout):
+        client._fetch_graphql('http://oracle', '{indexers{id}}', None, 1, 2)
+    assert stub.posts == 3
+
+
+def test_other_http_errors_are_not_retried(answer):
+    stub = answer((400, b'bad request'), OK)
+    with pytest.raises(requests.HTTPError):
+        client._fetch_graphql('http://oracle', '{indexers{id}}', None, 1, 4)
+    assert stub.posts == 1
+
+
+def test_an_errors_body_raises_graphql_error(answer):
+    stub = answer((200, b'{"errors": [{"message": "first: must be at most 1000"}], "data": null}'), OK)
+    with pytest.raises(GraphQLError) as raised:
+        client._fetch_graphql('http://oracle', '{indexers{id}}', None, 1, 4)
+    assert raised.value.url == 'http://oracle'
+    assert 'must be at most 1000' in str(raised.value)
+    assert stub.posts == 1
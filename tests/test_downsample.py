@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from qos_oracle import downsample, lttb_indices, minmax_indices, pie_frame
+
+
+def _series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.arange(n, dtype='float64'), rng.normal(100, 10, n)
+
+
+def test_lttb_keeps_the_ends_and_the_threshold():
+    x, y = _series(10000)
+    keep = lttb_indices(x, y, 500)
+    assert len(keep) <= 500 and keep[0] == 0 and keep[-1] == len(y) - 1
+    assert (np.diff(keep) > 0).all()
+    assert (lttb_indices(x, y[:100], 500) == np.arange(100)).all()
+
+
+def test_lttb_keeps_an_outlier():
+    x, y = _series(10000)
+    y[4321] = 10000
+    assert 4321 in lttb_indices(x, y, 200)
+
+
+def test_minmax_keeps_every_spike():
+    _, y = _series(10000)
+    y[[10, 5000, 9990]] = [1e6, -1e6, 1e6]
+    keep = minmax_indices(y, 100)
+    assert len(keep) <= 100
+    assert {10, 5000, 9990} <= set(keep.tolist())
+
+
+def test_downsample_per_series_and_sorted():
+    x, y = _series(3000)
+    frame = pd.DataFrame({'date': pd.to_datetime(np.tile(x, 2), unit='s'), 'avg_indexer_latency_ms': np.tile(y, 2),
+                          'query_count': np.tile(y, 2), 'indexer_url': np.repeat(['a', 'b'], 3000)})
+    for column in ('avg_indexer_latency_ms', 'query_count'):
+        thinned = downsample(frame, 'date', column, 'indexer_url', points=300)
+        counts = thinned['indexer_url'].value_counts()
+        assert (counts <= 300).all() and set(counts.index) == {'a', 'b'}
+        assert thinned['date'].is_monotonic_increasing
+    small = frame.head(10)
+    assert downsample(small, 'date', 'query_count', 'indexer_url').equals(small)
+
+
+def test_pie_frame_sums_each_slice():
+    frame = pd.DataFrame({'indexer_url': ['a', 'b', 'a'], 'query_count': [1, 2, 3]})
+    assert pie_frame(frame, 'query_count', 'indexer_url').set_index('indexer_url')['query_count'].to_dict() == {'a': 4, 'b': 2}
@@ -0,0 +1,70 @@
+import gzip
+import importlib.util
+import io
+import os
+
+import pandas as pd
+import pytest
+
+from qos_oracle import ExportCache, available_formats, fingerprint, iter_csv, write_export
+from qos_oracle import export
+
+
+def _frame(rows=250):
+    return pd.DataFrame({'indexer_url': ['https://a/', 'https://b/'] * (rows // 2),
+                         'query_count': [float(n) for n in range(rows)]})
+
+
+def test_iter_csv_chunks_add_up_to_to_csv():
+    frame = _frame()
+    chunks = list(iter_csv(frame, chunk_rows=100))
+    assert len(chunks) == 4
+    assert b''.join(chunks) == frame.to_csv().encode('utf-8')
+
+
+@pytest.mark.parametrize('fmt', ['CSV', 'CSV (gzip)'])
+def test_write_export_round_trips(tmp_path, fmt):
+    frame = _frame()
+    path = tmp_path / 'out'
+    write_export(frame, fmt, str(path), chunk_rows=64)
+    data = path.read_bytes()
+    if fmt == 'CSV (gzip)':
+        data = gzip.decompress(data)
+    pd.testing.assert_frame_equal(pd.read_csv(io.BytesIO(data), index_col=0), frame)
+
+
+def test_available_formats_start_with_plain_csv():
+    formats = available_formats()
+    assert formats[:2] == ['CSV', 'CSV (gzip)']
+    assert ('Parquet' in formats) == (importlib.util.find_spec('pyarrow') is not None)
+
+
+def test_fingerprint_follows_the_content():
+    frame = _frame()
+    assert fingerprint(frame) == fingerprint(frame.copy())
+    changed = frame.copy()
+    changed.loc[3, 'query_count'] = -1.0
+    assert fingerprint(changed) != fingerprint(frame)
+
+
+def test_keyed_artifacts_are_built_once_without_hashing_the_frame(tmp_path, monkeypatch):
+    cache = ExportCache(str(tmp_path))
+    frame = _frame()
+    builds = []
+    monkeypatch.setattr(export, 'write_export', lambda df, fmt, path: builds.append(fmt) or open(path, 'wb').close())
+    monkeypatch.setattr(export, 'fingerprint', lambda df: pytest.fail('a keyed export hashed the frame'))
+    key = (('http://oracle', 'indexerDataPoints'), tuple(frame.columns))
+    first = cache.get(frame, 'CSV', key)
+    assert cache.get(frame, 'CSV', key) == first
+    assert cache.get(frame, 'CSV (gzip)', key) != first
+    assert builds == ['CSV', 'CSV (gzip)']
+
+
+def test_least_recently_used_artifacts_are_pruned(tmp_path):
+    cache = ExportCache(str(tmp_path), max_artifacts=2)
+    paths = []
+    for n in range(3):
+        paths.append(cache.get(_frame(), 'CSV', ('version', n)))
+        # older versions were last used longer ago
+        os.utime(paths[-1], (n + 1, n + 1))
+    assert [path.exists() for path in paths] == [False, True, True]
@@ -0,0 +1,80 @@
+import time
+from types import SimpleNamespace
+
+from conftest import NOW
+
+from qos_oracle import DATAPOINT_FIELDS, QOS_ORACLE_URL, keyset_rows, serve_rows
+from qos_oracle import ingest
+from qos_oracle.ingest import ingest_scope, poll
+from qos_oracle.store import INGEST_STALE_SECONDS
+
+ENTITY = 'indexerDataPoints'
+DAY = 86400
+
+
+def _deployment(dataset):
+    return {'subgraph_deployment_ipfs_hash': dataset.busiest_deployment()}
+
+
+def _recording(oracle, queries):
+    def run_query(query):
+        queries.append(query)
+        return oracle.run_query(query)
+    return run_query
+
+
+def test_cold_ingest_then_poll_from_the_stored_newest_epoch(store, oracle, dataset):
+    scope = _deployment(dataset)
+    assert ingest_scope(store, oracle.run_query, QOS_ORACLE_URL, ENTITY, DATAPOINT_FIELDS, scope, DAY, NOW - DAY) > 0
+    cov = store.coverage(QOS_ORACLE_URL, ENTITY, scope)
+    assert NOW - 2 * DAY <= cov['oldest'] <= cov['newest'] <= NOW - DAY + 300
+    assert not cov['exhausted']
+    queries = []
+    written = ingest_scope(store, _recording(oracle, queries), QOS_ORACLE_URL, ENTITY, DATAPOINT_FIELDS, scope, DAY, NOW)
+    # every query of the poll starts at the stored high-water epoch, which it re-reads
+    assert queries and all('end_epoch_gte: ' + str(cov['newest']) in query for query in queries)
+    expected = keyset_rows(oracle.run_query, ENTITY, DATAPOINT_FIELDS, scope, cov['newest'])
+    assert written == len(expected)
+    assert store.coverage(QOS_ORACLE_URL, ENTITY, scope)['newest'] == int(expected['end_epoch'].max())
+    everything = keyset_rows(oracle.run_query, ENTITY, DATAPOINT_FIELDS, scope, cov['oldest'])
+    assert sorted(store.load(QOS_ORACLE_URL, ENTITY, scope)['id']) == sorted(everything['id'])
+
+
+def test_poll_ingests_every_scope_and_marks_it(monkeypatch, store, oracle, dataset):
+    monkeypatch.setattr(ingest, 'runner', lambda url: oracle.run_query)
+    monkeypatch.setattr(ingest, 'time', SimpleNamespace(time=lambda: NOW, sleep=time.sleep))
+    deployment = dataset.busiest_deployment()
+    poll(store, ['qos'], deployments=[deployment], history=DAY)
+    scope = {'subgraph_deployment_ipfs_hash': deployment}
+    assert store.coverage(QOS_ORACLE_URL, ENTITY, scope)['newest'] > NOW - 600
+    # marked as polled at the (fake) time of the poll
+    assert store.ingesting(QOS_ORACLE_URL, ENTITY, scope, max_age=time.time() - NOW + 1)
+    assert not store.ingesting(QOS_ORACLE_URL, ENTITY, scope, max_age=time.time() - NOW - 1)
+
+
+def _ingested(store, oracle, dataset, polled_at):
+    scope = _deployment(dataset)
+    ingest_scope(store, oracle.run_query, QOS_ORACLE_URL, ENTITY, DATAPOINT_FIELDS, scope, DAY, NOW)
+    store.mark_ingested(QOS_ORACLE_URL, ENTITY, scope, polled_at)
+    wallet = store.load(QOS_ORACLE_URL, ENTITY, scope, limit=1)['indexer_wallet'][0]
+    return dict(scope, indexer=wallet)
+
+
+def test_a_live_ingest_serves_narrower_scopes_from_the_store(store, oracle, dataset):
+    narrower = _ingested(store, oracle, dataset, time.time())
+    before = oracle.queries
+
+    def pull_range(lower, upper, limit):
+        raise AssertionError('pulled while the ingest daemon keeps the scope')
+    rows = serve_rows(store, QOS_ORACLE_URL, ENTITY, narrower, pull_range, 200)
+    assert len(rows) == 200 and oracle.queries == before
+    assert set(rows['indexer_wallet']) == {narrower['indexer']}
+    assert set(rows['subgraph_deployment_ipfs_hash']) == {narrower['subgraph_deployment_ipfs_hash']}
+
+
+def test_a_stale_ingest_falls_back_to_pulling(store, oracle, dataset):
+    narrower = _ingested(store, oracle, dataset, time.time() - INGEST_STALE_SECONDS - 1)
+    before = oracle.queries
+    rows = serve_rows(store, QOS_ORACLE_URL, ENTITY, narrower, oracle.pull_range(ENTITY, DATAPOINT_FIELDS, narrower), 200)
+    assert len(rows) == 200 and oracle.queries > before
+    assert store.coverage(QOS_ORACLE_URL, ENTITY, narrower) is not None
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from conftest import NOW
+
+from qos_oracle import DATAPOINT_FIELDS, QOS_ORACLE_URL, Leaderboard, fetch_leaderboard, rank
+
+ENTITY = 'indexerDataPoints'
+SOURCE = 'http://oracle'
+COLUMNS = ['query_count', 'deployments', 'p50_latency_ms', 'p95_latency_ms', 'p99_latency_ms', 'success_rate',
+           'blocks_behind', 'fee_per_query']
+
+
+def _hours(oracle, newest, oldest):
+    # every data point with end_epoch in [NOW - oldest hours, NOW - newest hours)
+    return oracle.pull_range(ENTITY, DATAPOINT_FIELDS, {})(NOW - oldest * 3600, NOW - newest * 3600 + 1, None)
+
+
+def _assert_same(board, store):
+    full = Leaderboard(store, SOURCE, ENTITY, 'h', 7 * 86400).refresh().table(86400)
+    actual = board.table(86400).set_index('indexer_wallet').sort_index()[COLUMNS]
+    expected = full.set_index('indexer_wallet').sort_index()[COLUMNS]
+    pd.testing.assert_frame_equal(actual, expected, check_exact=False, rtol=1e-6)
+
+
+def test_backfilled_hours_reach_a_running_leaderboard(store, oracle):
+    store.upsert(SOURCE, ENTITY, _hours(oracle, 0, 2))
+    board = Leaderboard(store, SOURCE, ENTITY, 'h', 7 * 86400).refresh()
+    before = board.table(86400)['query_count'].sum()
+    # a newest-first cold start keeps writing older hours while the board is up
+    older = _hours(oracle, 2, 24)
+    store.upsert(SOURCE, ENTITY, older)
+    board.refresh()
+    assert board.table(86400)['query_count'].sum() > before
+    _assert_same(board, store)
+
+
+def test_refresh_follows_the_newest_bucket_and_ignores_other_writes(store, oracle):
+    store.upsert(SOURCE, ENTITY, _hours(oracle, 1, 24))
+    board = Leaderboard(store, SOURCE, ENTITY, 'h', 7 * 86400).refresh()
+    version = board.version
+    store.upsert('http://other', ENTITY, _hours(oracle, 0, 1))
+    assert board.refresh().version == version
+    # the newest hour arrives, then one of its epochs is rewritten
+    newest = _hours(oracle, 0, 1)
+    store.upsert(SOURCE, ENTITY, newest)
+    rewritten = newest.take(newest['end_epoch'] == newest['end_epoch'].max())
+    rewritten.data['query_count'] = rewritten['query_count'] * 2
+    store.upsert(SOURCE, ENTITY, rewritten)
+    assert board.refresh().version > version
+    _assert_same(board, store)
+
+
+def test_rank_orders_best_first_with_missing_last():
+    board = pd.DataFrame({'indexer_wallet': ['a', 'b', 'c'], 'p95_latency_ms': [300.0, np.nan, 100.0],
+                          'success_rate': [0.9, 0.99, 0.5]})
+    assert rank(board, 'p95_latency_ms')['indexer_wallet'].tolist() == ['c', 'a', 'b']
+    ranked = rank(board, 'success_rate')
+    assert ranked['indexer_wallet'].tolist() == ['b', 'a', 'c'] and ranked['rank'].tolist() == [1, 2, 3]
+
+
+def test_fetch_leaderboard_is_cached_per_version(store, oracle, offline):
+    assert fetch_leaderboard('24 hours', store=store).empty
+    store.upsert(QOS_ORACLE_URL, ENTITY, _hours(oracle, 0, 24))
+    first = fetch_leaderboard('24 hours', 'p95_latency_ms', store=store)
+    assert first is fetch_leaderboard('24 hours', 'p95_latency_ms', store=store)
+    assert first['rank'].tolist() == list(range(1, len(first) + 1))
@@ -0,0 +1,31 @@
+import pandas as pd
+
+from qos_oracle import IndexerDirectory, SearchIndex
+from qos_oracle.lookup import LabelDictionary
+
+
+def test_search_index_prefix_then_substring_in_given_order():
+    index = SearchIndex(['Uniswap V3', 'Connext Network - Gnosis', 'uniswap v2', 'Sushi Uniswap fork', None])
+    assert index.search('') == ['Uniswap V3', 'Connext Network - Gnosis', 'uniswap v2', 'Sushi Uniswap fork']
+    assert index.search('unis') == ['Uniswap V3', 'uniswap v2', 'Sushi Uniswap fork']
+    assert index.search('gnosis') == ['Connext Network - Gnosis']
+    assert index.search('nothing') == []
+
+
+def test_indexer_directory_from_frame():
+    frame = pd.DataFrame({'indexer_wallet': ['0xb', '0xa', '0xb'], 'indexer_url': ['https://b/', 'https://a/', 'https://b/']})
+    directory = IndexerDirectory.from_frame(frame)
+    assert directory.wallets == ['0xb', '0xa']
+    assert directory.position('0xa') == 1
+    assert directory.label('0xa') == 'https://a/ (0xa)'
+    assert directory.label('0xc') == '0xc'
+
+
+def test_label_column_only_carries_its_own_labels():
+    labels = LabelDictionary()
+    first = labels.encode(pd.Series(['h1', 'h2', None]), {'h1': 'one', 'h2': 'two'}.get)
+    second = labels.encode(pd.Series(['h3', 'h1']), {'h1': 'one', 'h3': 'three'}.get)
+    assert first.tolist()[:2] == ['one', 'two'] and pd.isna(first.iloc[2])
+    assert list(second.cat.categories) == ['one', 'three']
+    # codes are shared across frames, each distinct key looked up once
+    assert labels.labels == ['one', 'two', 'three']
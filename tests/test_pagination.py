@@ -0,0 +1,63 @@
+import math
+
+import numpy as np
+
+from conftest import NOW, FakeOracle, make_dataset
+
+from qos_oracle import DATAPOINT_FIELDS, PAGE_SIZE, build_query, iter_keyset, keyset_rows
+
+ENTITY = 'indexerDataPoints'
+
+
+def _crowded():
+    # 200 indexer and deployment pairs, so every epoch holds two pages worth of rows
+    return FakeOracle(make_dataset(indexers=20, deployments=30, allocations=10, days=0.05))
+
+
+def test_build_query():
+    query = build_query(ENTITY, ['id', 'end_epoch'], {'end_epoch_lt': 5, 'indexer': '0xa'}, 'end_epoch', 'desc', 10)
+    assert 'orderBy: end_epoch, orderDirection: desc' in query
+    assert 'where:{end_epoch_lt: 5, indexer: "0xa"}, first: 10' in query
+
+
+def test_epochs_larger_than_a_page_are_read_whole_and_once():
+    oracle = _crowded()
+    assert len(oracle.dataset.pairs) > PAGE_SIZE
+    rows = keyset_rows(oracle.run_query, ENTITY, DATAPOINT_FIELDS, {})
+    ids = list(rows['id'])
+    assert len(ids) == len(set(ids)) == len(oracle.dataset.pairs) * len(oracle.dataset.ends(300))
+    epochs = rows['end_epoch']
+    assert (epochs[:-1] >= epochs[1:]).all()
+
+
+def test_bounds_are_lower_inclusive_upper_exclusive():
+    oracle = _crowded()
+    ends = oracle.dataset.ends(300)
+    rows = keyset_rows(oracle.run_query, ENTITY, DATAPOINT_FIELDS, {}, ends[1], ends[-1])
+    assert set(rows['end_epoch'].tolist()) == set(ends[1:-1])
+
+
+def test_limit_stops_reading_pages():
+    oracle = _crowded()
+    rows = keyset_rows(oracle.run_query, ENTITY, DATAPOINT_FIELDS, {}, limit=150)
+    assert len(rows) == 150
+    assert oracle.queries <= 3
+
+
+def test_short_page_ends_the_pull(dataset):
+    oracle = FakeOracle(dataset)
+    scope = {'subgraph_deployment_ipfs_hash': dataset.busiest_deployment()}
+    pages = list(iter_keyset(oracle.run_query, ENTITY, DATAPOINT_FIELDS, scope, NOW - 3600))
+    assert sum(len(page) for page in pages) < PAGE_SIZE
+    assert oracle.queries == 1
+
+
+def test_full_pages_cost_one_query_each(dataset):
+    # a few rows per epoch: the rows held back at a page's oldest epoch are read by the next page
+    oracle = FakeOracle(dataset)
+    scope = {'subgraph_deployment_ipfs_hash': dataset.busiest_deployment()}
+    rows = keyset_rows(oracle.run_query, ENTITY, DATAPOINT_FIELDS, scope, limit=5000)
+    ids = list(rows['id'])
+    assert len(ids) == len(set(ids)) == 5000
+    per_epoch = max(np.unique(rows['end_epoch'], return_counts=True)[1])
+    assert oracle.queries <= math.ceil(5000 / (PAGE_SIZE - per_epoch))
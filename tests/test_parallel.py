@@ -0,0 +1,56 @@
+from conftest import NOW, FakeOracle, make_dataset
+
+from qos_oracle import DATAPOINT_FIELDS, epoch_windows, fetch_ordered, pull_history, pull_windowed
+
+ENTITY = 'indexerDataPoints'
+
+
+def _pull_range(dataset):
+    oracle = FakeOracle(dataset)
+    return oracle.pull_range(ENTITY, DATAPOINT_FIELDS, {'subgraph_deployment_ipfs_hash': dataset.busiest_deployment()})
+
+
+def _newest(pull_range, nrows):
+    # The newest nrows rows read serially, one keyset pull
+    return pull_range(None, None, nrows)
+
+
+def test_fetch_ordered_keeps_argument_order():
+    assert fetch_ordered(lambda x: x * 2, range(20), max_workers=4) == [x * 2 for x in range(20)]
+
+
+def test_epoch_windows_are_contiguous_newest_first():
+    windows = epoch_windows(1000, 100, 3)
+    assert windows == [(900, 1000), (800, 900), (700, 800)]
+
+
+def test_pull_windowed_matches_a_serial_pull():
+    dataset = make_dataset()
+    pull_range = _pull_range(dataset)
+    rows = pull_windowed(pull_range, 1500)
+    expected = _newest(pull_range, 1500)
+    assert len(rows) == 1500
+    assert list(rows['id']) == list(expected['id'])
+
+
+def test_pull_windowed_continues_past_a_gap_over_the_planned_windows():
+    # the probe reads the newest two hours and the windows planned below it reach back ~20 hours,
+    # the last of them fall in the gap
+    dataset = make_dataset(gaps=[(NOW - 30 * 3600, NOW - 3 * 3600)])
+    pull_range = _pull_range(dataset)
+    rows, ended = pull_history(pull_range, 1000)
+    assert len(rows) == 1000
+    assert not ended
+    assert list(rows['id']) == list(_newest(pull_range, 1000)['id'])
+
+
+def test_pull_history_ends_only_on_a_short_unbounded_read():
+    dataset = make_dataset(days=0.5)
+    pull_range = _pull_range(dataset)
+    total = len(_newest(pull_range, None))
+    rows, ended = pull_history(pull_range, total + 500)
+    assert len(rows) == total
+    assert ended
+    rows, ended = pull_history(pull_range, total - 10)
+    assert len(rows) == total - 10
+    assert not ended
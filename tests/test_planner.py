@@ -0,0 +1,61 @@
+import pytest
+
+from conftest import NOW
+
+from qos_oracle import (AGGREGATES, DATAPOINT_FIELDS, PAGE_SIZE, QOS_ORACLE_URL, RAW_ENTITY, fetch_buckets, fetch_datapoints,
+                        plan_view)
+from qos_oracle.ingest import ingest_scope
+from qos_oracle.planner import MIN_BUCKETS, Plan
+
+
+def test_rows_for_covers_the_raw_span_and_whole_buckets():
+    daily = Plan('indexerDailyDataPoints', [], 86400, 'dayStart', 'Daily')
+    # 10000 raw rows of one series span ~35 days
+    assert daily.rows_for(10000) == 35
+    # spread over 50 series they only span 200 epochs, less than the buckets a daily view needs
+    assert daily.rows_for(10000, 50, 86400) == (MIN_BUCKETS + 2) * 50
+    raw = Plan(RAW_ENTITY, [], 300, 'end_epoch', '5 Minute')
+    assert raw.rows_for(10000, 7) <= 10000
+    assert raw.rows_for(1000, 2, 604800) == (MIN_BUCKETS + 2) * 2016 * 2
+
+
+def test_plan_view_picks_the_coarsest_tiling_aggregate(offline):
+    url = 'http://oracle'
+    assert plan_view(url, None, DATAPOINT_FIELDS).raw
+    assert plan_view(url, 'h', DATAPOINT_FIELDS).entity == 'indexerHourlyDataPoints'
+    assert plan_view(url, 'D', DATAPOINT_FIELDS).entity == AGGREGATES[0][0]
+    assert plan_view(url, 'W-MON', DATAPOINT_FIELDS).entity == AGGREGATES[0][0]
+    # only raw points have a stdev
+    assert plan_view(url, 'D', DATAPOINT_FIELDS, ['stdev_indexer_latency_ms']).raw
+
+
+@pytest.mark.parametrize('resolution', ['1 day', '1 week'])
+def test_aggregated_views_have_whole_buckets(offline, dataset, store, resolution):
+    deployment = dataset.busiest_deployment()
+    points = fetch_datapoints(deployment=deployment, resolution=resolution, rows=2000, catalog=offline, store=store)
+    assert not points.plan.raw
+    buckets = fetch_buckets(points, resolution, 'indexer_url')
+    assert buckets['date'].nunique() >= MIN_BUCKETS
+
+
+def test_raw_coarse_views_pull_only_the_rows_asked_for(raw_only, oracle, dataset, store):
+    before = oracle.queries
+    points = fetch_datapoints(deployment=dataset.busiest_deployment(), resolution='1 week', rows=1000,
+                              catalog=raw_only, store=store)
+    assert points.plan.raw
+    assert len(points.frame) == 1000
+    assert oracle.queries - before < 2 * 1000 // PAGE_SIZE
+    # a cold store only has the buckets of the rows pulled
+    assert fetch_buckets(points, '1 week', 'indexer_url')['date'].nunique() < MIN_BUCKETS
+
+
+@pytest.mark.parametrize('resolution', ['1 day', '1 week'])
+def test_raw_coarse_views_read_their_buckets_from_the_store(raw_only, oracle, dataset, store, resolution):
+    deployment = dataset.busiest_deployment()
+    scope = {'subgraph_deployment_ipfs_hash': deployment}
+    ingest_scope(store, oracle.run_query, QOS_ORACLE_URL, RAW_ENTITY, DATAPOINT_FIELDS, scope, 30 * 86400, NOW)
+    points = fetch_datapoints(deployment=deployment, resolution=resolution, rows=1000, catalog=raw_only, store=store)
+    assert len(points.frame) == 1000
+    buckets = fetch_buckets(points, resolution, 'indexer_url')
+    assert buckets['date'].nunique() >= MIN_BUCKETS
+    assert buckets['date'].min() < points.frame['date'].min()
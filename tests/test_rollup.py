@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from qos_oracle import BUCKETS, METRICS, choose_bucket, combine, rollup
+from qos_oracle.rollup import component_aggs, components
+
+
+def _points(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        'date': pd.to_datetime(1700000000 + 300 * (np.arange(n) // 2), unit='s'),
+        'indexer_url': np.tile(['a', 'b'], n // 2),
+        'query_count': rng.integers(0, 50, n),
+        'num_indexer_200_responses': rng.integers(0, 50, n),
+        'total_query_fees': rng.uniform(0, 1, n),
+        'max_indexer_latency_ms': rng.uniform(100, 900, n),
+        'avg_indexer_latency_ms': rng.uniform(50, 400, n),
+        'stdev_indexer_latency_ms': rng.uniform(1, 50, n),
+    })
+    frame.loc[5, 'avg_indexer_latency_ms'] = np.nan
+    return frame
+
+
+def test_rollup_matches_a_weighted_groupby():
+    frame = _points()
+    result = rollup(frame, 'h', ['indexer_url'], complete_only=False).set_index(['date', 'indexer_url'])
+    hour = frame['date'].dt.floor('h')
+    grouped = frame.assign(hour=hour).groupby(['hour', 'indexer_url'])
+    assert np.allclose(result['query_count'], grouped['query_count'].sum())
+    assert np.allclose(result['max_indexer_latency_ms'], grouped['max_indexer_latency_ms'].max())
+    present = frame['avg_indexer_latency_ms'].notna()
+    weights = frame['query_count'].where(present, 0)
+    expected = ((frame['avg_indexer_latency_ms'].fillna(0) * weights).groupby([hour, frame['indexer_url']]).sum()
+                / weights.groupby([hour, frame['indexer_url']]).sum())
+    assert np.allclose(result['avg_indexer_latency_ms'], expected, equal_nan=True)
+
+
+def test_complete_only_drops_the_edge_buckets():
+    frame = _points()
+    every = rollup(frame, 'h', complete_only=False)['date']
+    trimmed = rollup(frame, 'h')['date']
+    assert trimmed.tolist() == every.tolist()[1:-1]
+
+
+def test_combine_of_hourly_components_equals_a_daily_rollup():
+    frame = _points(4000)
+    metrics = [metric for metric in METRICS if metric in frame.columns]
+    parts = pd.DataFrame({'date': frame['date'].dt.floor('h'), 'indexer_url': frame['indexer_url'],
+                          **components(frame, metrics)})
+    parts = parts.groupby(['date', 'indexer_url']).agg(component_aggs(metrics)).reset_index()
+    parts['date'] = parts['date'].dt.floor('D')
+    daily = combine(parts, ['indexer_url'], complete_only=False)
+    expected = rollup(frame, 'D', ['indexer_url'], complete_only=False)
+    pd.testing.assert_frame_equal(daily[expected.columns], expected, check_dtype=False)
+
+
+@pytest.mark.parametrize('span, interval', [(3600, '5 minutes'), (30 * 86400, '1 hour'), (2 * 365 * 86400, '1 day')])
+def test_choose_bucket(span, interval):
+    assert choose_bucket(0, span) == interval and interval in BUCKETS
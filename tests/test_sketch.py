@@ -0,0 +1,64 @@
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+from qos_oracle import group_bins, point_bins, quantile_label
+from qos_oracle.sketch import ALPHA, NBINS, merge, pack, quantiles, unpack
+
+
+def _lognormal_quantile(mean, stdev, q):
+    sigma = math.sqrt(math.log1p((stdev / mean) ** 2))
+    return math.exp(math.log(mean) - sigma ** 2 / 2 + sigma * NormalDist().inv_cdf(q))
+
+
+def test_point_bins_hold_every_query():
+    bins = point_bins(np.array([10.0, 0.0, 5.0]), np.array([100.0, 50.0, np.nan]), np.array([20.0, 1.0, 1.0]))
+    assert bins.shape == (3, NBINS)
+    assert np.allclose(bins.sum(axis=1), [10.0, 0.0, 0.0])
+
+
+def test_quantiles_within_the_sketch_accuracy():
+    count, mean, stdev = np.array([1e6]), np.array([200.0]), np.array([120.0])
+    result = quantiles(point_bins(count, mean, stdev), (0.5, 0.9, 0.99))
+    for q, values in result.items():
+        assert abs(values[0] / _lognormal_quantile(200.0, 120.0, q) - 1) <= ALPHA
+
+
+def test_quantiles_are_capped_at_the_max_and_nan_when_empty():
+    bins = point_bins(np.array([100.0, 0.0]), np.array([100.0, 100.0]), None, np.array([150.0, np.nan]))
+    result = quantiles(bins, (0.99,), np.array([150.0, np.nan]))
+    assert result[0.99][0] <= 150.0
+    assert np.isnan(result[0.99][1])
+
+
+def test_sigma_from_the_max_matches_per_count():
+    # daily points have no stdev, the spread comes from the max; equal counts give equal sketches
+    count = np.array([50.0, 5000.0, 50.0, 0.0])
+    mean = np.full(4, 100.0)
+    peak = np.full(4, 400.0)
+    bins = point_bins(count, mean, None, peak)
+    assert np.allclose(bins[0], bins[2])
+    # more queries reaching the same max means a narrower spread, so a lower p99
+    p99 = quantiles(bins, (0.99,), peak)[0.99]
+    assert p99[1] < p99[0]
+
+
+def test_merged_sketches_equal_one_group_and_survive_storage():
+    rng = np.random.default_rng(0)
+    count = rng.integers(1, 100, 500).astype('float64')
+    mean = rng.uniform(20, 400, 500)
+    stdev = mean * rng.uniform(0.1, 0.5, 500)
+    codes = rng.integers(0, 7, 500)
+    grouped = group_bins(codes, 7, count, mean, stdev)
+    assert np.allclose(grouped, merge(codes, 7, point_bins(count, mean, stdev)))
+    assert np.allclose(grouped.sum(axis=1), np.bincount(codes, count, 7))
+    packed = pack(grouped)
+    restored = unpack([lo for lo, _ in packed], [blob for _, blob in packed])
+    for q in (0.5, 0.99):
+        assert np.allclose(quantiles(restored, (q,))[q], quantiles(grouped, (q,))[q], rtol=0.01)
+
+
+def test_quantile_label():
+    assert quantile_label(0.5) == 'p50_latency_ms'
+    assert quantile_label(0.999) == 'p99.9_latency_ms'
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+from conftest import NOW, FakeOracle, make_dataset
+
+from qos_oracle import DATAPOINT_FIELDS, Columns, Store, bucket_starts, pull_incremental
+from qos_oracle.sketch import unpack
+from qos_oracle.store import SKETCH_KEYS
+
+ENTITY = 'indexerDataPoints'
+SOURCE = 'http://oracle'
+
+
+def _scope(dataset):
+    return {'subgraph_deployment_ipfs_hash': dataset.busiest_deployment()}
+
+
+def _serve(store, oracle, scope, nrows):
+    return pull_incremental(store, SOURCE, ENTITY, scope, oracle.pull_range(ENTITY, DATAPOINT_FIELDS, scope), nrows)
+
+
+def test_upsert_and_load_round_trip(store, oracle, dataset):
+    scope = _scope(dataset)
+    rows = oracle.pull_range(ENTITY, DATAPOINT_FIELDS, scope)(None, None, 250)
+    store.upsert(SOURCE, ENTITY, rows)
+    store.upsert(SOURCE, ENTITY, rows)
+    loaded = store.load(SOURCE, ENTITY, scope)
+    assert list(loaded['id']) == list(rows['id'])
+    assert loaded['query_count'].sum() == rows['query_count'].sum()
+    assert store.count(SOURCE, ENTITY, scope) == 250
+
+
+def test_cold_start_over_a_gap_is_not_exhausted_and_backfills(store):
+    dataset = make_dataset(gaps=[(NOW - 30 * 3600, NOW - 3 * 3600)])
+    oracle = FakeOracle(dataset)
+    scope = _scope(dataset)
+    expected = oracle.pull_range(ENTITY, DATAPOINT_FIELDS, scope)(None, None, 2000)
+    rows = _serve(store, oracle, scope, 1000)
+    assert list(rows['id']) == list(expected['id'][:1000])
+    assert not store.coverage(SOURCE, ENTITY, scope)['exhausted']
+    # a larger pull later reads the older rows instead of stopping at the gap
+    rows = _serve(store, oracle, scope, 2000)
+    assert list(rows['id']) == list(expected['id'])
+
+
+def test_history_end_marks_the_scope_exhausted(store):
+    dataset = make_dataset(days=0.5)
+    oracle = FakeOracle(dataset)
+    scope = _scope(dataset)
+    total = len(oracle.pull_range(ENTITY, DATAPOINT_FIELDS, scope)(None, None, None))
+    assert len(_serve(store, oracle, scope, total + 100)) == total
+    assert store.coverage(SOURCE, ENTITY, scope)['exhausted']
+    # nothing older to ask for: served from the store without a query
+    queries = oracle.queries
+    assert len(_serve(store, oracle, scope, total + 200)) == total
+    assert oracle.queries == queries
+
+
+def test_empty_scope_is_not_stored(store, oracle):
+    rows = _serve(store, oracle, {'subgraph_deployment_ipfs_hash': 'QmNothing'}, 100)
+    assert isinstance(rows, Columns) and not len(rows)
+    assert store.coverage(SOURCE, ENTITY, {'subgraph_deployment_ipfs_hash': 'QmNothing'}) is None
+
+
+def _rollup_frame(store, freq, scope):
+    parts = pd.DataFrame(store.rollup_rows(SOURCE, ENTITY, freq, scope).data)
+    return parts.sort_values(['indexer_wallet', 'subgraph_deployment_ipfs_hash', 'bucket'], ignore_index=True)
+
+
+def _week_of_rows(oracle, dataset):
+    scope = _scope(dataset)
+    return scope, oracle.pull_range(ENTITY, DATAPOINT_FIELDS, scope)(NOW - 9 * 86400, None, None)
+
+
+def test_rollups_built_page_by_page_match_a_full_build(tmp_path, oracle, dataset):
+    scope, rows = _week_of_rows(oracle, dataset)
+    whole = Store(str(tmp_path / 'whole.sqlite'))
+    whole.upsert(SOURCE, ENTITY, rows)
+    paged = Store(str(tmp_path / 'paged.sqlite'))
+    # pages arrive newest first, one epoch is written twice and a page is replaced
+    for start in range(0, len(rows), 300):
+        paged.upsert(SOURCE, ENTITY, rows.take(slice(start, start + 300)))
+    paged.upsert(SOURCE, ENTITY, rows.take(slice(0, 300)))
+    for freq in ('h', 'D', 'W-MON'):
+        expected = _rollup_frame(whole, freq, scope)
+        actual = _rollup_frame(paged, freq, scope)
+        pd.testing.assert_frame_equal(actual, expected, check_exact=False, rtol=1e-9)
+
+
+def test_rollups_add_up_to_the_raw_points(store, oracle, dataset):
+    scope, rows = _week_of_rows(oracle, dataset)
+    for start in range(0, len(rows), 500):
+        store.upsert(SOURCE, ENTITY, rows.take(slice(start, start + 500)))
+    raw = pd.DataFrame({'end_epoch': rows['end_epoch'], 'wallet': rows['indexer_wallet'],
+                        'queries': rows['query_count'], 'peak': rows['max_indexer_latency_ms']})
+    for freq in ('h', 'D', 'W-MON'):
+        raw['bucket'] = bucket_starts(raw['end_epoch'], freq)
+        expected = raw.groupby(['wallet', 'bucket']).agg(queries=('queries', 'sum'), peak=('peak', 'max'))
+        parts = _rollup_frame(store, freq, scope).groupby(['indexer_wallet', 'bucket']).agg(
+            queries=('query_count', 'sum'), peak=('max_indexer_latency_ms', 'max'))
+        assert parts['queries'].to_numpy().tolist() == expected['queries'].to_numpy().tolist()
+        assert np.allclose(parts['peak'].to_numpy(), expected['peak'].to_numpy())
+
+
+def _sketch_map(store, freq, scope):
+    parts = store.sketch_rows(SOURCE, ENTITY, freq, scope)
+    keys = zip(*(parts[name].tolist() for name in SKETCH_KEYS + ('bucket',)))
+    return dict(zip(keys, zip(parts['queries'].tolist(), unpack(parts['lo'], parts['bins']))))
+
+
+def test_sketches_built_page_by_page_match_a_full_build(tmp_path, oracle, dataset):
+    scope, rows = _week_of_rows(oracle, dataset)
+    whole = Store(str(tmp_path / 'whole.sqlite'))
+    whole.upsert(SOURCE, ENTITY, rows)
+    paged = Store(str(tmp_path / 'paged.sqlite'))
+    for start in range(0, len(rows), 300):
+        paged.upsert(SOURCE, ENTITY, rows.take(slice(start, start + 300)))
+    for freq in ('h', 'D'):
+        expected = _sketch_map(whole, freq, scope)
+        actual = _sketch_map(paged, freq, scope)
+        assert expected and actual.keys() == expected.keys()
+        for key, (queries, bins) in expected.items():
+            assert np.isclose(actual[key][0], queries)
+            assert np.allclose(actual[key][1], bins)
+
+
+def test_rollup_upsert_cost_does_not_grow_with_the_week(store, oracle, dataset):
+    # a late epoch only rebuilds its own hour, day and week from the finer buckets
+    scope, rows = _week_of_rows(oracle, dataset)
+    store.upsert(SOURCE, ENTITY, rows)
+    newest = rows.take(rows['end_epoch'] == rows['end_epoch'].max())
+    statements = []
+    store._conn.set_trace_callback(statements.append)
+    store.upsert(SOURCE, ENTITY, newest)
+    store._conn.set_trace_callback(None)
+    inserts = [sql for sql in statements if sql.startswith('INSERT INTO "indexerDataPoints_rollup_')]
+    assert len(inserts) == 3
+    assert 'FROM "indexerDataPoints_rollup_D"' in inserts[-1]
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from qos_oracle import filter_rows, page_count, table_page, table_rows
+from qos_oracle.lookup import LabelDictionary
+
+
+def _frame():
+    # labels are first seen as 'zeta', then 'alpha'
+    labels = LabelDictionary()
+    subgraph = labels.encode(pd.Series(['h1', 'h2', 'h2', 'h3']), {'h1': 'zeta', 'h2': 'alpha', 'h3': 'Mid'}.get)
+    return pd.DataFrame({'subgraph': subgraph, 'indexer_url': ['https://b/', 'https://a/', None, 'https://c/'],
+                         'query_count': [3.0, np.nan, 1.0, 2.0]})
+
+
+def test_categorical_columns_sort_on_their_values():
+    frame = _frame()
+    assert frame['subgraph'].iloc[table_rows(frame, sort_by='subgraph')].tolist() == ['Mid', 'alpha', 'alpha', 'zeta']
+    assert frame['subgraph'].iloc[table_rows(frame, sort_by='subgraph', ascending=False)].tolist()[0] == 'zeta'
+
+
+def test_sort_keeps_missing_values_last():
+    frame = _frame()
+    assert table_rows(frame, sort_by='query_count').tolist() == [2, 3, 0, 1]
+    assert table_rows(frame, sort_by='query_count', ascending=False).tolist() == [0, 3, 2, 1]
+
+
+def test_filter_matches_text_and_category_values():
+    frame = _frame()
+    assert filter_rows(frame, ' ALPHA ').tolist() == [False, True, True, False]
+    assert filter_rows(frame, 'https://c').tolist() == [False, False, False, True]
+    assert filter_rows(frame, '').all()
+    assert table_rows(frame, 'alpha', 'query_count').tolist() == [2, 1]
+
+
+def test_pages_are_numbered_by_their_row_in_the_table():
+    frame = pd.DataFrame({'value': range(250)})
+    positions = table_rows(frame, sort_by='value', ascending=False)
+    assert page_count(len(positions)) == 3 and page_count(0) == 1
+    page = table_page(frame, positions, 3)
+    assert page.index.tolist() == list(range(201, 251))
+    assert page['value'].tolist() == list(range(49, -1, -1))
+
+
+def test_orders_are_cached_per_key():
+    frame = _frame()
+    first = table_rows(frame, 'a', 'subgraph', key=('table', 1))
+    # same key: the cached order, even for a different frame
+    assert table_rows(frame.iloc[:1], ' A', 'subgraph', key=('table', 1)) is first